@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+"""Peak memory of helilab.plot per log, with and without --low-memory.
+
+- Uses the synthetic "ans" logs from bench_plot.py (generated into bench/data/ on first use).
+- Renders each log from scratch (--force --no-cache --profile) in a fresh interpreter,
+  once as is and once with --low-memory, and reads the process peak RSS that
+  --profile records after each stage: "loaded" is the peak once the states are
+  cropped and ready to plot, "total" the peak after the figure is saved.
+- RSS is reported relative to the raw state data (7 x N x 8 bytes) as well.
+- --cache renders with an empty parsed-log cache instead of --no-cache (a cold run
+  that also stores the entry), then once more from the stored entry (the warm run).
+
+Examples (PowerShell):
+  python bench\\bench_memory.py                            # 10min and 1h, every format
+  python bench\\bench_memory.py --sizes 1h --formats v4,v5c --decimate none
+  python bench\\bench_memory.py --sizes 1h --cache
+"""
+from __future__ import annotations
+
+from pathlib import Path
+import argparse
+import json
+import logging
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+from typing import Optional
+
+BENCH_DIR = Path(__file__).parent.resolve()
+REPO_DIR = BENCH_DIR.parent
+sys.path.insert(0, str(BENCH_DIR))
+
+from bench_plot import FORMATS, T, parse_duration  # noqa: E402
+
+MODES = {"default": [], "low-memory": ["--low-memory"]}
+
+
+def link_or_copy(src: Path, dst: Path) -> None:
+    try:
+        os.symlink(src, dst)
+    except OSError:  # no symlink privilege on Windows
+        shutil.copy2(src, dst)
+
+
+def generate_log(fmt: str, seconds: float) -> Optional[Path]:
+    """make_log() in a child process.
+
+    On Linux a child's peak RSS starts at its parent's, so generating the logs
+    here would inflate every measurement that follows.
+    """
+    code = f"from bench_plot import make_log; print(make_log('ans', {fmt!r}, {seconds!r}) or '')"
+    out = subprocess.run([sys.executable, "-c", code], check=True, cwd=BENCH_DIR, stdout=subprocess.PIPE, text=True)
+    path = out.stdout.strip()
+    return Path(path) if path else None
+
+
+def _stage_peaks(records: list) -> dict:
+    by_stage = {r["stage"]: r["process_peak_rss_mb"] for r in records}
+    return {"loaded": by_stage.get("crop"), "total": max(r["process_peak_rss_mb"] or 0.0 for r in records)}
+
+
+def peak_rss(log: Path, extra: list, decimate: str, cache: bool = False) -> dict:
+    """Run the CLI on `log` alone; return {"loaded": MB, "total": MB} from its profile.
+
+    With cache, the run starts from an empty cache and a second run reads the
+    stored entry; its peaks are returned as "warm_loaded" and "warm_total".
+    """
+    with tempfile.TemporaryDirectory() as tmp:
+        work = Path(tmp)
+        link_or_copy(log, work / log.name)
+        cmd = [sys.executable, "-m", "helilab.plot", str(work), "--force", "--profile",
+               "--prefetch", "0", "--decimate", decimate] + extra + ([] if cache else ["--no-cache"])
+        result = {}
+        for run in ("", "warm_") if cache else ("",):
+            profile = work / "plot_profile.jsonl"
+            profile.unlink(missing_ok=True)
+            subprocess.run(cmd, check=True, cwd=work, env={**os.environ, "PYTHONPATH": str(REPO_DIR)},
+                           stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            records = [json.loads(line) for line in profile.read_text().splitlines()]
+            result.update({run + key: mb for key, mb in _stage_peaks(records).items()})
+    return result
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Measure helilab.plot peak RSS with and without --low-memory.")
+    parser.add_argument("--sizes", default="10min,1h", help="Comma-separated log durations (default 10min,1h)")
+    parser.add_argument("--formats", default=",".join(FORMATS), help=f"Subset of {','.join(FORMATS)}")
+    parser.add_argument("--decimate", default="minmax", help="--decimate passed to the CLI (default minmax)")
+    parser.add_argument("--cache", action="store_true",
+                        help="Use an empty parsed-log cache instead of --no-cache; also report the warm run")
+    parser.add_argument("--out", type=Path, default=None, help="Write the results as JSON")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(levelname)s: %(message)s")
+    results = []
+    for size in args.sizes.split(","):
+        seconds = parse_duration(size)
+        for fmt in args.formats.split(","):
+            log = generate_log(fmt, seconds)
+            if log is None:
+                logging.info("Skipping %s at %s (too large for the format)", fmt, size)
+                continue
+            row = {"log": log.name, "data_mb": 7 * 8 * int(round(seconds / T)) / 2**20}
+            for mode, extra in MODES.items():
+                row[mode] = peak_rss(log, extra, args.decimate, args.cache)
+            results.append(row)
+
+    print(f"{'log':<22} {'data MB':>8}  {'loaded MB':>19}  {'total MB':>19}")
+    print(f"{'':<22} {'':>8}  {'default':>9} {'low-mem':>9}  {'default':>9} {'low-mem':>9}")
+    for r in results:
+        d, lm = r["default"], r["low-memory"]
+        print(f"{r['log']:<22} {r['data_mb']:>8.1f}  {d['loaded']:>9.1f} {lm['loaded']:>9.1f}"
+              f"  {d['total']:>9.1f} {lm['total']:>9.1f}")
+    if args.cache:
+        print("\nwarm runs (read from the cache)")
+        for r in results:
+            d, lm = r["default"], r["low-memory"]
+            print(f"{r['log']:<22} {r['data_mb']:>8.1f}  {d['warm_loaded']:>9.1f} {lm['warm_loaded']:>9.1f}"
+                  f"  {d['warm_total']:>9.1f} {lm['warm_total']:>9.1f}")
+    if args.out is not None:
+        args.out.write_text(json.dumps({"decimate": args.decimate, "cache": args.cache, "results": results}, indent=1))
+
+
+if __name__ == "__main__":
+    main()
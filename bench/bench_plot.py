@@ -0,0 +1,266 @@
+#!/usr/bin/env python3
+"""Reproducible benchmark for helilab.plot on synthetic Simulink-layout logs.
+
+- Generates 500 Hz logs (T = 0.002) of the requested durations in two layouts:
+    ans   (7, N) "To File" matrix: time row + six states
+    tvec  "To Workspace" style: time vector t (N,) plus states X (N, 6)
+  and in the formats v4, v5c (compressed), v5u (uncompressed) and v73 (HDF5).
+  Files are cached in bench/data/ keyed by layout, format and duration.
+- Times each pipeline stage separately: load (header probe + read), detect,
+  crop (20 s searchsorted slice), window (windowed read of the same 20 s), decimate
+  (minmax and lttb on every state), pyramid_build (min/max pyramid index),
+  pyramid_full / pyramid_window (every state of the whole log / the 20 s window
+  served from the index) and render (plot_states with minmax).
+- Each stage runs --repeat times; the minimum and median are stored as JSON.
+- --save-baseline writes bench/baseline.json; --compare checks a run against it
+  and exits non-zero if any stage got slower than --threshold.
+- Timings only compare on one machine, so no baseline is committed. Before the
+  first --compare, record one on the machine that will run the comparison, with
+  the same --sizes/--formats/--layouts (cases missing from the baseline are
+  skipped): python bench\\bench_plot.py --save-baseline
+
+Examples (PowerShell):
+  python bench\\bench_plot.py                              # 30s,10min,1h in all formats
+  python bench\\bench_plot.py --save-baseline
+  python bench\\bench_plot.py --compare                    # compare with bench\\baseline.json
+  python bench\\bench_plot.py --sizes 1h,24h --formats v73 --layouts ans
+"""
+from __future__ import annotations
+
+from pathlib import Path
+import argparse
+import json
+import logging
+import platform
+import statistics
+import struct
+import sys
+import tempfile
+import time
+from typing import Callable, Iterator, Optional
+
+import numpy as np
+
+BENCH_DIR = Path(__file__).parent.resolve()
+REPO_DIR = BENCH_DIR.parent
+DATA_DIR = BENCH_DIR / "data"
+BASELINE = BENCH_DIR / "baseline.json"
+sys.path.insert(0, str(REPO_DIR))
+
+from helilab import plot as hp  # noqa: E402
+from helilab.pyramid import MinMaxPyramid  # noqa: E402
+
+T = 0.002  # sample time from init_heli_3_10.m
+FORMATS = ("v4", "v5c", "v5u", "v73")
+LAYOUTS = ("ans", "tvec")
+V5_MAX_BYTES = 2**31 - 1  # v5 cannot store a variable larger than 2 GB
+BLOCK = 1 << 20  # samples generated per block
+NOISE_FLOOR = 1e-3  # slowdowns smaller than 1 ms are timer noise, not regressions
+
+
+def parse_duration(spec: str) -> float:
+    """'30s', '10min', '1h' -> seconds."""
+    spec = spec.strip().lower()
+    for suffix, scale in (("min", 60.0), ("h", 3600.0), ("s", 1.0)):
+        if spec.endswith(suffix):
+            return float(spec[:-len(suffix)]) * scale
+    return float(spec)
+
+
+def synthetic_blocks(n: int, seed: int = 0) -> Iterator[np.ndarray]:
+    """Yield (7, k) blocks of [t; states] with steps, overshoot and sensor noise."""
+    rng = np.random.default_rng(seed)
+    for i0 in range(0, n, BLOCK):
+        i1 = min(i0 + BLOCK, n)
+        t = np.arange(i0, i1) * T
+        ref = 0.3 * np.sign(np.sin(2 * np.pi * t / 20.0))  # +-0.3 rad steps every 10 s
+        ts = np.mod(t, 10.0)
+        resp = ref * (1 - np.exp(-1.5 * ts) * (np.cos(4 * ts) + 0.4 * np.sin(4 * ts)))
+        block = np.empty((7, i1 - i0))
+        block[0] = t
+        block[1] = 0.1 * t % (2 * np.pi) - np.pi          # travel
+        block[2] = 0.1 + 0.01 * rng.standard_normal(t.size)
+        block[3] = resp + 0.005 * rng.standard_normal(t.size)   # pitch
+        block[4] = np.gradient(resp, T) + 0.05 * rng.standard_normal(t.size)
+        block[5] = 0.5 * resp + 0.005 * rng.standard_normal(t.size)  # elevation
+        block[6] = 0.5 * np.gradient(resp, T) + 0.05 * rng.standard_normal(t.size)
+        yield block
+
+
+def _write_v4(f, name: str, rows: int, cols: int, chunks: Iterator[np.ndarray]) -> None:
+    """Append one real double matrix; `chunks` yield its data in column-major order."""
+    f.write(struct.pack("<5i", 0, rows, cols, 0, len(name) + 1) + name.encode() + b"\0")
+    for chunk in chunks:
+        f.write(np.ascontiguousarray(chunk, dtype="<f8").tobytes())
+
+
+def _write_v73(path: Path, variables: dict, n: int) -> None:
+    import h5py
+
+    with h5py.File(path, "w", userblock_size=512) as h5:
+        for name, (rows, fill) in variables.items():
+            # MATLAB (rows, n) is stored transposed as (n, rows)
+            ds = h5.create_dataset(name, shape=(n, rows), dtype="f8", chunks=(min(n, 65536), rows),
+                                   compression="gzip", compression_opts=1)
+            ds.attrs["MATLAB_class"] = np.bytes_("double")
+            i0 = 0
+            for block in fill():
+                ds[i0:i0 + block.shape[1], :] = block.T
+                i0 += block.shape[1]
+    head = b"MATLAB 7.3 MAT-file, Platform: bench, Created by bench_plot.py HDF5 schema 1.00 .".ljust(116)
+    head += b"\0" * 8 + struct.pack("<H", 0x0200) + b"IM"
+    with open(path, "r+b") as f:
+        f.write(head.ljust(512, b"\0"))
+
+
+def make_log(layout: str, fmt: str, seconds: float) -> Optional[Path]:
+    """Create (or reuse) one synthetic log; None if the format cannot hold it."""
+    n = int(round(seconds / T))
+    path = DATA_DIR / f"{layout}_{fmt}_{int(seconds)}s.mat"
+    if path.exists():
+        return path
+    if fmt in ("v5c", "v5u") and 7 * n * 8 > V5_MAX_BYTES:
+        return None
+    DATA_DIR.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(".tmp")
+    logging.info("Generating %s (%d samples)", path.name, n)
+    if fmt == "v4":
+        with open(tmp, "wb") as f:
+            if layout == "ans":
+                _write_v4(f, "ans", 7, n, (b.T for b in synthetic_blocks(n)))
+            else:
+                _write_v4(f, "t", n, 1, (b[0] for b in synthetic_blocks(n)))
+                # (N, 6) column-major: one full pass over the samples per state
+                _write_v4(f, "X", n, 6, (b[row] for row in range(1, 7) for b in synthetic_blocks(n)))
+    elif fmt == "v73":
+        if layout == "ans":
+            _write_v73(tmp, {"ans": (7, lambda: synthetic_blocks(n))}, n)
+        else:
+            _write_v73(tmp, {"t": (1, lambda: (b[:1] for b in synthetic_blocks(n))),
+                             "X": (6, lambda: (b[1:] for b in synthetic_blocks(n)))}, n)
+    else:
+        from scipy.io import savemat
+
+        A = np.concatenate(list(synthetic_blocks(n)), axis=1)
+        variables = {"ans": A} if layout == "ans" else {"t": A[0], "X": A[1:].T}
+        savemat(tmp, variables, do_compression=(fmt == "v5c"))
+    tmp.replace(path)
+    return path
+
+
+def timed(fn: Callable[[], object], repeat: int) -> tuple[dict, object]:
+    """Run fn `repeat` times; return ({"min", "median"} seconds, last result)."""
+    times = []
+    result = None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        result = fn()
+        times.append(time.perf_counter() - t0)
+    return {"min": min(times), "median": statistics.median(times)}, result
+
+
+def bench_one(profile: dict, path: Path, repeat: int, out_dir: Path) -> dict:
+    stages = {}
+    stages["load"], data = timed(lambda: hp.load_candidates(path), repeat)
+    stages["detect"], (t, Y, labels, suffix) = timed(lambda: hp.detect_layout(data, path.name, profile["labels"]), repeat)
+    if t is None:
+        raise RuntimeError(f"layout not detected in {path.name}")
+    mid = 0.5 * (t[0] + t[-1])
+    tmin, tmax = mid - 10.0, mid + 10.0
+    stages["crop"], _ = timed(lambda: hp.crop_time(t, Y, tmin, tmax), repeat)
+    if path.name.startswith("ans_"):
+        stages["window"], _ = timed(lambda: hp.read_ans_window(path, tmin, tmax), repeat)
+    width_px = 1200
+    for method in ("minmax", "lttb"):
+        stages[f"decimate_{method}"], _ = timed(
+            lambda: [hp.decimate_trace(t, Y[i], method, width_px) for i in range(Y.shape[0])], repeat)
+    stages["pyramid_build"], pyramid = timed(lambda: MinMaxPyramid.build(Y), repeat)
+    for stage, lo, hi in (("pyramid_full", None, None), ("pyramid_window", tmin, tmax)):
+        stages[stage], _ = timed(lambda: [pyramid.window(t, Y, lo, hi).trace(i, width_px)
+                                          for i in range(Y.shape[0])], repeat)
+    out_file = out_dir / f"{path.stem}.png"
+    stages["render"], _ = timed(lambda: hp.plot_states(t, Y, range(Y.shape[0]), labels, out_file,
+                                                       tuple(profile["figsize"]), 150, decimate="minmax",
+                                                       profile=profile), repeat)
+    return stages
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> bool:
+    """Print per-stage ratios against the baseline; return True if nothing regressed."""
+    ok = True
+    print(f"{'case':<24} {'stage':<16} {'base ms':>10} {'now ms':>10} {'ratio':>7}")
+    for case, stages in results.items():
+        for stage, now in stages.items():
+            base = baseline.get(case, {}).get(stage)
+            if base is None:
+                continue
+            ratio = now["min"] / base["min"] if base["min"] > 0 else float("inf")
+            slower = now["min"] - base["min"] > NOISE_FLOOR
+            flag = "  REGRESSION" if ratio > threshold and slower else ""
+            ok &= not flag
+            print(f"{case:<24} {stage:<16} {1e3 * base['min']:>10.2f} {1e3 * now['min']:>10.2f} {ratio:>7.2f}{flag}")
+    return ok
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark plot.py stages on synthetic 500 Hz logs.")
+    parser.add_argument("--sizes", default="30s,10min,1h", help="Log durations, e.g. 30s,10min,1h,24h")
+    parser.add_argument("--formats", default=",".join(FORMATS), help=f"Subset of {','.join(FORMATS)}")
+    parser.add_argument("--layouts", default=",".join(LAYOUTS), help=f"Subset of {','.join(LAYOUTS)}")
+    parser.add_argument("--lab", default="lab2", help="Lab folder whose helilab.json profile to use (default lab2)")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per stage; min and median are kept (default 3)")
+    parser.add_argument("--out", type=Path, default=None, help="Write this run's results as JSON")
+    parser.add_argument("--save-baseline", action="store_true", help="Store this run as bench/baseline.json")
+    parser.add_argument("--compare", nargs="?", type=Path, const=BASELINE, default=None,
+                        help="Compare with a baseline JSON (default bench/baseline.json)")
+    parser.add_argument("--threshold", type=float, default=1.25,
+                        help="Slowdown ratio reported as a regression (default 1.25)")
+    args = parser.parse_args()
+    if args.compare is not None and not args.compare.exists():
+        # Checked before the run, which takes minutes
+        raise SystemExit(f"No baseline at {args.compare}; record one first with: "
+                         f"python bench/bench_plot.py --save-baseline")
+
+    logging.basicConfig(level=logging.INFO, format="%(levelname)s: %(message)s")
+    profile = hp.load_profile(REPO_DIR / args.lab)
+    formats = [f for f in args.formats.split(",") if f]
+    layouts = [lay for lay in args.layouts.split(",") if lay]
+
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for spec in args.sizes.split(","):
+            seconds = parse_duration(spec)
+            for layout in layouts:
+                for fmt in formats:
+                    case = f"{layout}/{fmt}/{spec.strip()}"
+                    try:
+                        path = make_log(layout, fmt, seconds)
+                    except ImportError as e:
+                        logging.warning("Skipping %s (%s)", case, e)
+                        continue
+                    if path is None:
+                        logging.info("Skipping %s (too large for %s)", case, fmt)
+                        continue
+                    results[case] = bench_one(profile, path, args.repeat, Path(tmp))
+                    logging.info("%s: %s", case, ", ".join(
+                        f"{stage} {1e3 * v['min']:.1f} ms" for stage, v in results[case].items()))
+
+    doc = {"meta": {"date": time.strftime("%Y-%m-%dT%H:%M:%S"), "lab": args.lab, "repeat": args.repeat,
+                    "python": sys.version.split()[0], "numpy": np.__version__,
+                    "platform": platform.platform(), "machine": platform.machine()},
+           "results": results}
+    if args.out is not None:
+        args.out.write_text(json.dumps(doc, indent=1))
+    if args.save_baseline:
+        BASELINE.write_text(json.dumps(doc, indent=1))
+        logging.info("Saved baseline to %s", BASELINE)
+    if args.compare is not None:
+        baseline = json.loads(args.compare.read_text())
+        if baseline.get("meta", {}).get("platform") != doc["meta"]["platform"]:
+            logging.warning("Baseline was recorded on %s", baseline.get("meta", {}).get("platform"))
+        if not compare(results, baseline["results"], args.threshold):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
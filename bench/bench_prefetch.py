@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""Wall-clock of helilab.plot with and without the prefetching reader thread.
+
+- Copies the lab's helilab.json and .mat logs to a temporary folder (so the
+  tracked figures stay untouched) and plots it there with --force --jobs 1.
+- Each --prefetch depth runs --repeat times; the minimum and median are printed
+  together with the speed-up over --prefetch 0 (strictly alternating load/render).
+- --cached runs against a warm .plotcache instead of parsing every log again.
+
+Examples (PowerShell):
+  python bench\\bench_prefetch.py                         # lab3, depths 0,1,2,4
+  python bench\\bench_prefetch.py --lab lab2 --depths 0,2 --repeat 5
+  python bench\\bench_prefetch.py --cached
+"""
+from __future__ import annotations
+
+from pathlib import Path
+import argparse
+import logging
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+REPO_DIR = Path(__file__).parent.parent.resolve()
+
+
+def run_once(work: Path, depth: int, cached: bool) -> float:
+    cmd = [sys.executable, "-m", "helilab.plot", str(work), "--force", "--jobs", "1", "--prefetch", str(depth)]
+    if not cached:
+        cmd.append("--no-cache")
+    t0 = time.perf_counter()
+    subprocess.run(cmd, check=True, cwd=REPO_DIR, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    return time.perf_counter() - t0
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark plot.py --prefetch on a lab folder.")
+    parser.add_argument("--lab", default="lab3", help="Lab folder to benchmark (default lab3)")
+    parser.add_argument("--depths", default="0,1,2,4", help="Comma-separated --prefetch values (default 0,1,2,4)")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per depth (default 3)")
+    parser.add_argument("--cached", action="store_true", help="Warm the parsed-log cache first and use it")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(levelname)s: %(message)s")
+    src = REPO_DIR / args.lab
+    mat_files = sorted(src.glob("*.mat"))
+    depths = [int(d) for d in args.depths.split(",")]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        work = Path(tmp)
+        shutil.copy2(src / "helilab.json", work / "helilab.json")
+        for p in mat_files:
+            shutil.copy2(p, work / p.name)
+        logging.info("%s: %d file(s), %.1f MB", args.lab, len(mat_files),
+                     sum(p.stat().st_size for p in mat_files) / 1e6)
+        if args.cached:
+            run_once(work, 0, cached=True)
+        # Interleave depths so drift (thermal, page cache) hits all of them alike
+        times = {d: [] for d in depths}
+        for _ in range(args.repeat):
+            for d in depths:
+                times[d].append(run_once(work, d, args.cached))
+
+    base = min(times[depths[0]])
+    print(f"{'prefetch':>8} {'min s':>8} {'median s':>9} {'speed-up':>9}")
+    for d in depths:
+        print(f"{d:>8} {min(times[d]):>8.2f} {statistics.median(times[d]):>9.2f} {base / min(times[d]):>8.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""Start-up cost of helilab.plot: import time and short CLI runs.
+
+- Times fresh interpreters (so nothing is cached in-process) for:
+    import        python -c "import helilab.plot"
+    help          python -m helilab.plot --help
+    up-to-date    a folder whose figures are all current (manifest hits only)
+    one-file      one log rendered from scratch (--force --no-cache)
+  against a bare `python -c pass` so the interpreter's own start-up is visible.
+- Each case runs --repeat times; minimum and median wall time are printed.
+- Lists the slowest modules from `python -X importtime` for the import case and
+  flags whether numpy/scipy/matplotlib were loaded by each case.
+
+Examples (PowerShell):
+  python bench\\bench_startup.py
+  python bench\\bench_startup.py --lab lab2 --repeat 20 --out startup.json
+"""
+from __future__ import annotations
+
+from pathlib import Path
+import argparse
+import json
+import logging
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+REPO_DIR = Path(__file__).parent.parent.resolve()
+HEAVY = ("numpy", "scipy", "matplotlib", "h5py")
+
+
+def timed_runs(cmd: list, repeat: int) -> dict:
+    times = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        subprocess.run(cmd, check=True, cwd=REPO_DIR, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        times.append(time.perf_counter() - t0)
+    return {"min": min(times), "median": statistics.median(times)}
+
+
+def imported_modules(cmd: list) -> list:
+    """Top-level packages from HEAVY that `cmd` imports (via -X importtime)."""
+    out = subprocess.run([cmd[0], "-X", "importtime"] + cmd[1:], cwd=REPO_DIR, capture_output=True, text=True)
+    names = {line.rsplit("|", 1)[-1].strip().split(".")[0]
+             for line in out.stderr.splitlines() if line.startswith("import time:")}
+    return [h for h in HEAVY if h in names]
+
+
+def slowest_imports(n: int) -> list:
+    out = subprocess.run([sys.executable, "-X", "importtime", "-c", "import helilab.plot"],
+                         cwd=REPO_DIR, capture_output=True, text=True)
+    rows = []
+    for line in out.stderr.splitlines()[1:]:
+        parts = line.split("|")
+        if len(parts) == 3:
+            rows.append((int(parts[1]), parts[2].rstrip()))
+    return sorted(rows, reverse=True)[:n]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark helilab.plot start-up.")
+    parser.add_argument("--lab", default="lab3", help="Lab folder for the up-to-date and one-file cases (default lab3)")
+    parser.add_argument("--repeat", type=int, default=10, help="Runs per case (default 10)")
+    parser.add_argument("--out", type=Path, default=None, help="Write the results as JSON")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(levelname)s: %(message)s")
+    py = sys.executable
+    src = REPO_DIR / args.lab
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        work = Path(tmp) / args.lab
+        one = Path(tmp) / "one"
+        work.mkdir()
+        one.mkdir()
+        mat_files = sorted(src.glob("*.mat"))
+        for p in [src / "helilab.json"] + mat_files:
+            shutil.copy2(p, work / p.name)
+        for p in (src / "helilab.json", mat_files[0]):
+            shutil.copy2(p, one / p.name)
+        subprocess.run([py, "-m", "helilab.plot", str(work)], check=True, cwd=REPO_DIR,
+                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)  # make every figure current
+        cases = {
+            "python": [py, "-c", "pass"],
+            "import": [py, "-c", "import helilab.plot"],
+            "help": [py, "-m", "helilab.plot", "--help"],
+            "up-to-date": [py, "-m", "helilab.plot", str(work)],
+            "one-file": [py, "-m", "helilab.plot", str(one), "--force", "--no-cache"],
+        }
+        for name, cmd in cases.items():
+            results[name] = timed_runs(cmd, args.repeat)
+            results[name]["loads"] = imported_modules(cmd)
+
+    print(f"{'case':<12} {'min ms':>8} {'median ms':>10}  heavy imports")
+    for name, r in results.items():
+        print(f"{name:<12} {1e3 * r['min']:>8.1f} {1e3 * r['median']:>10.1f}  {', '.join(r['loads']) or '-'}")
+    print("\nSlowest imports for `import helilab.plot` (cumulative us):")
+    for us, mod in slowest_imports(8):
+        print(f"  {us:>8d}  {mod}")
+    if args.out is not None:
+        args.out.write_text(json.dumps({"python": sys.version.split()[0], "results": results}, indent=1))
+
+
+if __name__ == "__main__":
+    main()
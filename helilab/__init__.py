@@ -0,0 +1 @@
+"""Plotting and analysis tools for the TTK4115 helicopter lab logs."""
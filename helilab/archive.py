@@ -0,0 +1,261 @@
+#!/usr/bin/env python3
+"""Columnar archive of every lab run, with zone maps for cross-run queries.
+
+- `ingest` loads every .mat in the lab folders through helilab.plot with the
+  folder's profile (same layout detection, state labels and parsed-log cache) and writes one
+  Parquet file: columns lab, run, t and one column per state label.
+- Rows are written run by run in row groups of --chunk-rows samples, so a row
+  group never mixes runs and only one run's samples are in memory at a time. Parquet keeps min/max statistics per row group and
+  column; these act as zone maps.
+- `query` checks the zone maps first and reads only the row groups that can
+  satisfy every --where condition and the --tmin/--tmax range.
+
+Examples (PowerShell):
+  helilab-archive ingest                            # lab1..lab4 -> runs.parquet
+  helilab-archive ingest lab2 lab3 --out lab23.parquet
+  helilab-archive query --where "abs(pitch)>0.3"     # runs that exceeded 0.3 rad pitch
+  helilab-archive query --where "elevation<-0.2" --lab lab2 --tmin 5 --tmax 30
+  helilab-archive query --where "abs([State 1])>0.3" --lab lab1   # names with spaces
+
+Requires pyarrow (pip install -e .[archive]).
+"""
+from __future__ import annotations
+
+from pathlib import Path
+import argparse
+import json
+import logging
+import re
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+from helilab.plot import load_profile, load_run, resolve_dirs
+
+DEFAULT_ARCHIVE = Path("runs.parquet")
+META_KEY = b"helilab.runs"
+
+# "pitch>0.3", "abs(pitch) >= 0.3", "elevation<-0.2", and quoted or bracketed names for
+# columns that are not plain identifiers: '"State 1">0.3', "abs([State 1])>0.3"
+_WHERE_RE = re.compile(r"""^\s*(?P<abs>abs\(\s*)?
+                           (?:"(?P<dq>[^"]+)"|'(?P<sq>[^']+)'|\[(?P<br>[^\]]+)\]|(?P<word>\w+))
+                           (?(abs)\s*\))\s*(?P<op>>=|<=|>|<)\s*(?P<value>[-+0-9.eE]+)\s*$""", re.VERBOSE)
+
+
+def _load(mat_path: Path, ans_labels: List[str], cache_dir: Path) -> tuple:
+    """load_run() that logs and returns (None, None, None) for a run it cannot use."""
+    try:
+        t, Y, labels = load_run(mat_path, ans_labels, cache_dir)
+    except Exception as e:
+        logging.warning("Failed to load %s: %s", mat_path, e)
+        return None, None, None
+    if t is None:
+        logging.info("Skipping %s (no state layout found).", mat_path)
+    return t, Y, labels
+
+
+def ingest(lab_dirs: List[Path], out_path: Path, chunk_rows: int) -> None:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    # First pass: labels and extent of each run only. The samples are loaded again,
+    # one run at a time, while writing (from the parsed-log cache the first pass fills).
+    runs, meta = [], {}
+    for lab_dir in lab_dirs:
+        ans_labels = load_profile(lab_dir)["labels"]
+        for mat_path in sorted(lab_dir.glob("*.mat")):
+            t, _, labels = _load(mat_path, ans_labels, lab_dir / ".plotcache")
+            if t is None:
+                continue
+            runs.append((lab_dir, mat_path, ans_labels, labels))
+            meta[f"{lab_dir.name}/{mat_path.stem}"] = {
+                "lab": lab_dir.name, "run": mat_path.stem, "samples": int(t.size), "labels": list(labels),
+                "t0": float(t[0]), "t1": float(t[-1])}
+    if not runs:
+        logging.warning("No runs found in %s", ", ".join(str(d) for d in lab_dirs))
+        return
+
+    # One column per distinct state label, in first-seen order; missing states stay null
+    states: List[str] = []
+    for *_, labels in runs:
+        states.extend(lbl for lbl in labels if lbl not in states)
+    # lab and run hold one value per run, stored as a dictionary column of int32 indices
+    name_type = pa.dictionary(pa.int32(), pa.string())
+    schema = pa.schema([("lab", name_type), ("run", name_type), ("t", pa.float64())]
+                       + [(name, pa.float64()) for name in states])
+    schema = schema.with_metadata({META_KEY: json.dumps(meta).encode()})
+
+    tmp = out_path.with_suffix(out_path.suffix + ".tmp")
+    try:
+        with pq.ParquetWriter(tmp, schema, write_statistics=True) as writer:
+            for lab_dir, mat_path, ans_labels, labels in runs:
+                lab, run = lab_dir.name, mat_path.stem
+                t, Y, now = _load(mat_path, ans_labels, lab_dir / ".plotcache")
+                n = meta[f"{lab}/{run}"]["samples"]
+                if t is None or now != labels or t.size != n:
+                    raise SystemExit(f"{mat_path} changed while archiving; run ingest again")
+                index = np.zeros(n, dtype=np.int32)
+                columns = {"lab": pa.DictionaryArray.from_arrays(index, [lab]),
+                           "run": pa.DictionaryArray.from_arrays(index, [run]), "t": pa.array(np.asarray(t))}
+                for name in states:
+                    columns[name] = (pa.array(np.asarray(Y[labels.index(name)], dtype=np.float64))
+                                     if name in labels else pa.nulls(n, pa.float64()))
+                writer.write_table(pa.table(columns, schema=schema), row_group_size=chunk_rows)
+                del t, Y, columns
+                logging.info("Archived %s/%s (%d samples)", lab, run, n)
+    except BaseException:
+        tmp.unlink(missing_ok=True)
+        raise
+    tmp.replace(out_path)
+    logging.info("Done. Wrote %d run(s) to %s", len(runs), out_path)
+
+
+def parse_where(spec: str) -> Tuple[str, bool, str, float]:
+    """Parse "pitch>0.3" / "abs(pitch)>=0.3" / '"State 1"<0' into (column, use_abs, op, value)."""
+    m = _WHERE_RE.match(spec)
+    if m is None:
+        raise ValueError(f"cannot parse condition {spec!r} (expected e.g. 'pitch>0.3', 'abs(pitch)>0.3' "
+                         f"or '[State 1]>0.3')")
+    column = m.group("dq") or m.group("sq") or m.group("br") or m.group("word")
+    try:
+        value = float(m.group("value"))
+    except ValueError:
+        raise ValueError(f"bad threshold {m.group('value')!r} in condition {spec!r}") from None
+    return column, m.group("abs") is not None, m.group("op"), value
+
+
+def zone_may_match(lo: float, hi: float, use_abs: bool, op: str, value: float) -> bool:
+    """Can any x in [lo, hi] satisfy the condition? (zone-map pruning)"""
+    if use_abs:
+        amax = max(abs(lo), abs(hi))
+        amin = 0.0 if lo <= 0.0 <= hi else min(abs(lo), abs(hi))
+        lo, hi = amin, amax
+    if op == ">":
+        return hi > value
+    if op == ">=":
+        return hi >= value
+    if op == "<":
+        return lo < value
+    return lo <= value
+
+
+def _apply(x: np.ndarray, use_abs: bool, op: str, value: float) -> np.ndarray:
+    x = np.abs(x) if use_abs else x
+    if op == ">":
+        return x > value
+    if op == ">=":
+        return x >= value
+    if op == "<":
+        return x < value
+    return x <= value
+
+
+def query(archive: Path, where: List[str], tmin: Optional[float], tmax: Optional[float],
+          lab: Optional[str]) -> None:
+    import pyarrow.parquet as pq
+
+    try:
+        conds = [parse_where(w) for w in where]
+    except ValueError as e:
+        raise SystemExit(f"--where: {e}") from None
+    pf = pq.ParquetFile(archive)
+    names = pf.schema_arrow.names
+    for column, *_ in conds:
+        if column not in names:
+            raise SystemExit(f"Unknown state {column!r}; archive has {', '.join(names[3:])}")
+
+    # Zone-map pass: keep row groups whose min/max could satisfy every condition
+    keep = []
+    md = pf.metadata
+    for rg in range(md.num_row_groups):
+        group = md.row_group(rg)
+        stats = {names[c]: group.column(c).statistics for c in range(group.num_columns)}
+
+        def bounds(col: str) -> Optional[Tuple[float, float]]:
+            st = stats[col]
+            if st is None or not st.has_min_max:
+                return None  # no statistics: cannot prune
+            return st.min, st.max
+
+        ok = True
+        if lab is not None and bounds("lab") is not None:
+            lo, hi = bounds("lab")
+            ok = lo <= lab <= hi
+        b = bounds("t")
+        if ok and b is not None:
+            ok = (tmin is None or b[1] >= tmin) and (tmax is None or b[0] <= tmax)
+        for column, use_abs, op, value in conds:
+            if not ok:
+                break
+            b = bounds(column)
+            if b is not None:
+                ok = zone_may_match(b[0], b[1], use_abs, op, value)
+            elif stats[column] is not None and stats[column].null_count == group.num_rows:
+                ok = False  # state not logged in this run
+        if ok:
+            keep.append(rg)
+    logging.info("Zone maps: reading %d of %d row group(s)", len(keep), md.num_row_groups)
+    if not keep:
+        logging.info("No matching runs.")
+        return
+
+    cols = ["lab", "run", "t"] + sorted({c for c, *_ in conds})
+    table = pf.read_row_groups(keep, columns=cols)
+    t = table.column("t").to_numpy()
+    mask = np.ones(t.size, dtype=bool)
+    if tmin is not None:
+        mask &= t >= tmin
+    if tmax is not None:
+        mask &= t <= tmax
+    labs = table.column("lab").to_numpy(zero_copy_only=False).astype(str)
+    if lab is not None:
+        mask &= labs == lab
+    for column, use_abs, op, value in conds:
+        x = table.column(column).to_numpy(zero_copy_only=False)
+        mask &= _apply(x, use_abs, op, value)  # nulls arrive as NaN and never match
+
+    if not mask.any():
+        logging.info("No matching runs.")
+        return
+    runs_col = table.column("run").to_numpy(zero_copy_only=False).astype(str)
+    hits = np.char.add(np.char.add(labs[mask], "/"), runs_col[mask])
+    t_hit = t[mask]
+    runs, first, counts = np.unique(hits, return_index=True, return_counts=True)
+    width = max(len(r) for r in runs)
+    print(f"{'run':<{width}}  {'samples':>8}  {'first t [s]':>11}")
+    for run, i, n in sorted(zip(runs, first, counts), key=lambda r: r[0]):
+        print(f"{run:<{width}}  {n:>8d}  {t_hit[i]:>11.3f}")
+    logging.info("%d run(s) match %s", len(runs), " and ".join(where) or "the time range")
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Build and query a columnar archive of all lab runs.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_in = sub.add_parser("ingest", help="Convert every run into one Parquet archive")
+    p_in.add_argument("dirs", nargs="*",
+                      help="Lab folders to scan; patterns like lab* are expanded (default: lab*)")
+    p_in.add_argument("--out", type=Path, default=DEFAULT_ARCHIVE, help="Archive path (default runs.parquet)")
+    p_in.add_argument("--chunk-rows", type=int, default=65536,
+                      help="Samples per row group, i.e. zone-map granularity (default 65536)")
+
+    p_q = sub.add_parser("query", help="List runs matching state thresholds / a time range")
+    p_q.add_argument("--archive", type=Path, default=DEFAULT_ARCHIVE, help="Archive path (default runs.parquet)")
+    p_q.add_argument("--where", action="append", default=[],
+                     help='Condition like "pitch>0.3" or "abs(pitch)>=0.3"; quote or bracket names with '
+                          'spaces, e.g. "[State 1]<0"; repeat to AND several')
+    p_q.add_argument("--tmin", type=float, default=None, help="Min time (seconds) to consider")
+    p_q.add_argument("--tmax", type=float, default=None, help="Max time (seconds) to consider")
+    p_q.add_argument("--lab", default=None, help="Only runs from this lab folder (e.g. lab2)")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(levelname)s: %(message)s")
+
+    if args.command == "ingest":
+        ingest(resolve_dirs(args.dirs or ["lab*"]), args.out, args.chunk_rows)
+    else:
+        query(args.archive, args.where, args.tmin, args.tmax, args.lab)
+
+
+if __name__ == "__main__":
+    main()
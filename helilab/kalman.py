@@ -0,0 +1,268 @@
+#!/usr/bin/env python3
+"""Replay recorded logs through the lab 4 discrete Kalman filter for many Qd candidates.
+
+- Model of lab4/init_heli_3_10.m and midlertidig.m (see helilab.model): six states
+  [pitch, pitch_dot, elevation, elevation_dot, lambda, lambda_dot], discretised
+  with c2d(..., T, 'zoh'). The measurements are the logged channels whose profile
+  label is a model state (the IMU logs give lab 4's five outputs). If lambda is
+  not measured it is dropped from the model, since only its derivative is observable.
+- Qd candidates: every --qd diagonal (default the script's Qd) times every --q-scale
+  factor. Rd is --rd or, per run, half the variance of each channel's first difference.
+- Two modes, each batched over all candidates at once:
+    tv   full time-varying filter: covariance predict/update every sample until
+         P stops changing (it does not depend on the data), fixed gains after that
+    ss   steady state: the discrete Riccati equation is solved once per candidate
+         and the fixed-gain filter runs as an LTI system, propagated in blocks
+- Inputs [Vs, Vd] are not logged; --inputs model rebuilds them from the logged
+  rates (helilab.model.rebuild_inputs), --inputs zero leaves them to Qd.
+- Scores per candidate and run: RMS innovation per channel and the mean normalised
+  innovation squared (NIS), which is the number of measurements for a consistent
+  filter. Candidates are ranked by |NIS / m - 1|.
+
+Examples (PowerShell):
+  helilab-kalman lab3 --pattern "IMU_test_*"
+  helilab-kalman lab3 --pattern "IMU_test_*" --q-scale 1e-2:1e4:25 --mode ss --gains=0.53,0.085,0.61
+  helilab-kalman lab2 --qd=1e-5,1e-3,1e-5,1e-3,1e-5,1e-3 --rd=1e-4,1e-4,1e-4,1e-4,1e-4,1e-4
+"""
+from __future__ import annotations
+
+from pathlib import Path
+import argparse
+import csv
+import logging
+import math
+import time
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+from helilab import model
+from helilab.plot import load_profile, load_run
+
+MODES = ("tv", "ss")
+CONVERGE_EVERY = 50    # samples between checks of the covariance
+CONVERGE_TOL = 1e-12   # relative change of P below which tv keeps its gains fixed
+SS_BLOCK_FLOATS = 1 << 21  # size of each per-segment working array of filter_ss
+
+
+def parse_qscale(spec: str) -> np.ndarray:
+    """"10" -> [10.0]; "1e-2:1e4:25" -> 25 factors spaced evenly on a log scale."""
+    parts = [float(x) for x in spec.split(":")]
+    if len(parts) == 1:
+        return np.array(parts)
+    if len(parts) != 3 or parts[0] <= 0 or parts[1] <= 0:
+        raise SystemExit(f"--q-scale expects VALUE or START:STOP:COUNT with positive bounds, got {spec!r}")
+    return np.geomspace(parts[0], parts[1], int(parts[2]))
+
+
+def discrete_model(states: List[str], gains: Tuple[float, float, float]) -> Tuple[np.ndarray, np.ndarray]:
+    """ZOH (Ad, Bd) of the lab 4 model restricted to `states`."""
+    A, B = model.kalman_model(*gains)
+    keep = [model.STATE_NAMES.index(s) for s in states]
+    return model.c2d(A[np.ix_(keep, keep)], B[keep], model.T)
+
+
+def filter_tv(Ad: np.ndarray, Bu: np.ndarray, C: np.ndarray, Y: np.ndarray, Qd: np.ndarray,
+              Rd: np.ndarray, x0: np.ndarray, p0: float) -> Tuple[np.ndarray, np.ndarray]:
+    """Time-varying filter for all Qd[c] at once; returns (innovation RMS[c,m], mean NIS[c])."""
+    nc, n = Qd.shape[0], Ad.shape[0]
+    N, m = Y.shape
+    x = np.tile(x0, (nc, 1))
+    P = np.tile(np.eye(n) * p0, (nc, 1, 1))
+    sq = np.zeros((nc, m))
+    nis = np.zeros(nc)
+    P_check, converged = P.copy(), False
+    for k in range(N):
+        if k:
+            x = x @ Ad.T + Bu[k - 1]
+        if not converged:
+            if k:
+                P = Ad @ P @ Ad.T + Qd
+            CP = C @ P
+            S = CP @ C.T + Rd
+            Kt = np.linalg.solve(S, CP)  # K^T, S is symmetric
+            Sinv = np.linalg.inv(S)
+            P = P - np.einsum("cmi,cmj->cij", Kt, CP)
+            # P does not depend on the data: once it stops changing the gains are final
+            if k % CONVERGE_EVERY == 0:
+                converged = k > 0 and np.abs(P - P_check).max() <= CONVERGE_TOL * np.abs(P).max()
+                P_check = P.copy()
+        e = Y[k] - x @ C.T
+        sq += e * e
+        nis += np.einsum("cm,cmj,cj->c", e, Sinv, e)
+        x = x + np.einsum("cmn,cm->cn", Kt, e)
+    return np.sqrt(sq / N), nis / N
+
+
+def steady_gains(Ad: np.ndarray, C: np.ndarray, Qd: np.ndarray, Rd: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """(K[c,n,m], S^-1[c,m,m], solved) from the discrete Riccati equation, once per candidate."""
+    from scipy.linalg import solve_discrete_are
+
+    nc, n, m = Qd.shape[0], Ad.shape[0], C.shape[0]
+    K = np.full((nc, n, m), np.nan)
+    Sinv = np.full((nc, m, m), np.nan)
+    solved = np.zeros(nc, dtype=bool)
+    for c in range(nc):
+        try:
+            P = solve_discrete_are(Ad.T, C.T, Qd[c], Rd)
+        except (ValueError, np.linalg.LinAlgError) as e:
+            logging.debug("DARE for candidate %d: %s", c, e)
+            continue
+        Sinv[c] = np.linalg.inv(C @ P @ C.T + Rd)
+        K[c] = P @ C.T @ Sinv[c]
+        solved[c] = True
+    return K, Sinv, solved
+
+
+def filter_ss(Ad: np.ndarray, Bu: np.ndarray, C: np.ndarray, Y: np.ndarray, K: np.ndarray,
+              Sinv: np.ndarray, x0: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Fixed-gain filter for all gains K[c] at once; returns (innovation RMS[c,m], mean NIS[c]).
+
+    With a fixed gain the predicted state is a linear time-invariant recursion,
+    x[k+1] = F x[k] + G y[k] + Bu[k] with F = Ad (I - K C) and G = Ad K, so it is
+    propagated in blocks of L samples: one loop over the blocks finds their
+    start states through F^L, then every block advances at once, one sample per
+    step. Segments of S samples then cost about 2 sqrt(S) Python steps, not S.
+    """
+    nc, n = K.shape[0], Ad.shape[0]
+    N, m = Y.shape
+    G = Ad @ K
+    F = Ad - G @ C
+    seg = max(1, SS_BLOCK_FLOATS // (nc * n))
+    L = max(1, math.isqrt(seg))
+    nb = max(1, seg // L)
+    Fp = [np.broadcast_to(np.eye(n), F.shape)]
+    for _ in range(L):
+        Fp.append(Fp[-1] @ F)
+    # [F^(L-1) ... F^0] side by side, so one matmul sums a block's inputs into its end state
+    H = np.concatenate(Fp[L - 1::-1], axis=2)
+    FL_T, F_T = Fp[L].transpose(0, 2, 1), F.transpose(0, 2, 1)
+    x = np.tile(x0, (nc, 1))
+    sq = np.zeros((nc, m))
+    nis = np.zeros(nc)
+    for k0 in range(0, N, nb * L):
+        s = min(nb * L, N - k0)
+        blocks = -(-s // L)
+        W = np.zeros((nc, blocks * L, n))
+        W[:, :s] = Y[k0:k0 + s] @ G.transpose(0, 2, 1) + Bu[k0:k0 + s]
+        W = W.reshape(nc, blocks, L, n)
+        R = W.reshape(nc, blocks, L * n) @ H.transpose(0, 2, 1)
+        X = np.empty((nc, blocks, L, n))
+        for b in range(blocks):
+            X[:, b, 0] = x
+            x = (x[:, None] @ FL_T)[:, 0] + R[:, b]
+        for j in range(1, L):
+            X[:, :, j] = X[:, :, j - 1] @ F_T + W[:, :, j - 1]
+        e = Y[k0:k0 + s] - X.reshape(nc, -1, n)[:, :s] @ C.T
+        sq += np.einsum("ckm,ckm->cm", e, e)
+        nis += np.einsum("ckm,cmj,ckj->c", e, Sinv, e, optimize=True)
+    return np.sqrt(sq / N), nis / N
+
+
+def load_logs(folder: Path, pattern: str, cache_dir: Optional[Path]) -> List[tuple]:
+    """[(run, t, {label: channel})] for the logs matching `pattern`."""
+    ans_labels = load_profile(folder)["labels"]
+    runs = []
+    for mat_path in sorted(folder.glob(pattern + ".mat")):
+        t, Y, labels = load_run(mat_path, ans_labels, cache_dir)
+        if t is None:
+            logging.info("Skipping %s (no state layout found).", mat_path.name)
+            continue
+        Y = np.asarray(Y, dtype=np.float64)
+        runs.append((mat_path.stem, t, {lbl: Y[i] for i, lbl in enumerate(labels)}))
+    return runs
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Replay logs through the lab 4 Kalman filter for many Qd candidates.")
+    parser.add_argument("folder", nargs="?", default="lab3", help="Folder with the logs (default lab3)")
+    parser.add_argument("--pattern", default="IMU_test_*", help="Glob on the file name without .mat (default IMU_test_*)")
+    parser.add_argument("--qd", action="append", default=[],
+                        help="Six comma-separated Qd diagonal entries; repeatable (default: the script's Qd)")
+    parser.add_argument("--q-scale", default="1", help='Factor(s) applied to every --qd: "10" or "START:STOP:COUNT" (log-spaced)')
+    parser.add_argument("--rd", default=None, help="Rd diagonal, one entry per measured channel (default: estimated per run)")
+    parser.add_argument("--mode", choices=MODES + ("both",), default="both", help="Filter(s) to run (default both)")
+    parser.add_argument("--inputs", choices=("model", "zero"), default="model",
+                        help="Rebuild [Vs, Vd] from the logged rates, or assume zero (default model)")
+    parser.add_argument("--gains", default=None, help="K_1,K_2,K_3 instead of the script's nominal gains")
+    parser.add_argument("--p0", type=float, default=1.0, help="Initial covariance P0 = p0 * I (default 1)")
+    parser.add_argument("--no-cache", action="store_true", help="Do not read or write the parsed-log cache")
+    parser.add_argument("--top", type=int, default=5, help="Candidates listed in the log per mode (default 5)")
+    parser.add_argument("--out", type=Path, default=Path("kalman_sweep.csv"), help="CSV output (default kalman_sweep.csv)")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(levelname)s: %(message)s")
+    folder = Path(args.folder).resolve()
+    runs = load_logs(folder, args.pattern, None if args.no_cache else folder / ".plotcache")
+    if not runs:
+        raise SystemExit(f"No logs match {args.pattern!r} in {folder}")
+    gains = model.parse_gains(args.gains)
+
+    measured = [s for s in model.STATE_NAMES if all(s in ch for _, _, ch in runs)]
+    if not measured:
+        raise SystemExit(f"The logs share no channel with the model states {', '.join(model.STATE_NAMES)}")
+    states = [s for s in model.STATE_NAMES if s != "lambda" or "lambda" in measured]
+    Ad, Bd = discrete_model(states, gains)
+    C = np.zeros((len(measured), len(states)))
+    for i, s in enumerate(measured):
+        C[i, states.index(s)] = 1.0
+    logging.info("States %s; measuring %s", ", ".join(states), ", ".join(measured))
+
+    base = [[float(x) for x in q.split(",")] for q in args.qd] or [model.QD_NOMINAL]
+    if any(len(q) != 6 for q in base):
+        raise SystemExit("--qd needs six entries, one per model state")
+    keep = [model.STATE_NAMES.index(s) for s in states]
+    qdiag = (parse_qscale(args.q_scale)[:, None, None] * np.array(base)[None]).reshape(-1, 6)[:, keep]
+    Qd = qdiag[:, :, None] * np.eye(len(states))[None]
+    rd_fixed = None if args.rd is None else np.array([float(x) for x in args.rd.split(",")])
+    if rd_fixed is not None and rd_fixed.size != len(measured):
+        raise SystemExit(f"--rd needs {len(measured)} entries ({', '.join(measured)})")
+    modes = MODES if args.mode == "both" else (args.mode,)
+
+    rows = []  # (mode, candidate, run, nis_mean, innovation rms per channel)
+    timing = dict.fromkeys(modes, 0.0)
+    for run, t, ch in runs:
+        Y = np.column_stack([ch[s] for s in measured])
+        Rd = np.diag(rd_fixed if rd_fixed is not None else np.var(np.diff(Y, axis=0), axis=0) / 2)
+        if args.inputs == "model" and "pitch_dot" in ch and "elevation_dot" in ch:
+            u = model.rebuild_inputs(t, ch["pitch_dot"], ch["elevation_dot"], *gains[:2])
+        else:
+            u = np.zeros((t.size, 2))
+        Bu = u @ Bd.T
+        x0 = C.T @ Y[0]
+        for mode in modes:
+            t0 = time.perf_counter()
+            if mode == "tv":
+                rms, nis = filter_tv(Ad, Bu, C, Y, Qd, Rd, x0, args.p0)
+                ok = np.ones(len(Qd), dtype=bool)
+            else:
+                K, Sinv, ok = steady_gains(Ad, C, Qd, Rd)
+                rms, nis = filter_ss(Ad, Bu, C, Y, K, Sinv, x0)
+            timing[mode] += time.perf_counter() - t0
+            for c in np.flatnonzero(ok):
+                rows.append((mode, c, run, float(nis[c]), rms[c]))
+        logging.info("%s: %d samples, %d candidate(s)", run, t.size, len(Qd))
+    logging.info("Filter time: %s", ", ".join(f"{m} {timing[m]:.2f} s" for m in modes))
+
+    with open(args.out, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["mode", "candidate", "qd", "run", "nis_mean"] + [f"innov_{s}" for s in measured])
+        for mode, c, run, nis_mean, rms in rows:
+            writer.writerow([mode, c, ";".join(f"{q:.6g}" for q in qdiag[c]), run, f"{nis_mean:.6g}"]
+                            + [f"{v:.6g}" for v in rms])
+
+    m = len(measured)
+    for mode in modes:
+        scores: dict = {}
+        for row_mode, c, _, nis_mean, _ in rows:
+            if row_mode == mode:
+                scores.setdefault(c, []).append(nis_mean)
+        ranked = sorted(scores, key=lambda c: abs(np.mean(scores[c]) / m - 1))
+        logging.info("Most consistent Qd candidates (%s), mean NIS / %d measurements:", mode, m)
+        for c in ranked[:args.top]:
+            logging.info("  %-60s %.3f", "[" + ", ".join(f"{q:.3g}" for q in qdiag[c]) + "]", np.mean(scores[c]) / m)
+    logging.info("Done. Wrote %s", args.out)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,328 @@
+#!/usr/bin/env python3
+"""Live view of the helicopter states during a run, fed from UDP or a pipe.
+
+- `view` receives samples, keeps the last --window seconds in a preallocated
+  ring buffer (memory stays constant however long the run is) and redraws the
+  min/max-decimated traces at most --fps times per second.
+- Without a display (no DISPLAY on Linux, or a non-interactive backend) the
+  viewer writes a PNG snapshot every --snapshot-every seconds instead.
+- `replay` stands in for the QuaRC model: it plays a logged .mat back in real
+  time (or --speed times faster) through helilab.plot's layout detection.
+- Wire format: packets of "<HH" (n_states, n_samples) followed by n_samples
+  rows of float64 [t, x1 .. xn], little-endian. On UDP one packet per datagram.
+- State labels come from the chosen lab folder's helilab.json profile.
+
+Examples (PowerShell):
+  helilab-live view --lab lab3                       # listen on udp 127.0.0.1:5005
+  helilab-live replay "lab3\\pitch test.mat"          # in a second terminal
+  helilab-live replay lab2\\run1.mat --speed 4 --loop
+  helilab-live view --lab lab2 --window 10 --fps 15 --snapshot live.png
+"""
+from __future__ import annotations
+
+from pathlib import Path
+import argparse
+import logging
+import os
+import select
+import socket
+import struct
+import sys
+import time
+from typing import BinaryIO, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from helilab.plot import decimate_minmax, detect_layout, load_candidates, load_profile
+
+DEFAULT_ADDR = "127.0.0.1:5005"
+HEADER = struct.Struct("<HH")
+MAX_DATAGRAM = 65507
+SAMPLE_RATE = 500.0  # 1 / T from init_heli_3_10.m
+
+
+class RingBuffer:
+    """Fixed-capacity (capacity, width) float64 buffer; old rows are overwritten."""
+
+    def __init__(self, capacity: int, width: int):
+        self.data = np.full((capacity, width), np.nan)
+        self.capacity = capacity
+        self.head = 0  # next row to write
+        self.count = 0
+
+    def extend(self, rows: np.ndarray) -> None:
+        n = rows.shape[0]
+        if n >= self.capacity:
+            self.data[:] = rows[-self.capacity:]
+            self.head = 0
+            self.count = self.capacity
+            return
+        first = min(n, self.capacity - self.head)
+        self.data[self.head:self.head + first] = rows[:first]
+        self.data[:n - first] = rows[first:]
+        self.head = (self.head + n) % self.capacity
+        self.count = min(self.count + n, self.capacity)
+
+    def ordered(self) -> np.ndarray:
+        """Oldest-to-newest copy of the filled part (at most `capacity` rows)."""
+        if self.count < self.capacity:
+            return self.data[:self.count].copy()
+        return np.concatenate((self.data[self.head:], self.data[:self.head]))
+
+
+def parse_addr(spec: str) -> Tuple[str, int]:
+    host, _, port = spec.rpartition(":")
+    return host or "127.0.0.1", int(port)
+
+
+def encode_packet(rows: np.ndarray) -> bytes:
+    """rows: (k, 1 + n_states) of [t, states...]."""
+    return HEADER.pack(rows.shape[1] - 1, rows.shape[0]) + np.ascontiguousarray(rows, dtype="<f8").tobytes()
+
+
+def decode_packet(buf: bytes) -> Optional[np.ndarray]:
+    if len(buf) < HEADER.size:
+        return None
+    ns, k = HEADER.unpack_from(buf)
+    if len(buf) != HEADER.size + 8 * k * (ns + 1):
+        return None
+    return np.frombuffer(buf, dtype="<f8", offset=HEADER.size).reshape(k, ns + 1)
+
+
+class PacketSource:
+    """Non-blocking reader of packets from a UDP socket or a binary pipe (stdin)."""
+
+    def __init__(self, udp: Optional[str]):
+        self.sock = None
+        self.pipe: Optional[BinaryIO] = None
+        self.pending = b""
+        if udp is not None:
+            self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 1 << 22)
+            self.sock.bind(parse_addr(udp))
+            self.sock.setblocking(False)
+        else:
+            self.pipe = sys.stdin.buffer
+            if sys.platform == "win32":
+                raise SystemExit("--pipe needs select() on pipes; use UDP on Windows")
+            os.set_blocking(self.pipe.fileno(), False)
+        self.closed = False
+        self.dropped = 0
+
+    def poll(self, timeout: float) -> List[np.ndarray]:
+        """Return every complete packet that arrives within `timeout` seconds."""
+        fd = self.sock if self.sock is not None else self.pipe
+        ready, _, _ = select.select([fd], [], [], max(timeout, 0.0))
+        if not ready:
+            return []
+        out = []
+        if self.sock is not None:
+            while True:
+                try:
+                    buf = self.sock.recv(MAX_DATAGRAM)
+                except BlockingIOError:
+                    break
+                rows = decode_packet(buf)
+                if rows is None:
+                    self.dropped += 1
+                else:
+                    out.append(rows)
+            return out
+        chunk = self.pipe.read1(1 << 20) if hasattr(self.pipe, "read1") else self.pipe.read(1 << 20)
+        if chunk == b"":
+            self.closed = True
+        self.pending += chunk or b""
+        while len(self.pending) >= HEADER.size:
+            ns, k = HEADER.unpack_from(self.pending)
+            size = HEADER.size + 8 * k * (ns + 1)
+            if len(self.pending) < size:
+                break
+            out.append(decode_packet(self.pending[:size]))
+            self.pending = self.pending[size:]
+        return out
+
+
+def have_display() -> bool:
+    if sys.platform.startswith("linux") and not (os.environ.get("DISPLAY") or os.environ.get("WAYLAND_DISPLAY")):
+        return False
+    import matplotlib
+    from matplotlib import rcsetup
+
+    return matplotlib.get_backend().lower() not in {b.lower() for b in rcsetup.non_interactive_bk}
+
+
+def _reset_axes(ax) -> None:
+    ax.set_xlabel("time [s]")
+    ax.set_ylabel("value")
+    ax.grid(True)
+
+
+def view(args: argparse.Namespace) -> None:
+    ans_labels = load_profile(Path(args.lab))["labels"]
+    headless = args.snapshot is not None or not have_display()
+    import matplotlib
+    if headless:
+        matplotlib.use("Agg", force=True)
+    import matplotlib.pyplot as plt
+
+    capacity = int(round(args.window * args.rate))
+    buf: Optional[RingBuffer] = None
+    source = PacketSource(None if args.pipe else args.udp)
+    snapshot = args.snapshot or Path("live.png")
+    logging.info("Listening on %s (%s, %d-sample ring buffer)", "stdin" if args.pipe else args.udp,
+                 f"PNG snapshots to {snapshot}" if headless else f"{args.fps:g} fps", capacity)
+
+    fig, ax = plt.subplots(figsize=args.figsize)
+    _reset_axes(ax)
+    lines = []
+    width_px = max(int(ax.bbox.width), 100)
+    if not headless:
+        plt.show(block=False)
+
+    frame_dt = 1.0 / args.fps
+    next_frame = time.monotonic()
+    last_snapshot = 0.0
+    received = 0
+    try:
+        while headless or plt.fignum_exists(fig.number):
+            for rows in source.poll(next_frame - time.monotonic()):
+                if buf is None or buf.data.shape[1] != rows.shape[1]:
+                    # (Re)start when the number of states changes, e.g. a new replay
+                    buf = RingBuffer(capacity, rows.shape[1])
+                    labels = ans_labels[:rows.shape[1] - 1]
+                    labels += [f"x{i}" for i in range(len(labels), rows.shape[1] - 1)]
+                    ax.cla()
+                    _reset_axes(ax)
+                    lines = [ax.plot([], [], label=lbl, linewidth=1)[0] for lbl in labels]
+                    ax.legend(loc="upper left")
+                elif buf.count and rows[0, 0] < buf.data[(buf.head - 1) % capacity, 0]:
+                    buf.count = buf.head = 0  # time went backwards: replay restarted
+                buf.extend(rows)
+                received += rows.shape[0]
+            if source.closed and buf is None:
+                break
+            now = time.monotonic()
+            if now < next_frame:
+                continue
+            next_frame = now + frame_dt
+            if buf is None or buf.count == 0:
+                if not headless:
+                    plt.pause(0.001)
+                continue
+            data = buf.ordered()
+            t = data[:, 0]
+            for i, line in enumerate(lines):
+                line.set_data(*decimate_minmax(t, data[:, i + 1], width_px))
+            ax.relim()
+            ax.autoscale_view()
+            ax.set_title(f"t = {t[-1]:.2f} s")
+            if headless:
+                if now - last_snapshot >= args.snapshot_every:
+                    tmp = snapshot.with_suffix(".tmp.png")
+                    fig.savefig(tmp, dpi=args.dpi)
+                    tmp.replace(snapshot)  # viewers never see a half-written PNG
+                    last_snapshot = now
+            else:
+                fig.canvas.draw_idle()
+                fig.canvas.flush_events()
+            if source.closed:
+                break
+    except KeyboardInterrupt:
+        pass
+    if headless and buf is not None and buf.count:
+        fig.savefig(snapshot, dpi=args.dpi)
+    logging.info("Done. Received %d sample(s)%s.", received,
+                 f", dropped {source.dropped} malformed packet(s)" if source.dropped else "")
+
+
+def replay_rows(ans_labels: List[str], mat_path: Path) -> np.ndarray:
+    data = load_candidates(mat_path)
+    if data is None:
+        raise SystemExit(f"Cannot read {mat_path}")
+    t, Y, labels, _ = detect_layout(data, mat_path.name, ans_labels)
+    if t is None:
+        raise SystemExit(f"No state layout found in {mat_path}")
+    logging.info("Replaying %s: %d samples of %s", mat_path.name, t.size, ", ".join(labels))
+    return np.column_stack((t, np.asarray(Y).T))
+
+
+def paced(rows: np.ndarray, batch: int, speed: float, loop: bool) -> Iterator[np.ndarray]:
+    """Yield `batch`-row slices no earlier than their (scaled) log time."""
+    while True:
+        start = time.monotonic()
+        t0 = rows[0, 0]
+        for i in range(0, rows.shape[0], batch):
+            chunk = rows[i:i + batch]
+            delay = (chunk[0, 0] - t0) / speed - (time.monotonic() - start)
+            if delay > 0:
+                time.sleep(delay)
+            yield chunk
+        if not loop:
+            return
+
+
+def replay(args: argparse.Namespace) -> None:
+    mat_path = args.mat.resolve()
+    profile_dir = mat_path.parent if (mat_path.parent / "helilab.json").exists() else Path(args.lab)
+    rows = replay_rows(load_profile(profile_dir)["labels"], mat_path)
+    # Keep each datagram under the UDP limit
+    batch = min(args.batch, (MAX_DATAGRAM - HEADER.size) // (8 * rows.shape[1]))
+    if args.pipe:
+        out = sys.stdout.buffer
+        send = out.write
+    else:
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        addr = parse_addr(args.udp)
+        send = lambda pkt: sock.sendto(pkt, addr)  # noqa: E731
+    sent = 0
+    try:
+        for chunk in paced(rows, batch, args.speed, args.loop):
+            send(encode_packet(chunk))
+            sent += chunk.shape[0]
+        if args.pipe:
+            out.flush()
+    except (KeyboardInterrupt, BrokenPipeError):
+        pass
+    logging.info("Done. Sent %d sample(s).", sent)
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Live state plots from a UDP/pipe stream, and a .mat replayer.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    def add_transport(p: argparse.ArgumentParser) -> None:
+        p.add_argument("--udp", default=DEFAULT_ADDR, help=f"host:port (default {DEFAULT_ADDR})")
+        p.add_argument("--pipe", action="store_true", help="Use stdin/stdout instead of UDP")
+        p.add_argument("--lab", default="lab3", help="Lab folder whose helilab.json labels to use (default lab3)")
+
+    p_v = sub.add_parser("view", help="Plot the incoming stream live")
+    add_transport(p_v)
+    p_v.add_argument("--window", type=float, default=30.0, help="Seconds of history to keep (default 30)")
+    p_v.add_argument("--rate", type=float, default=SAMPLE_RATE, help="Stream sample rate in Hz (default 500)")
+    p_v.add_argument("--fps", type=float, default=20.0, help="Max redraws per second (default 20)")
+    p_v.add_argument("--figsize", type=lambda s: tuple(float(v) for v in s.split(",")), default=(14.0, 6.0),
+                     help="Figure size as W,H in inches (default 14,6)")
+    p_v.add_argument("--dpi", type=int, default=100, help="Snapshot DPI (default 100)")
+    p_v.add_argument("--snapshot", type=Path, default=None,
+                     help="Force headless mode and write PNG snapshots here (default live.png when headless)")
+    p_v.add_argument("--snapshot-every", type=float, default=1.0, help="Seconds between snapshots (default 1)")
+
+    p_r = sub.add_parser("replay", help="Stream a logged .mat in real time (QuaRC stand-in)")
+    add_transport(p_r)
+    p_r.add_argument("mat", type=Path, help="Logged run to replay")
+    p_r.add_argument("--speed", type=float, default=1.0, help="Playback speed factor (default 1)")
+    p_r.add_argument("--batch", type=int, default=10, help="Samples per packet (default 10, i.e. 50 packets/s)")
+    p_r.add_argument("--loop", action="store_true", help="Start over at the end of the log")
+    args = parser.parse_args(argv)
+
+    # Logs go to stderr so `replay --pipe` keeps stdout binary
+    logging.basicConfig(level=logging.INFO, format="%(levelname)s: %(message)s", stream=sys.stderr)
+
+    if args.command == "view":
+        view(args)
+    else:
+        replay(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,226 @@
+#!/usr/bin/env python3
+"""Batched closed-loop step responses of the lab 2 / lab 4 LQR for many Q, R weights.
+
+- Model of init_heli_3_10.m (see helilab.model.lqr_model): the integral-augmented
+  x = [pitch, pitch_dot, elevation_dot, gamma, zeta] with
+    x' = A x + B u + G r,   r = [pitch_c, elevation_dot_c],   u = [Vs, Vd]
+  and the controller u = F r - K x, K = lqr(A, B, Q, R). F holds K's pitch and
+  elevation_dot columns, so the loop also tracks r without the integrators.
+- Candidates: every --q diagonal (default the script's Q) times every --q-scale
+  factor, paired with every --r diagonal (default the script's R), plus --random
+  sets drawn log-uniformly within a factor --spread of the first --q and --r.
+- The Riccati equation is solved per candidate; the closed loops are discretised
+  with one batched zero-order hold and propagated together as one
+  (candidates, 5, 2) state array: a --pitch-step and an --rate-step experiment
+  side by side. --jobs splits the candidates over processes.
+- Each response is scored with helilab-metrics' step-response metrics (rise time,
+  overshoot, settling time within --band) plus the steady-state error and the
+  peak |Vs|, |Vd|. Candidates are ranked by --rank, averaged over both
+  responses; candidates beyond --max-overshoot or --max-input rank last.
+
+Examples (PowerShell):
+  helilab-lqr                                            # the script's Q and R
+  helilab-lqr --q-scale 1e-2:1e2:41 --random 2000 --jobs 0
+  helilab-lqr --q=40,40,40,1,30 --r=10,10 --r=1,1 --rank rise_time --max-overshoot 5 --out lqr.csv
+"""
+from __future__ import annotations
+
+from pathlib import Path
+import argparse
+import csv
+import logging
+import os
+import time
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from helilab import model
+from helilab.kalman import parse_qscale
+from helilab.metrics import response_metrics
+
+BATCH = 256                       # candidates propagated together inside a worker
+OUTPUTS = ("pitch", "elevation_dot")
+RESPONSE = ("rise_time", "overshoot_pct", "settling_time", "ss_error")
+RANKS = ("settling_time", "rise_time", "overshoot_pct", "peak_input")
+
+
+def parse_diagonals(specs: List[str], size: int, default: List[float], option: str) -> np.ndarray:
+    """(sets, size) array of the comma-separated diagonals given to --q / --r."""
+    diags = [[float(x) for x in spec.split(",")] for spec in specs] or [default]
+    if any(len(d) != size for d in diags):
+        raise SystemExit(f"{option} needs {size} comma-separated values")
+    if np.any(np.array(diags) <= 0):
+        raise SystemExit(f"{option} needs positive values")
+    return np.array(diags)
+
+
+def candidates(q: np.ndarray, r: np.ndarray, scale: np.ndarray, n_random: int, spread: float,
+               seed: int) -> Tuple[np.ndarray, np.ndarray]:
+    """(Q[sets, 5], R[sets, 2]) diagonals: every q * scale with every r, then the random sets."""
+    Q = (scale[:, None, None] * q[None]).reshape(-1, 5)
+    Qs, Rs = np.repeat(Q, len(r), axis=0), np.tile(r, (len(Q), 1))
+    if n_random:
+        rng = np.random.default_rng(seed)
+        f = np.exp(rng.uniform(-np.log(spread), np.log(spread), size=(n_random, 7)))
+        Qs = np.vstack([Qs, q[0] * f[:, :5]])
+        Rs = np.vstack([Rs, r[0] * f[:, 5:]])
+    return Qs, Rs
+
+
+def lqr_gains(Q: np.ndarray, R: np.ndarray, gains: Tuple[float, float, float]) -> np.ndarray:
+    """K[sets, 2, 5] = R^-1 B' P of every candidate, as MATLAB's lqr()."""
+    from scipy.linalg import solve_continuous_are
+
+    A, B, _ = model.lqr_model(*gains[:2])
+    K = np.empty((len(Q), 2, 5))
+    for i, (q, r) in enumerate(zip(Q, R)):
+        P = solve_continuous_are(A, B, np.diag(q), np.diag(r))
+        K[i] = (B.T @ P) / r[:, None]
+    return K
+
+
+def simulate(K: np.ndarray, gains: Tuple[float, float, float], steps: np.ndarray, n: int,
+             dt: float) -> Tuple[np.ndarray, np.ndarray]:
+    """(y[sets, 2, n + 1], peak_u[sets, 2]) of the two step experiments from x = 0.
+
+    Experiment e steps reference e by steps[e]; y[:, e] is the output it tracks
+    (pitch, elevation_dot) and peak_u the largest |Vs|, |Vd| over both experiments.
+    """
+    A, B, G = model.lqr_model(*gains[:2])
+    F = K[:, :, [0, 2]]
+    Rm = np.diag(steps)                      # column e is the reference of experiment e
+    Ad, Bd = model.c2d(A - B @ K, B @ F + G, dt)
+    drive = Bd @ Rm                          # (sets, 5, 2), constant over the step
+    Fr = F @ Rm
+    out, exp = [0, 2], [0, 1]
+    x = np.zeros((len(K), 5, 2))
+    y = np.empty((n + 1, len(K), 2))
+    y[0] = 0.0
+    peak = np.abs(Fr).max(axis=2)
+    for k in range(1, n + 1):
+        x = Ad @ x + drive
+        y[k] = x[:, out, exp]
+        np.maximum(peak, np.abs(Fr - K @ x).max(axis=2), out=peak)
+    return y.transpose(1, 2, 0), peak
+
+
+def score_batch(Q: np.ndarray, R: np.ndarray, gains: Tuple[float, float, float], steps: np.ndarray,
+                horizon: float, dt: float, band: float) -> Dict[str, np.ndarray]:
+    """K and the step-response metrics of every candidate, one BATCH at a time."""
+    n = int(round(horizon / dt))
+    t = np.arange(n + 1) * dt
+    parts = []
+    for b0 in range(0, len(Q), BATCH):
+        K = lqr_gains(Q[b0:b0 + BATCH], R[b0:b0 + BATCH], gains)
+        y, peak = simulate(K, gains, steps, n, dt)
+        S = len(K)
+        Z = (y / steps[None, :, None]).reshape(2 * S, n + 1)
+        m = response_metrics(np.broadcast_to(t, Z.shape), Z, np.ones(Z.shape, dtype=bool), band)
+        part = {"K": K, "peak_Vs": peak[:, 0], "peak_Vd": peak[:, 1]}
+        for key in RESPONSE[:-1]:
+            part.update({f"{o}_{key}": v for o, v in zip(OUTPUTS, m[key].reshape(S, 2).T)})
+        part.update({f"{o}_ss_error": y[:, e, -1] - steps[e] for e, o in enumerate(OUTPUTS)})
+        parts.append(part)
+    return {key: np.concatenate([p[key] for p in parts]) for key in parts[0]}
+
+
+def sweep(Q: np.ndarray, R: np.ndarray, gains: Tuple[float, float, float], steps: np.ndarray,
+          horizon: float, dt: float, band: float, jobs: int) -> Dict[str, np.ndarray]:
+    """score_batch() over all candidates, split into `jobs` slices on a process pool."""
+    if jobs <= 1 or len(Q) < 2:
+        return score_batch(Q, R, gains, steps, horizon, dt, band)
+    from concurrent.futures import ProcessPoolExecutor
+
+    bounds = np.linspace(0, len(Q), min(jobs, len(Q)) + 1).astype(int)
+    n = len(bounds) - 1
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        parts = list(pool.map(score_batch, [Q[a:b] for a, b in zip(bounds, bounds[1:])],
+                              [R[a:b] for a, b in zip(bounds, bounds[1:])], [gains] * n, [steps] * n,
+                              [horizon] * n, [dt] * n, [band] * n))
+    return {key: np.concatenate([p[key] for p in parts]) for key in parts[0]}
+
+
+def ranking_score(res: Dict[str, np.ndarray], rank: str, max_overshoot: Optional[float],
+                  max_input: Optional[float]) -> np.ndarray:
+    """Lower is better; never-settling responses and rejected candidates score inf."""
+    peak = np.maximum(res["peak_Vs"], res["peak_Vd"])
+    if rank == "peak_input":
+        score = peak.copy()
+    else:
+        score = np.mean([res[f"{o}_{rank}"] for o in OUTPUTS], axis=0)
+    score[np.isnan(score)] = np.inf
+    if max_overshoot is not None:
+        score[np.max([res[f"{o}_overshoot_pct"] for o in OUTPUTS], axis=0) > max_overshoot] = np.inf
+    if max_input is not None:
+        score[peak > max_input] = np.inf
+    return score
+
+
+def _join(values: np.ndarray) -> str:
+    return ";".join(f"{v:.6g}" for v in values)
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Closed-loop step responses of the lab 2 LQR for many Q, R weights.")
+    parser.add_argument("--q", action="append", default=[],
+                        help="Five comma-separated Q diagonal entries, e.g. --q=40,40,40,1,30; repeatable (default: the script's Q)")
+    parser.add_argument("--r", action="append", default=[],
+                        help="Two comma-separated R diagonal entries, e.g. --r=10,10; repeatable (default: the script's R)")
+    parser.add_argument("--q-scale", default="1", help='Factor(s) applied to every --q: "10" or log-spaced "START:STOP:COUNT"')
+    parser.add_argument("--random", type=int, default=0, help="Also try this many random Q, R pairs")
+    parser.add_argument("--spread", type=float, default=100.0,
+                        help="Random entries lie within this factor of the first --q / --r (default 100)")
+    parser.add_argument("--seed", type=int, default=0, help="Seed for --random (default 0)")
+    parser.add_argument("--gains", default=None,
+                        help="K_1,K_2,K_3 to use instead of the script's nominal gains (K_3 is not used)")
+    parser.add_argument("--pitch-step", type=float, default=0.2, help="pitch_c step in rad (default 0.2)")
+    parser.add_argument("--rate-step", type=float, default=0.1, help="elevation_dot_c step in rad/s (default 0.1)")
+    parser.add_argument("--horizon", type=float, default=30.0, help="Simulated seconds after the step (default 30)")
+    parser.add_argument("--dt", type=float, default=model.T, help=f"Simulation step in s (default {model.T})")
+    parser.add_argument("--band", type=float, default=0.02, help="Settling band, fraction of the step (default 0.02)")
+    parser.add_argument("--rank", choices=RANKS, default="settling_time",
+                        help="Metric the candidates are ranked by (default settling_time)")
+    parser.add_argument("--max-overshoot", type=float, default=None, help="Rank candidates above this overshoot (%%) last")
+    parser.add_argument("--max-input", type=float, default=None, help="Rank candidates needing more than this |Vs|, |Vd| last")
+    parser.add_argument("--jobs", type=int, default=1, help="Worker processes (default 1, 0 = one per CPU)")
+    parser.add_argument("--top", type=int, default=5, help="Candidates listed in the log (default 5)")
+    parser.add_argument("--out", type=Path, default=Path("lqr_sweep.csv"), help="CSV output, best first (default lqr_sweep.csv)")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(levelname)s: %(message)s")
+    gains = model.parse_gains(args.gains)
+    q = parse_diagonals(args.q, 5, model.LQR_Q, "--q")
+    r = parse_diagonals(args.r, 2, model.LQR_R, "--r")
+    Q, R = candidates(q, r, parse_qscale(args.q_scale), args.random, args.spread, args.seed)
+    steps = np.array([args.pitch_step, args.rate_step])
+    if np.any(steps == 0):
+        raise SystemExit("--pitch-step and --rate-step must be non-zero")
+
+    t0 = time.perf_counter()
+    jobs = args.jobs if args.jobs > 0 else (os.cpu_count() or 1)
+    res = sweep(Q, R, gains, steps, args.horizon, args.dt, args.band, jobs)
+    logging.info("Simulated %d candidate(s) over %.3g s in %.2f s", len(Q), args.horizon, time.perf_counter() - t0)
+
+    score = ranking_score(res, args.rank, args.max_overshoot, args.max_input)
+    order = np.argsort(score, kind="stable")
+    metrics = [f"{o}_{key}" for o in OUTPUTS for key in RESPONSE] + ["peak_Vs", "peak_Vd"]
+    with open(args.out, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["rank", "candidate", "q", "r", "K", "score"] + metrics)
+        for rank, i in enumerate(order, 1):
+            writer.writerow([rank, i, _join(Q[i]), _join(R[i]), _join(res["K"][i].ravel()), f"{score[i]:.6g}"]
+                            + ["" if np.isnan(res[key][i]) else f"{res[key][i]:.6g}" for key in metrics])
+
+    logging.info("Best candidates by %s:", args.rank)
+    for i in order[:args.top]:
+        logging.info("  Q=[%s] R=[%s]  score %.4g  pitch %.3g s / %.1f %%  elevation_dot %.3g s / %.1f %%  |u| %.3g V",
+                     _join(Q[i]).replace(";", ", "), _join(R[i]).replace(";", ", "), score[i],
+                     res["pitch_settling_time"][i], res["pitch_overshoot_pct"][i],
+                     res["elevation_dot_settling_time"][i], res["elevation_dot_overshoot_pct"][i],
+                     max(res["peak_Vs"][i], res["peak_Vd"][i]))
+    logging.info("Done. Wrote %s", args.out)
+
+
+if __name__ == "__main__":
+    main()
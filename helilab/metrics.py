@@ -0,0 +1,220 @@
+#!/usr/bin/env python3
+"""Step-response metrics for every state of every run, as one table.
+
+- The logs hold states only, no reference signal, so reference steps are found in
+  the states themselves: for every sample the mean of the next --window seconds
+  minus the mean of the previous --window seconds, computed for all states at
+  once from a cumulative sum. Local maxima of its magnitude above --min-step times
+  the state's 1..99 percentile range are steps.
+- Each step's response runs until the next step of that state (or --horizon
+  seconds). The initial level is the mean of the window before the step and the
+  final level is the mean of the last window of the response.
+- All steps of a run are measured together on one padded (steps, samples) array:
+    rise_time       10 % -> 90 % of the change
+    overshoot_pct   peak beyond the final level, in % of the change
+    settling_time   from response onset (first exit from the --band) until it
+                    stays within --band of the final level; empty if it never does
+    ss_error        final level minus --reference for that state; empty without one
+- Runs are read through each folder's parsed-log cache (.plotcache), like helilab-plot.
+- Writes CSV, or Parquet when --out ends in .parquet (needs pyarrow).
+
+Examples (PowerShell):
+  helilab-metrics lab1 lab2 lab3 lab4                 # -> step_metrics.csv
+  helilab-metrics lab2 --reference elevation=0 --reference pitch=0 --out lab2_steps.parquet
+  helilab-metrics lab* --window 0.5 --min-step 0.2 --band 0.05
+"""
+from __future__ import annotations
+
+from pathlib import Path
+import argparse
+import csv
+import logging
+import time
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from helilab.plot import load_profile, load_run, resolve_dirs
+
+COLUMNS = ("lab", "run", "state", "step", "t_step", "initial", "final", "delta",
+           "rise_time", "overshoot_pct", "settling_time", "ss_error")
+
+
+def moving_step(Y: np.ndarray, w: int) -> np.ndarray:
+    """d[:, k] = mean(Y[:, k:k+w]) - mean(Y[:, k-w:k]) for w <= k <= N-w; 0 elsewhere."""
+    ns, N = Y.shape
+    c = np.zeros((ns, N + 1))
+    np.cumsum(Y, axis=1, out=c[:, 1:])
+    d = np.zeros((ns, N))
+    k = np.arange(w, N - w + 1)
+    d[:, k] = (c[:, k + w] - 2.0 * c[:, k] + c[:, k - w]) / w
+    return d
+
+
+def detect_steps(Y: np.ndarray, w: int, min_step: float) -> tuple[np.ndarray, np.ndarray]:
+    """(state index, sample index) of every detected step, sorted by state then time."""
+    from scipy.ndimage import maximum_filter1d
+
+    lo, hi = np.percentile(Y, [1, 99], axis=1)
+    thr = min_step * (hi - lo)
+    a = np.abs(moving_step(Y, w))
+    peak = maximum_filter1d(a, size=2 * w + 1, axis=1, mode="constant")
+    s, k = np.nonzero((a >= peak) & (a > thr[:, None]) & (thr[:, None] > 0))
+    # A flat top gives several equal maxima; keep the first of each cluster
+    keep = np.ones(s.size, dtype=bool)
+    keep[1:] = (s[1:] != s[:-1]) | (np.diff(k) > w)
+    return s[keep], k[keep]
+
+
+def _first(mask: np.ndarray) -> np.ndarray:
+    """Index of the first True per row, -1 where there is none."""
+    return np.where(mask.any(axis=1), mask.argmax(axis=1), -1)
+
+
+def step_metrics(t: np.ndarray, Y: np.ndarray, w: int, horizon: int, min_step: float,
+                 band: float) -> Dict[str, np.ndarray]:
+    """Metrics of every step of one run; each value is an array with one entry per step."""
+    N = t.size
+    s, k = detect_steps(Y, w, min_step)
+    c = np.zeros((Y.shape[0], N + 1))
+    np.cumsum(Y, axis=1, out=c[:, 1:])
+
+    start = np.maximum(k - w, 0)
+    nxt = np.full(k.size, N)
+    same = s[1:] == s[:-1]
+    nxt[:-1][same] = k[1:][same] - w
+    end = np.minimum(nxt, k + horizon)
+    p0 = np.maximum(k - 2 * w, 0)
+    p1 = np.maximum(start, p0 + 1)
+    initial = (c[s, p1] - c[s, p0]) / (p1 - p0)
+    f0 = np.maximum(end - w, k)
+    final = (c[s, end] - c[s, f0]) / np.maximum(end - f0, 1)
+    delta = final - initial
+    ok = (end - start > 2 * w) & (np.abs(delta) > 0)
+    s, start, end, initial, final, delta = s[ok], start[ok], end[ok], initial[ok], final[ok], delta[ok]
+    if s.size == 0:
+        return {name: np.empty(0) for name in ("state", "t_step", "initial", "final", "delta",
+                                                "rise_time", "overshoot_pct", "settling_time")}
+
+    # Responses side by side, padded to the longest and normalised to 0 -> 1
+    L = int((end - start).max())
+    idx = start[:, None] + np.arange(L)
+    valid = idx < end[:, None]
+    idx = np.minimum(idx, N - 1)
+    Z = (Y[s[:, None], idx] - initial[:, None]) / delta[:, None]
+    m = response_metrics(t[idx], Z, valid, band)
+    return {"state": s, "initial": initial, "final": final, "delta": delta, **m}
+
+
+def response_metrics(T: np.ndarray, Z: np.ndarray, valid: np.ndarray, band: float) -> Dict[str, np.ndarray]:
+    """t_step, rise_time, overshoot_pct and settling_time of responses normalised to 0 -> 1.
+
+    Z[responses, samples] at times T of the same shape (a broadcast view is fine);
+    valid marks the samples that belong to each response, a prefix of every row.
+    t_step is the response onset, the first exit from the band around 0.
+    """
+    L = Z.shape[1]
+    rows = np.arange(Z.shape[0])
+    onset = np.maximum(_first(valid & (Z > band)), 0)
+    t_step = T[rows, onset]
+    i10, i90 = _first(valid & (Z >= 0.1)), _first(valid & (Z >= 0.9))
+    rise = np.where((i10 >= 0) & (i90 >= 0), T[rows, i90] - T[rows, i10], np.nan)
+    overshoot = 100.0 * np.maximum(np.where(valid, Z, -np.inf).max(axis=1) - 1.0, 0.0)
+    outside = valid & (np.abs(Z - 1.0) > band)
+    last = L - 1 - outside[:, ::-1].argmax(axis=1)
+    settled_at = np.where(outside.any(axis=1), last + 1, onset)
+    settling = np.where(settled_at < valid.sum(axis=1), T[rows, np.minimum(settled_at, L - 1)] - t_step, np.nan)
+    return {"t_step": t_step, "rise_time": rise, "overshoot_pct": overshoot, "settling_time": settling}
+
+
+def parse_references(specs: List[str]) -> Dict[str, float]:
+    """["elevation=0", "pitch=0.1"] -> {"elevation": 0.0, "pitch": 0.1}"""
+    refs = {}
+    for spec in specs:
+        name, sep, value = spec.partition("=")
+        if not sep:
+            raise SystemExit(f"--reference expects STATE=VALUE, got {spec!r}")
+        refs[name.strip().lower()] = float(value)
+    return refs
+
+
+def write_table(columns: Dict[str, list], out: Path) -> None:
+    if out.suffix == ".parquet":
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        pq.write_table(pa.table(columns), out)
+        return
+    with open(out, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(COLUMNS)
+        for row in zip(*(columns[name] for name in COLUMNS)):
+            writer.writerow(["" if isinstance(v, float) and np.isnan(v) else
+                             f"{v:.6g}" if isinstance(v, float) else v for v in row])
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Step-response metrics for every state of every run.")
+    parser.add_argument("dirs", nargs="*",
+                        help="Folders with .mat logs; patterns like lab* are expanded (default: current folder)")
+    parser.add_argument("--window", type=float, default=1.0,
+                        help="Seconds averaged on each side of a step, and for the final level (default 1.0)")
+    parser.add_argument("--min-step", type=float, default=0.15,
+                        help="Smallest step, as a fraction of the state's 1..99 percentile range (default 0.15)")
+    parser.add_argument("--horizon", type=float, default=30.0, help="Longest response measured, in seconds (default 30)")
+    parser.add_argument("--band", type=float, default=0.02, help="Settling band, fraction of the change (default 0.02)")
+    parser.add_argument("--reference", action="append", default=[],
+                        help="STATE=VALUE reference for the steady-state error, e.g. elevation=0; repeatable")
+    parser.add_argument("--no-cache", action="store_true", help="Do not read or write the parsed-log cache")
+    parser.add_argument("--out", type=Path, default=Path("step_metrics.csv"),
+                        help="Output table, .csv or .parquet (default step_metrics.csv)")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(levelname)s: %(message)s")
+    refs = parse_references(args.reference)
+
+    t_start = time.perf_counter()
+    columns: Dict[str, list] = {name: [] for name in COLUMNS}
+    n_runs = 0
+    for folder in resolve_dirs(args.dirs):
+        ans_labels = load_profile(folder)["labels"]
+        cache_dir = None if args.no_cache else folder / ".plotcache"
+        for mat_path in sorted(folder.glob("*.mat")):
+            try:
+                t, Y, labels = load_run(mat_path, ans_labels, cache_dir)
+            except Exception as e:
+                logging.warning("Failed to load %s: %s", mat_path.name, e)
+                continue
+            if t is None:
+                logging.info("Skipping %s (no state layout found).", mat_path.name)
+                continue
+            dt = float(np.median(np.diff(t)))
+            w = max(1, int(round(args.window / dt)))
+            if t.size < 4 * w:
+                logging.info("Skipping %s (shorter than four --window).", mat_path.name)
+                continue
+            m = step_metrics(t, np.asarray(Y, dtype=np.float64), w, int(round(args.horizon / dt)),
+                             args.min_step, args.band)
+            n_runs += 1
+            names = [labels[i] for i in m["state"]]
+            counts: Dict[str, int] = {}
+            for j, name in enumerate(names):
+                counts[name] = counts.get(name, 0) + 1
+                ref = refs.get(name.lower())
+                columns["lab"].append(folder.name)
+                columns["run"].append(mat_path.stem)
+                columns["state"].append(name)
+                columns["step"].append(counts[name])
+                for key in COLUMNS[4:-1]:
+                    columns[key].append(float(m[key][j]))
+                columns["ss_error"].append(float(m["final"][j] - ref) if ref is not None else float("nan"))
+            logging.info("%s/%s: %d step(s)", folder.name, mat_path.stem, len(names))
+    if n_runs == 0:
+        raise SystemExit("No runs found.")
+    write_table(columns, args.out)
+    logging.info("Done. %d step(s) in %d run(s) in %.2f s -> %s",
+                 len(columns["lab"]), n_runs, time.perf_counter() - t_start, args.out)
+
+
+if __name__ == "__main__":
+    main()
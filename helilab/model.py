@@ -0,0 +1,118 @@
+"""Helicopter model of init_heli_3_10.m (helicopter 3-10) for the offline analysis commands.
+
+- Physical constants and derived gains keep the names and formulas of the lab's
+  init script, so the two can be compared line by line.
+- The state-space builders take the gains as arguments (defaulting to the
+  nominal values) so identified gains can be dropped in.
+- c2d() is the zero-order-hold discretisation of MATLAB's c2d(sys, T, 'zoh').
+"""
+from __future__ import annotations
+
+from typing import Optional, Tuple
+
+import numpy as np
+
+# Physical constants
+g = 9.81     # gravitational constant [m/s^2]
+l_c = 0.46   # distance elevation axis to counterweight [m]
+l_h = 0.66   # distance elevation axis to helicopter head [m]
+l_p = 0.175  # distance pitch axis to motor [m]
+m_c = 1.92   # counterweight mass [kg]
+m_p = 0.72   # motor mass [kg]
+
+K_f = ((2 * m_p * l_h - m_c * l_c) * g) / (7.5 * l_h)
+L_3 = l_h * K_f
+J_e = m_c * l_c**2 + 2 * m_p * l_h**2
+K_1 = K_f / (2 * m_p * l_p)
+K_2 = L_3 / J_e
+
+L_2 = (2 * m_p * l_h * g) - (m_c * l_c * g)
+Vs_0 = -L_2 / L_3
+L_4 = l_h * K_f
+J_l = m_c * l_c**2 + 2 * m_p * (l_h**2 + l_p**2)
+K_3 = (L_4 * Vs_0) / J_l
+
+T = 0.002  # sample time of the QuaRC model [s]
+
+# Lab 3 observer: x = [pitch, pitch_dot, elevation, elevation_dot, lambda_dot], u = [Vs, Vd]
+OBSERVER_POLES = [-3.0, -6.0, -3.0, -10.0, -2.0]
+
+
+def observer_model(k1: float = K_1, k2: float = K_2, k3: float = K_3) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """(A_e, B_e, C_e) of lab 3; the measurements are elevation and lambda_dot."""
+    A_e = np.array([[0, 1, 0, 0, 0],
+                    [0, 0, 0, 0, 0],
+                    [0, 0, 0, 1, 0],
+                    [0, 0, 0, 0, 0],
+                    [k3, 0, 0, 0, 0]], dtype=np.float64)
+    B_e = np.array([[0, 0], [0, k1], [0, 0], [k2, 0], [0, 0]], dtype=np.float64)
+    C_e = np.array([[0, 0, 1, 0, 0], [0, 0, 0, 0, 1]], dtype=np.float64)
+    return A_e, B_e, C_e
+
+
+# Lab 4 Kalman filter: x = [pitch, pitch_dot, elevation, elevation_dot, lambda, lambda_dot]
+STATE_NAMES = ("pitch", "pitch_dot", "elevation", "elevation_dot", "lambda", "lambda_dot")
+QD_NOMINAL = [1e-5, 1e-3, 1e-5, 1e-3, 1e-5, 1e-3]  # diagonal of Qd
+
+
+def kalman_model(k1: float = K_1, k2: float = K_2, k3: float = K_3) -> Tuple[np.ndarray, np.ndarray]:
+    """Continuous (A, B) of lab 4 over STATE_NAMES, u = [Vs, Vd]."""
+    A = np.zeros((6, 6))
+    A[0, 1] = A[2, 3] = A[4, 5] = 1.0
+    A[5, 0] = k3
+    B = np.zeros((6, 2))
+    B[1, 1], B[3, 0] = k1, k2
+    return A, B
+
+
+# Lab 2 LQR with integral action: x = [pitch, pitch_dot, elevation_dot, gamma, zeta],
+# r = [pitch_c, elevation_dot_c]; gamma and zeta integrate the tracking errors
+LQR_STATES = ("pitch", "pitch_dot", "elevation_dot", "gamma", "zeta")
+LQR_Q = [40.0, 40.0, 40.0, 1.0, 30.0]  # diagonal of Q
+LQR_R = [10.0, 10.0]                   # diagonal of R
+
+
+def lqr_model(k1: float = K_1, k2: float = K_2) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Integral-augmented (A, B, G) of lab 2 and lab 4: x' = A x + B u + G r."""
+    A = np.zeros((5, 5))
+    A[0, 1] = 1.0
+    A[3, 0] = A[4, 2] = -1.0
+    B = np.zeros((5, 2))
+    B[1, 1], B[2, 0] = k1, k2
+    G = np.zeros((5, 2))
+    G[3, 0] = G[4, 1] = 1.0
+    return A, B, G
+
+
+def rebuild_inputs(t: np.ndarray, pitch_dot: np.ndarray, elevation_dot: np.ndarray,
+                   k1: float = K_1, k2: float = K_2) -> np.ndarray:
+    """(N, 2) inputs [Vs, Vd] inverted from the model: Vs = elevation_dot' / K_2, Vd = pitch_dot' / K_1.
+
+    The logs do not record the motor voltages; this is the input the model needs
+    to reproduce the logged rates.
+    """
+    return np.column_stack([np.gradient(elevation_dot, t) / k2, np.gradient(pitch_dot, t) / k1])
+
+
+def parse_gains(spec: Optional[str]) -> Tuple[float, float, float]:
+    """"K_1,K_2,K_3" from a --gains option; the nominal gains for None."""
+    if spec is None:
+        return K_1, K_2, K_3
+    gains = tuple(float(x) for x in spec.split(","))
+    if len(gains) != 3:
+        raise SystemExit("--gains needs K_1,K_2,K_3")
+    return gains
+
+
+def c2d(A: np.ndarray, B: np.ndarray, dt: float) -> Tuple[np.ndarray, np.ndarray]:
+    """Zero-order-hold (Ad, Bd): the exponential of [[A, B], [0, 0]] * dt, as c2d(..., 'zoh').
+
+    A[..., n, n] and B[..., n, m] may carry leading batch dimensions.
+    """
+    from scipy.linalg import expm
+
+    n, m = B.shape[-2:]
+    M = np.zeros(B.shape[:-2] + (n + m, n + m))
+    M[..., :n, :n], M[..., :n, n:] = A, B
+    E = expm(M * dt)
+    return E[..., :n, :n], E[..., :n, n:]
@@ -0,0 +1,218 @@
+#!/usr/bin/env python3
+"""Measurement-noise covariance and whiteness of stationary logs (ground / hover).
+
+- Python version of lab4/midlertidig.m: every log is detrended by its own mean
+  and its covariance taken with 1/N normalisation (cov(Y, 1)), per run and
+  pooled over each group. Run it on logs where the helicopter holds still.
+- Both passes stream the log in --chunk sample blocks and never hold a full
+  copy: the covariance is a chunked Welford update (Chan et al. merge) and the
+  correlations are exact block sums. Raw logs are memory-mapped and cached logs
+  are read from the memory-mapped cache, so logs larger than memory work.
+- Auto- and cross-correlations of all channel pairs at lags 0..--max-lag come
+  from one FFT per block: conj(F_i) F_j for every pair (i, j) at once.
+- Whiteness per channel: Ljung-Box Q over --max-lag lags with its chi-square
+  p-value, and the fraction of lags outside the 95 % band +-1.96/sqrt(N).
+- Writes <out>.json (covariances, variance ratios between groups, whiteness) and
+  <out>.png (correlation matrix and normalised autocorrelations per group).
+
+Examples (PowerShell):
+  helilab-noise lab4 --group "ground=ground_*" --group "hover=hover_*"
+  helilab-noise lab3 --group "imu=IMU_test_*" --max-lag 250 --out lab3_noise
+"""
+from __future__ import annotations
+
+from pathlib import Path
+import argparse
+import json
+import logging
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from helilab.overlay import parse_group
+from helilab.plot import load_profile, load_run
+
+CHUNK = 1 << 16  # samples per block
+
+
+class StreamingCovariance:
+    """Mean and 1/N covariance of rows of samples, updated one block at a time."""
+
+    def __init__(self, m: int) -> None:
+        self.n = 0
+        self.mean = np.zeros(m)
+        self.m2 = np.zeros((m, m))
+
+    def update(self, X: np.ndarray) -> None:
+        """Merge a (samples, m) block: Welford's update generalised to blocks (Chan et al.)."""
+        nb = X.shape[0]
+        if nb == 0:
+            return
+        mean_b = X.mean(axis=0)
+        D = X - mean_b
+        delta = mean_b - self.mean
+        n = self.n + nb
+        self.m2 += D.T @ D + np.outer(delta, delta) * (self.n * nb / n)
+        self.mean += delta * (nb / n)
+        self.n = n
+
+    @property
+    def cov(self) -> np.ndarray:
+        return self.m2 / max(self.n, 1)
+
+
+def block_correlations(X: np.ndarray, mean: np.ndarray, max_lag: int, chunk: int) -> np.ndarray:
+    """Sums r[l, i, j] = sum_t x_i(t) x_j(t + l) for l = 0..max_lag over the mean-removed X[N, m].
+
+    Each block is correlated with itself plus the next max_lag samples, so the block
+    sums add up to the exact full-length sums.
+    """
+    from scipy.fft import irfft, next_fast_len, rfft
+
+    N, m = X.shape
+    r = np.zeros((max_lag + 1, m, m))
+    for b0 in range(0, N, chunk):
+        a = np.asarray(X[b0:b0 + chunk], dtype=np.float64) - mean
+        seg = np.asarray(X[b0:b0 + chunk + max_lag], dtype=np.float64) - mean
+        nfft = next_fast_len(a.shape[0] + seg.shape[0])
+        Fa, Fs = rfft(a, n=nfft, axis=0), rfft(seg, n=nfft, axis=0)
+        cross = irfft(np.einsum("fi,fj->fij", Fa.conj(), Fs), n=nfft, axis=0)
+        n_lags = min(max_lag + 1, seg.shape[0])  # a short last block has no longer lags
+        r[:n_lags] += cross[:n_lags]
+    return r
+
+
+def whiteness(rho: np.ndarray, n: int) -> Dict[str, np.ndarray]:
+    """Ljung-Box Q, its p-value and the share of lags outside +-1.96/sqrt(n); rho[l, ch] for l = 0..L."""
+    from scipy.stats import chi2
+
+    L = rho.shape[0] - 1
+    lags = np.arange(1, L + 1)
+    q = n * (n + 2) * ((rho[1:] ** 2) / (n - lags)[:, None]).sum(axis=0)
+    return {"ljung_box_q": q, "p_value": chi2.sf(q, L),
+            "outside_95": (np.abs(rho[1:]) > 1.96 / np.sqrt(n)).mean(axis=0)}
+
+
+def analyse_group(runs: List[Tuple[str, np.ndarray]], max_lag: int, chunk: int) -> dict:
+    """Per-run and pooled covariance plus pooled correlations for [(run, Y[m, N])]."""
+    m = runs[0][1].shape[0]
+    pooled_m2, pooled_n = np.zeros((m, m)), 0
+    r = np.zeros((max_lag + 1, m, m))
+    per_run = {}
+    for run, Y in runs:
+        X = Y.T  # (N, m) view
+        acc = StreamingCovariance(m)
+        for b0 in range(0, X.shape[0], chunk):
+            acc.update(np.asarray(X[b0:b0 + chunk], dtype=np.float64))
+        per_run[run] = acc.cov
+        pooled_m2 += acc.m2
+        pooled_n += acc.n
+        r += block_correlations(X, acc.mean, max_lag, chunk)
+    cov = pooled_m2 / pooled_n
+    sd = np.sqrt(np.diag(cov))
+    with np.errstate(invalid="ignore", divide="ignore"):
+        rho = r / pooled_n / np.outer(sd, sd)[None]
+    return {"n": pooled_n, "cov": cov, "per_run": per_run, "rho": rho,
+            "whiteness": whiteness(np.stack([rho[:, i, i] for i in range(m)], axis=1), pooled_n)}
+
+
+def summary_figure(groups: Dict[str, dict], labels: List[str], out_file: Path, dpi: int) -> None:
+    """One row per group: correlation matrix left, normalised autocorrelations right."""
+    import matplotlib
+    matplotlib.use("Agg", force=True)
+    import matplotlib.pyplot as plt
+
+    fig, axes = plt.subplots(len(groups), 2, squeeze=False, figsize=(13, 4.2 * len(groups)),
+                             gridspec_kw={"width_ratios": [1, 2]})
+    for (name, g), (ax_c, ax_r) in zip(groups.items(), axes):
+        sd = np.sqrt(np.diag(g["cov"]))
+        with np.errstate(invalid="ignore", divide="ignore"):
+            corr = g["cov"] / np.outer(sd, sd)
+        im = ax_c.imshow(corr, vmin=-1, vmax=1, cmap="RdBu_r")
+        ax_c.set_xticks(range(len(labels)), labels, rotation=45, ha="right")
+        ax_c.set_yticks(range(len(labels)), labels)
+        ax_c.set_title(f"{name}: correlation (n={g['n']})")
+        fig.colorbar(im, ax=ax_c, fraction=0.046)
+        lags = np.arange(g["rho"].shape[0])
+        for i, lbl in enumerate(labels):
+            ax_r.plot(lags, g["rho"][:, i, i], linewidth=1.2, label=f"{lbl} (p={g['whiteness']['p_value'][i]:.2g})")
+        band = 1.96 / np.sqrt(g["n"])
+        ax_r.axhspan(-band, band, color="0.7", alpha=0.4, linewidth=0)
+        ax_r.set_xlabel("lag [samples]")
+        ax_r.set_ylabel("autocorrelation")
+        ax_r.set_title(f"{name}: normalised autocorrelation, 95 % white-noise band shaded")
+        ax_r.grid(True, linestyle="--", alpha=0.6)
+        ax_r.legend(loc="upper right", fontsize="small")
+    fig.tight_layout()
+    fig.savefig(out_file, dpi=dpi, format="png")
+    plt.close(fig)
+
+
+def _matrix(a: np.ndarray) -> list:
+    return [[float(v) for v in row] for row in a]
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Noise covariance and whiteness of stationary logs.")
+    parser.add_argument("folder", nargs="?", default=".", help="Folder with the .mat logs (default: current folder)")
+    parser.add_argument("--group", action="append", default=[],
+                        help='NAME=PATTERN glob on the file name, e.g. "hover=hover_*"; repeatable (default: all logs)')
+    parser.add_argument("--max-lag", type=int, default=100, help="Largest correlation lag in samples (default 100)")
+    parser.add_argument("--chunk", type=int, default=CHUNK, help=f"Samples per streamed block (default {CHUNK})")
+    parser.add_argument("--dpi", type=int, default=150, help="PNG DPI (default 150)")
+    parser.add_argument("--no-cache", action="store_true", help="Do not read or write the parsed-log cache")
+    parser.add_argument("--out", default="noise_summary", help="Output path without suffix (default noise_summary)")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(levelname)s: %(message)s")
+    folder = Path(args.folder).resolve()
+    ans_labels = load_profile(folder)["labels"]
+    cache_dir = None if args.no_cache else folder / ".plotcache"
+
+    results: Dict[str, dict] = {}
+    labels: Optional[List[str]] = None
+    for name, pattern in [parse_group(g) for g in args.group] or [("all", "*")]:
+        runs = []
+        for mat_path in sorted(folder.glob(pattern + ".mat")):
+            t, Y, run_labels = load_run(mat_path, ans_labels, cache_dir, mmap=True)
+            if t is None:
+                logging.info("Skipping %s (no state layout found).", mat_path.name)
+                continue
+            if labels is not None and run_labels != labels:
+                logging.warning("Skipping %s (channels %s differ from %s)", mat_path.name, run_labels, labels)
+                continue
+            labels = run_labels
+            runs.append((mat_path.stem, Y))
+        if not runs:
+            logging.warning("Group %s: no logs match %r in %s", name, pattern, folder)
+            continue
+        results[name] = analyse_group(runs, args.max_lag, args.chunk)
+        w = results[name]["whiteness"]
+        logging.info("Group %s: %d run(s), %d samples", name, len(runs), results[name]["n"])
+        for i, lbl in enumerate(labels):
+            logging.info("  %-14s var %.3e  Ljung-Box p %.3g  lags outside 95 %% band %.0f %%",
+                         lbl, results[name]["cov"][i, i], w["p_value"][i], 100 * w["outside_95"][i])
+    if not results:
+        raise SystemExit("No logs found.")
+
+    report = {"labels": labels, "max_lag": args.max_lag, "groups": {}}
+    for name, g in results.items():
+        report["groups"][name] = {
+            "samples": g["n"], "cov": _matrix(g["cov"]),
+            "per_run": {run: _matrix(c) for run, c in g["per_run"].items()},
+            "whiteness": {k: [float(v) for v in vals] for k, vals in g["whiteness"].items()},
+            "max_abs_cross_correlation": _matrix(np.nanmax(np.abs(g["rho"]), axis=0)),
+        }
+    names = list(results)
+    if len(names) >= 2:  # like midlertidig.m: variance ratio of the second group to the first
+        a, b = results[names[0]]["cov"], results[names[1]]["cov"]
+        with np.errstate(invalid="ignore", divide="ignore"):
+            report[f"variance_ratio_{names[1]}_{names[0]}"] = [float(v) for v in np.diag(b) / np.diag(a)]
+    json_path, png_path = Path(args.out + ".json"), Path(args.out + ".png")
+    json_path.write_text(json.dumps(report, indent=1))
+    summary_figure(results, labels, png_path, args.dpi)
+    logging.info("Done. Wrote %s and %s", json_path, png_path)
+
+
+if __name__ == "__main__":
+    main()
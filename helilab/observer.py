@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+"""Replay the lab 3 IMU logs through the Luenberger observer for many pole sets.
+
+- Model, gains and default poles are those of lab3/init_heli_3_10.m (see helilab.model):
+  L = place(A_e', C_e', p)' and the observer
+    xhat' = (A_e - L C_e) xhat + B_e u + L y,   y = [elevation, lambda_dot]
+  is discretised once per pole set (zero-order hold at the model's T = 0.002 s).
+- The logs do not contain the inputs [Vs, Vd]. They are rebuilt from the model:
+  Vs = d(elevation_dot)/dt / K_2 and Vd = d(pitch_dot)/dt / K_1 from the IMU rates.
+- --gains replaces the nominal K_1, K_2, K_3. The recorded lab 3 logs fit
+  d(lambda_dot)/dt = +0.5..0.7 * pitch, while the script's K_3 is -0.61.
+- Pole sets: every --poles list times every --scale factor (the script's `skalar`),
+  plus --random sets drawn from --pole-range. All sets are propagated together as
+  one (sets, 5) state array; --jobs splits the sets over processes.
+- Each IMU_test_N.mat is paired with Estimat_test_N.mat. For every pole set and run
+  the RMS error of the replayed estimate is computed against the recorded
+  estimate (est) and against the IMU states (imu).
+- Writes one CSV row per pole set and run, and logs the best pole sets.
+
+Examples (PowerShell):
+  helilab-observer lab3                                     # the script's poles
+  helilab-observer lab3 --scale 0.25:4:64 --jobs 0          # sweep skalar
+  helilab-observer lab3 --poles=-3,-6,-3,-10,-2 --poles=-5,-8,-5,-12,-4 --random 500 --out sweep.csv
+"""
+from __future__ import annotations
+
+from pathlib import Path
+import argparse
+import csv
+import logging
+import os
+import time
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+from helilab import model
+from helilab.plot import load_profile, load_run
+
+BLOCK = 1024  # samples whose input terms are computed in one batched product
+
+
+def parse_scale(spec: str) -> np.ndarray:
+    """"2" -> [2.0]; "0.5:3:26" -> np.linspace(0.5, 3, 26)."""
+    parts = [float(x) for x in spec.split(":")]
+    if len(parts) == 1:
+        return np.array(parts)
+    if len(parts) != 3:
+        raise SystemExit(f"--scale expects VALUE or START:STOP:COUNT, got {spec!r}")
+    return np.linspace(parts[0], parts[1], int(parts[2]))
+
+
+def pole_sets(poles: List[str], scale: str, n_random: int, pole_range: str, seed: int) -> np.ndarray:
+    """(sets, 5) array of observer poles from the command-line options."""
+    base = [[float(x) for x in p.split(",")] for p in poles] or [model.OBSERVER_POLES]
+    if any(len(p) != 5 for p in base):
+        raise SystemExit("--poles needs five comma-separated poles")
+    sets = (parse_scale(scale)[:, None, None] * np.array(base)[None]).reshape(-1, 5)
+    if n_random:
+        lo, hi = sorted(float(x) for x in pole_range.split(","))
+        sets = np.vstack([sets, np.random.default_rng(seed).uniform(lo, hi, size=(n_random, 5))])
+    return sets
+
+
+def observer_matrices(sets: np.ndarray, dt: float,
+                      gains: Tuple[float, float, float] = (model.K_1, model.K_2, model.K_3)) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """(Ad[sets,5,5], Bd[sets,5,4], placed) for inputs w = [Vs, Vd, elevation, lambda_dot].
+
+    placed is False where place_poles failed (e.g. a pole repeated more often than
+    there are measurements); those sets get a NaN system.
+    """
+    from scipy.signal import place_poles
+
+    A, B, C = model.observer_model(*gains)
+    Ad = np.full((len(sets), 5, 5), np.nan)
+    Bd = np.full((len(sets), 5, 4), np.nan)
+    placed = np.zeros(len(sets), dtype=bool)
+    for i, p in enumerate(sets):
+        try:
+            L = place_poles(A.T, C.T, p).gain_matrix.T
+        except (ValueError, np.linalg.LinAlgError) as e:
+            logging.debug("Pole set %s: %s", p, e)
+            continue
+        Ad[i], Bd[i] = model.c2d(A - L @ C, np.hstack([B, L]), dt)
+        placed[i] = True
+    return Ad, Bd, placed
+
+
+def observer_inputs(t: np.ndarray, Y: np.ndarray, k1: float = model.K_1, k2: float = model.K_2) -> np.ndarray:
+    """(N, 4) observer inputs [Vs, Vd, elevation, lambda_dot] from an IMU log Y[5, N]."""
+    pitch_dot, elevation, elevation_dot, lambda_dot = Y[1], Y[2], Y[3], Y[4]
+    return np.column_stack([model.rebuild_inputs(t, pitch_dot, elevation_dot, k1, k2), elevation, lambda_dot])
+
+
+def replay_errors(Ad: np.ndarray, Bd: np.ndarray, W: np.ndarray, refs: List[np.ndarray]) -> np.ndarray:
+    """RMS error of the replayed estimates against each reference; (refs, sets, 5).
+
+    All pole sets advance together; xhat starts at zero like the Simulink observer.
+    refs are (N, 5) arrays on the same samples as W.
+    """
+    P, N = Ad.shape[0], W.shape[0]
+    x = np.zeros((P, 5))
+    sq = np.zeros((len(refs), P, 5))
+    X = np.empty((BLOCK, P, 5))
+    for b0 in range(0, N, BLOCK):
+        b1 = min(b0 + BLOCK, N)
+        drive = np.einsum("pij,nj->npi", Bd, W[b0:b1])
+        for i in range(b1 - b0):
+            X[i] = x
+            x = np.matmul(Ad, x[:, :, None])[:, :, 0] + drive[i]
+        for r, ref in enumerate(refs):
+            sq[r] += ((X[:b1 - b0] - ref[b0:b1, None, :]) ** 2).sum(axis=0)
+    return np.sqrt(sq / N)
+
+
+def _sweep_chunk(Ad: np.ndarray, Bd: np.ndarray, runs: List[tuple]) -> np.ndarray:
+    """(runs, 2, sets, 5) RMS errors of one slice of pole sets, for a worker process."""
+    return np.stack([replay_errors(Ad, Bd, W, [est, imu]) for _, W, est, imu in runs])
+
+
+def sweep(Ad: np.ndarray, Bd: np.ndarray, runs: List[tuple], jobs: int) -> np.ndarray:
+    """_sweep_chunk() over all pole sets, split into `jobs` slices on a process pool."""
+    if jobs <= 1 or len(Ad) < 2:
+        return _sweep_chunk(Ad, Bd, runs)
+    from concurrent.futures import ProcessPoolExecutor
+
+    bounds = np.linspace(0, len(Ad), min(jobs, len(Ad)) + 1).astype(int)
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        parts = list(pool.map(_sweep_chunk, [Ad[a:b] for a, b in zip(bounds, bounds[1:])],
+                              [Bd[a:b] for a, b in zip(bounds, bounds[1:])], [runs] * (len(bounds) - 1)))
+    return np.concatenate(parts, axis=2)
+
+
+def load_pairs(folder: Path, imu_prefix: str, est_prefix: str, cache_dir: Optional[Path],
+               gains: Tuple[float, float, float] = (model.K_1, model.K_2, model.K_3)) -> List[tuple]:
+    """[(run, W, est[N,5], imu[N,5])] for every IMU log with a matching estimate log."""
+    labels = load_profile(folder)["labels"]
+    runs = []
+    for imu_path in sorted(folder.glob(f"{imu_prefix}*.mat")):
+        est_path = folder / (est_prefix + imu_path.name[len(imu_prefix):])
+        if not est_path.exists():
+            logging.info("Skipping %s (no %s)", imu_path.name, est_path.name)
+            continue
+        t, Y, _ = load_run(imu_path, labels, cache_dir)
+        te, E, _ = load_run(est_path, labels, cache_dir)
+        if t is None or te is None or Y.shape[0] != 5 or E.shape != Y.shape:
+            logging.warning("Skipping %s (expected two 5-state logs of equal length)", imu_path.name)
+            continue
+        Y = np.asarray(Y, dtype=np.float64)
+        runs.append((imu_path.stem[len(imu_prefix):], observer_inputs(t, Y, *gains[:2]),
+                     np.asarray(E, dtype=np.float64).T, Y.T))
+    return runs
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Replay lab 3 IMU logs through the Luenberger observer for many pole sets.")
+    parser.add_argument("folder", nargs="?", default="lab3", help="Folder with the IMU/estimate logs (default lab3)")
+    parser.add_argument("--poles", action="append", default=[],
+                        help="Five comma-separated poles, e.g. --poles=-3,-6,-3,-10,-2; repeatable (default: the script's p)")
+    parser.add_argument("--scale", default="1", help='Factor(s) applied to every --poles list: "2" or "START:STOP:COUNT"')
+    parser.add_argument("--random", type=int, default=0, help="Also try this many random real pole sets")
+    parser.add_argument("--pole-range", default="-20,-1", help="Range of the random poles (default -20,-1)")
+    parser.add_argument("--seed", type=int, default=0, help="Seed for --random (default 0)")
+    parser.add_argument("--gains", default=None,
+                        help="K_1,K_2,K_3 to use instead of the script's nominal gains, e.g. --gains=0.53,0.085,0.61")
+    parser.add_argument("--imu", default="IMU_test_", help="File name prefix of the IMU logs (default IMU_test_)")
+    parser.add_argument("--estimate", default="Estimat_test_", help="File name prefix of the estimate logs (default Estimat_test_)")
+    parser.add_argument("--jobs", type=int, default=1, help="Worker processes (default 1, 0 = one per CPU)")
+    parser.add_argument("--no-cache", action="store_true", help="Do not read or write the parsed-log cache")
+    parser.add_argument("--top", type=int, default=5, help="Pole sets listed in the log (default 5)")
+    parser.add_argument("--out", type=Path, default=Path("observer_sweep.csv"), help="CSV output (default observer_sweep.csv)")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(levelname)s: %(message)s")
+    folder = Path(args.folder).resolve()
+    gains = model.parse_gains(args.gains)
+    runs = load_pairs(folder, args.imu, args.estimate, None if args.no_cache else folder / ".plotcache", gains)
+    if not runs:
+        raise SystemExit(f"No {args.imu}*/{args.estimate}* pairs in {folder}")
+    labels = load_profile(folder)["labels"]
+
+    t0 = time.perf_counter()
+    sets = pole_sets(args.poles, args.scale, args.random, args.pole_range, args.seed)
+    Ad, Bd, placed = observer_matrices(sets, model.T, gains)
+    if not placed.any():
+        raise SystemExit("place_poles failed for every pole set")
+    if not placed.all():
+        logging.warning("Skipping %d pole set(s) place_poles cannot realise", int((~placed).sum()))
+    sets, Ad, Bd = sets[placed], Ad[placed], Bd[placed]
+    jobs = args.jobs if args.jobs > 0 else (os.cpu_count() or 1)
+    rms = sweep(Ad, Bd, runs, jobs)  # (runs, {est, imu}, sets, 5)
+    logging.info("Replayed %d pole set(s) over %d run(s) in %.2f s",
+                 len(sets), len(runs), time.perf_counter() - t0)
+
+    with open(args.out, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["set", "poles", "run", "rms_est", "rms_imu"]
+                        + [f"est_{lbl}" for lbl in labels] + [f"imu_{lbl}" for lbl in labels])
+        for s, poles in enumerate(sets):
+            for r, (run, *_) in enumerate(runs):
+                est, imu = rms[r, 0, s], rms[r, 1, s]
+                writer.writerow([s, ";".join(f"{p:.6g}" for p in poles), run, f"{est.mean():.6g}", f"{imu.mean():.6g}"]
+                                + [f"{v:.6g}" for v in est] + [f"{v:.6g}" for v in imu])
+
+    score = rms[:, 1].mean(axis=(0, 2))
+    logging.info("Best pole sets by mean RMS error against the IMU states (est = against the recorded estimate):")
+    for s in np.argsort(score)[:args.top]:
+        logging.info("  %-40s imu %.4f  est %.4f", "[" + ", ".join(f"{p:.3g}" for p in sets[s]) + "]",
+                     score[s], rms[:, 0, s].mean())
+    logging.info("Done. Wrote %s", args.out)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+"""Overlay groups of runs from one lab folder on a common time grid.
+
+- Each --group NAME=PATTERN selects the runs whose file name (without .mat) matches
+  the glob PATTERN; without --group every run in the folder forms one group.
+- All runs of all groups are resampled onto one shared time grid in a single
+  np.interp pass (see resample()), so dozens of runs cost no per-run Python loop.
+- One subplot per state: every run as a thin line, plus the mean and the min/max
+  envelope of each group. Parts of the grid a run does not cover are left out of
+  its group's statistics.
+- Runs are read through the folder's parsed-log cache (.plotcache), like helilab-plot.
+- Saves <folder>/figs/overlay__<group>_vs_<group>.png unless --out is given.
+
+Examples (PowerShell):
+  helilab-overlay lab2 --group i=Test*_i --group ui=Test*_ui     # with vs. without integral action
+  helilab-overlay lab2 --group i=Test*_i --group ui=Test*_ui --states pitch,elevation --tmax 30
+  helilab-overlay lab3 --step 0.002 --out lab3\\figs\\all_runs.png
+  python -m helilab.overlay lab4
+"""
+from __future__ import annotations
+
+from pathlib import Path
+import argparse
+from fnmatch import fnmatchcase
+import logging
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+from helilab.plot import crop_time, load_profile, load_run, parse_figsize, pick_state_indices
+
+
+def parse_group(spec: str) -> Tuple[str, str]:
+    """"i=Test*_i" -> ("i", "Test*_i"); a bare pattern is also its own name."""
+    name, sep, pattern = spec.partition("=")
+    return (name.strip(), pattern.strip()) if sep else (spec.strip(), spec.strip())
+
+
+def resample(runs: List[Tuple[np.ndarray, np.ndarray]], grid: np.ndarray) -> np.ndarray:
+    """Resample every run's Y[ns, N] onto `grid`; returns (runs, ns, len(grid)).
+
+    Run k's time axis is shifted by k * stride (stride longer than any run) so all
+    runs form one increasing axis. A single np.interp over that axis gives each
+    query's fractional sample position, and one linear blend over all states
+    finishes the job. Grid points outside a run's time range are NaN.
+    """
+    ns = min(Y.shape[0] for _, Y in runs)
+    starts = np.array([t[0] for t, _ in runs], dtype=np.float64)
+    ends = np.array([t[-1] for t, _ in runs], dtype=np.float64)
+    stride = max(ends.max(), grid[-1]) - min(starts.min(), grid[0]) + 1.0
+    offsets = np.arange(len(runs)) * stride
+    t_cat = np.concatenate([t + off for (t, _), off in zip(runs, offsets)])
+    Y_cat = np.concatenate([Y[:ns] for _, Y in runs], axis=1)
+
+    query = (grid[None, :] + offsets[:, None]).ravel()
+    pos = np.interp(query, t_cat, np.arange(t_cat.size, dtype=np.float64))
+    i0 = np.minimum(pos.astype(np.intp), t_cat.size - 2)
+    w = pos - i0
+    out = Y_cat[:, i0] * (1.0 - w) + Y_cat[:, i0 + 1] * w
+    out = out.reshape(ns, len(runs), grid.size).transpose(1, 0, 2)
+    outside = (grid[None, :] < starts[:, None]) | (grid[None, :] > ends[:, None])
+    return np.where(outside[:, None, :], np.nan, out)
+
+
+def envelope(R: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """(mean, min, max) over runs (axis 0), ignoring NaN; NaN where no run covers a point."""
+    covered = ~np.isnan(R)
+    count = covered.sum(axis=0)
+    total = np.where(covered, R, 0.0).sum(axis=0)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean = np.where(count > 0, total / count, np.nan)
+    return mean, np.fmin.reduce(R, axis=0), np.fmax.reduce(R, axis=0)
+
+
+def load_group(folder: Path, pattern: str, ans_labels: List[str], cache_dir: Optional[Path],
+               tmin: Optional[float], tmax: Optional[float]) -> Tuple[List[str], List[tuple], Optional[List[str]]]:
+    """(run names, [(t, Y)], labels) for the runs in `folder` matching `pattern`."""
+    names, runs, labels = [], [], None
+    for mat_path in sorted(folder.glob("*.mat")):
+        if not fnmatchcase(mat_path.stem, pattern):
+            continue
+        try:
+            t, Y, run_labels = load_run(mat_path, ans_labels, cache_dir)
+        except Exception as e:
+            logging.warning("Failed to load %s: %s", mat_path.name, e)
+            continue
+        if t is None:
+            logging.info("Skipping %s (no state layout found).", mat_path.name)
+            continue
+        names.append(mat_path.stem)
+        runs.append(crop_time(t, Y, tmin, tmax))
+        if labels is None or len(run_labels) < len(labels):
+            labels = run_labels
+    return names, runs, labels
+
+
+def plot_overlay(grid: np.ndarray, groups: List[Tuple[str, np.ndarray]], indices: List[int], labels: List[str],
+                 out_file: Path, figsize: Tuple[float, float], dpi: int, profile: dict, title: str) -> None:
+    """One subplot per state index; each group gets its runs, mean and min/max band in one colour."""
+    import matplotlib
+    matplotlib.use("Agg", force=True)
+    import matplotlib.pyplot as plt
+    from matplotlib.collections import LineCollection
+
+    fontsize = profile["fontsize"]
+    fig, axes = plt.subplots(len(indices), 1, sharex=True, squeeze=False,
+                             figsize=(figsize[0], max(figsize[1], 1.8 * len(indices))))
+    axes = axes[:, 0]
+    for g, (name, R) in enumerate(groups):
+        color = f"C{g}"
+        mean, lo, hi = envelope(R)
+        for ax, i in zip(axes, indices):
+            # All runs of the group as one artist: segments of shape (runs, points, 2)
+            segs = np.stack([np.broadcast_to(grid, R[:, i].shape), R[:, i]], axis=-1)
+            ax.add_collection(LineCollection(segs, colors=color, linewidths=0.6, alpha=0.35))
+            ax.fill_between(grid, lo[i], hi[i], color=color, alpha=0.15, linewidth=0)
+            ax.plot(grid, mean[i], color=color, linewidth=1.8, label=f"{name} mean, min/max (n={R.shape[0]})")
+    for ax, i in zip(axes, indices):
+        ax.set_ylabel(labels[i], fontsize=fontsize)
+        ax.grid(True, linestyle="--", alpha=0.6)
+        ax.autoscale_view()
+    axes[-1].set_xlabel("time [s]", fontsize=fontsize)
+    axes[0].set_title(title)
+    axes[0].legend(loc="upper left", fontsize=fontsize)
+    fig.tight_layout()
+    fig.savefig(out_file, dpi=dpi, format="png")
+    plt.close(fig)
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Overlay groups of runs with their mean and min/max envelope.")
+    parser.add_argument("folder", nargs="?", default=".", help="Lab folder with the .mat files (default: current folder)")
+    parser.add_argument("--group", action="append", default=[],
+                        help='NAME=PATTERN glob on the file name, e.g. "i=Test*_i"; repeat for each group (default: all runs)')
+    parser.add_argument("--states", default="all",
+                        help='Which states to plot: "all", names (e.g. "pitch,elevation"), or 1-based indices "3,5".')
+    parser.add_argument("--tmin", type=float, default=None, help="Min time (seconds) to include")
+    parser.add_argument("--tmax", type=float, default=None, help="Max time (seconds) to include")
+    parser.add_argument("--step", type=float, default=None,
+                        help="Grid spacing in seconds (default: two grid points per pixel of figure width)")
+    parser.add_argument("--figsize", default=None, help="Figure size W,H in inches (default from the folder's helilab.json)")
+    parser.add_argument("--dpi", type=int, default=150, help="PNG DPI (default 150)")
+    parser.add_argument("--no-cache", action="store_true", help="Do not read or write the parsed-log cache")
+    parser.add_argument("--out", type=Path, default=None, help="Output PNG (default <folder>/figs/overlay__<groups>.png)")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(levelname)s: %(message)s")
+
+    folder = Path(args.folder).resolve()
+    profile = load_profile(folder)
+    figsize = parse_figsize(args.figsize, profile["figsize"])
+    cache_dir = None if args.no_cache else folder / ".plotcache"
+    specs = [parse_group(g) for g in args.group] or [("all", "*")]
+
+    loaded = []
+    labels: Optional[List[str]] = None
+    for name, pattern in specs:
+        names, runs, group_labels = load_group(folder, pattern, profile["labels"], cache_dir, args.tmin, args.tmax)
+        if not runs:
+            logging.warning("Group %s: no runs match %r in %s", name, pattern, folder)
+            continue
+        logging.info("Group %s: %s", name, ", ".join(names))
+        loaded.append((name, runs))
+        if labels is None or len(group_labels) < len(labels):
+            labels = group_labels
+    if not loaded:
+        raise SystemExit("Nothing to plot.")
+
+    all_runs = [run for _, runs in loaded for run in runs]
+    t0 = min(float(t[0]) for t, _ in all_runs)
+    t1 = max(float(t[-1]) for t, _ in all_runs)
+    points = int(round((t1 - t0) / args.step)) + 1 if args.step else 2 * int(figsize[0] * args.dpi)
+    grid = np.linspace(t0, t1, max(points, 2))
+    # One resample over every run of every group, then split back per group
+    resampled = resample(all_runs, grid)
+    groups, k = [], 0
+    for name, runs in loaded:
+        groups.append((name, resampled[k:k + len(runs)]))
+        k += len(runs)
+    indices = [i for i in pick_state_indices(args.states, labels) if i < resampled.shape[1]]
+    if not indices:
+        raise SystemExit(f"No states selected by {args.states!r}; available: {', '.join(labels)}")
+
+    out_file = args.out or folder / "figs" / f"overlay__{'_vs_'.join(name for name, _ in loaded)}.png"
+    out_file.parent.mkdir(parents=True, exist_ok=True)
+    title = f"{folder.name}: " + " vs. ".join(name for name, _ in loaded)
+    plot_overlay(grid, groups, indices, labels, out_file, figsize, args.dpi, profile, title)
+    logging.info("Saved %s (%d runs, %d grid points)", out_file, len(all_runs), grid.size)
+
+
+if __name__ == "__main__":
+    main()
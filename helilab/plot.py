@@ -0,0 +1,1873 @@
+#!/usr/bin/env python3
+"""Plot states from the .mat files in one or more lab folders.
+
+- Scans every folder given on the command line (default: the current folder) into
+  one work queue, so one worker pool or prefetch thread serves all labs at once.
+- State order and figure style come from helilab.json in each folder, e.g.
+    {"labels": ["pitch", "pitch_dot", "elevation", "elevation_dot", "lambda_dot"],
+     "figsize": [8, 7], "ylabel": "angle [rad]", "title": null, "fontsize": "large"}
+  Folders without one use DEFAULT_PROFILE (lab 2 "To File" order).
+- Reads the MAT header first and loads only the candidate state matrix. Plain numeric
+  v4/v5 logs are read by a built-in reader; SciPy is imported only for other MAT content.
+- Reads MATLAB v7.3 (HDF5) logs chunk by chunk when h5py is installed, through a
+  memory-mapped temporary file, so memory stays flat however long the log is.
+- Detects lab "ans" layout:
+    shape (6|7, N) or (N, 6|7); first row/col is time, the rest are 5 or 6 states
+    in the order of the folder's "labels"
+- Falls back to a detected time vector plus a 2D state matrix, then to a matrix
+  whose first row/col is a monotone time axis.
+- Plots a selectable subset of the states (default: all).
+- Supports time cropping via --tmin/--tmax; for the Simulink "To File" layout only the
+  samples inside the window are read from disk. Optional y-limits via --ymin/--ymax/--yabs.
+- Optional min/max or LTTB decimation (--decimate) to a pixel-sized point budget; min/max is
+  the faster of the two and keeps every peak.
+  --decimate pyramid serves the same min/max traces from an index stored next to
+  the cached layout (helilab.pyramid), so any --tmin/--tmax window of a long log
+  costs about as much as a short one; helilab-zoom zooms with the same index.
+- Saves one PNG per .mat to <folder>/figs using a non-interactive backend; the figure is
+  built once per process and only its line data changes between files.
+- Skips figures whose input hash and options match figs/.manifest.json (--force rebuilds).
+- Caches the detected (t, states) per file as .npy in <folder>/.plotcache, keyed by content hash.
+- Time cropping and layout detection hand on views of the loaded matrix, not copies.
+  --low-memory also memory-maps uncompressed logs and keeps the states as float32
+  (time stays float64), on cache hits as on fresh parses. The float32 copy is
+  filled block by block from the mapped log or cache entry, so the float64 samples
+  are not resident next to it; compressed v5 logs read with --no-cache are
+  still inflated whole first. Mapped states with contiguous rows (cache entries,
+  v7.3 spills) that are decimated skip the copy: the renderer pages in one state
+  at a time and drops it once reduced. Peak-RSS numbers are in README.md.
+- --profile appends per-stage timings/RSS growth to <folder>/plot_profile.jsonl (next to
+  figs/) and prints a summary.
+- With one process, a reader thread loads the next --prefetch files while the current
+  one renders.
+- Optionally renders files on a process pool (--jobs N) with logs kept in file order.
+- --watch keeps running and re-renders each .mat as soon as it has been fully written
+  (inotify on Linux, polling elsewhere).
+
+Examples (PowerShell, after `pip install -e .`; labN\\plot.py still works per folder):
+  helilab-plot lab1 lab2 lab3 lab4 --jobs 0    # every lab, one shared pool
+  helilab-plot lab* --decimate minmax
+  helilab-plot lab2 --states pitch,elevation
+  helilab-plot lab3 --states 3,5 --yabs 0.6    # 1-based indices
+  helilab-plot lab2 --tmin 10 --tmax 40
+  helilab-plot lab* --watch                    # re-plot each run as it lands
+  python -m helilab.plot lab3                  # without installing
+"""
+from __future__ import annotations
+
+from pathlib import Path
+import argparse
+import glob
+import hashlib
+import importlib.util
+import json
+import logging
+import mmap
+import os
+import shutil
+import struct
+import sys
+import tempfile
+import threading
+import time
+import zlib
+from contextlib import contextmanager
+from typing import Iterable, Tuple, List, Optional
+
+
+def _lazy_import(name: str):
+    """Import `name` on first attribute access (importlib.util.LazyLoader)."""
+    if name in sys.modules:
+        return sys.modules[name]
+    spec = importlib.util.find_spec(name)
+    spec.loader = importlib.util.LazyLoader(spec.loader)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+# Start-up matters for --help and up-to-date runs: NumPy loads on first use and
+# SciPy, matplotlib and h5py are imported inside the functions that need them.
+np = _lazy_import("numpy")
+
+PROFILE_NAME = "helilab.json"
+# Used for folders without a helilab.json: Simulink "To File" order of the lab 2 model
+DEFAULT_PROFILE = {
+    "labels": ["lambda", "lambda_dot", "pitch", "pitch_dot", "elevation", "elevation_dot"],
+    "figsize": [14.0, 6.0],
+    "ylabel": "value",
+    "title": "States over time",
+    "fontsize": "medium",
+}
+TIME_KEYS = ["t", "time", "Time", "timestamp"]
+
+
+def is_numeric_array(obj) -> bool:
+    return hasattr(obj, "dtype") and hasattr(obj, "ndim")
+
+
+def find_time_vector(data: dict) -> tuple[Optional[np.ndarray], Optional[str]]:
+    """Return (time_vector, key) if a likely time vector exists, else (None, None)."""
+    for k in TIME_KEYS:
+        if k in data:
+            arr = data[k]
+            if is_numeric_array(arr):
+                a = np.asarray(arr)
+                if a.ndim == 1 or (a.ndim == 2 and 1 in a.shape):
+                    v = a.ravel()
+                    if v.size >= 2 and np.all(np.diff(v) > 0):
+                        return v, k
+    return None, None
+
+
+def load_profile(directory: Path) -> dict:
+    """Per-folder state order and figure style: DEFAULT_PROFILE updated with <directory>/helilab.json."""
+    profile = dict(DEFAULT_PROFILE)
+    path = directory / PROFILE_NAME
+    if path.exists():
+        profile.update(json.loads(path.read_text()))
+    return profile
+
+
+def state_labels(ans_labels: List[str], nstates: int) -> List[str]:
+    """Profile labels for the first `nstates` states, or generic names if there are more states."""
+    return ans_labels[:nstates] if nstates <= len(ans_labels) else [f"State {i+1}" for i in range(nstates)]
+
+
+def load_ans_layout(data: dict, ans_labels: List[str]) -> tuple[Optional[np.ndarray], Optional[np.ndarray], Optional[List[str]]]:
+    """If 'ans' has expected layout (time + 5 or 6 states), return (t, states[ns,N], labels)."""
+    if "ans" not in data or not is_numeric_array(data["ans"]):
+        return None, None, None
+    A = np.asarray(data["ans"])
+    if A.ndim != 2:
+        return None, None, None
+
+    # Accept time + 5 states (shape 6, N) or time + 6 states (shape 7, N)
+    if A.shape[0] in (6, 7):
+        t = A[0, :]
+        states = A[1:, :]
+    elif A.shape[1] in (6, 7):
+        t = A[:, 0]
+        states = A[:, 1:7] if A.shape[1] >= 7 else A[:, 1:6]  # time + 5 or 6 states
+        states = states.T  # make (ns, N)
+    else:
+        return None, None, None
+    t = _copy_blocks(t, t.dtype) if _mapping(A) is not None else t.ravel()
+
+    # Sanity checks
+    if t.size < 2 or not np.all(np.diff(t) > 0) or states.shape[1] != t.size:
+        return None, None, None
+    return t, states, state_labels(ans_labels, states.shape[0])
+
+
+def detect_embedded_time_matrix(data: dict, ans_labels: List[str]) -> tuple[Optional[np.ndarray], Optional[np.ndarray], Optional[List[str]], Optional[str]]:
+    """Find a matrix whose first row/col is a monotone time axis; the other rows/cols are states."""
+    for k, v in data.items():
+        if not is_numeric_array(v):
+            continue
+        a = np.asarray(v)
+        if a.ndim != 2:
+            continue
+
+        # First row is time
+        if a.shape[1] >= 2 and np.all(np.diff(a[0, :].ravel()) > 0):
+            t = a[0, :].ravel()
+            Y = a[1:, :]
+            if Y.shape[1] == t.size and Y.shape[0] >= 1:
+                return t, Y, state_labels(ans_labels, Y.shape[0]), k
+
+        # First column is time
+        if a.shape[0] >= 2 and np.all(np.diff(a[:, 0].ravel()) > 0):
+            t = a[:, 0].ravel()
+            Y = a[:, 1:].T  # rows = states
+            if Y.shape[1] == t.size and Y.shape[0] >= 1:
+                return t, Y, state_labels(ans_labels, Y.shape[0]), k
+    return None, None, None, None
+
+
+def pick_state_indices(spec: str, labels: List[str]) -> List[int]:
+    """Parse --states spec into zero-based indices using provided labels list.
+
+    spec can be:
+      - "all"
+      - comma-separated names (e.g., "pitch,elevation")
+      - comma-separated 1-based indices (e.g., "3,5")
+    """
+    if spec.strip().lower() == "all":
+        return list(range(len(labels)))
+
+    # Try names first
+    parts = [p.strip().lower() for p in spec.split(",") if p.strip()]
+    idx: List[int] = []
+    label_to_i = {lbl.lower(): i for i, lbl in enumerate(labels)}
+    name_hits = 0
+    for p in parts:
+        if p in label_to_i:
+            idx.append(label_to_i[p])
+            name_hits += 1
+
+    if name_hits == len(parts) and name_hits > 0:
+        # all parts matched names
+        return sorted(set(idx))
+
+    # Fallback to 1-based indices
+    idx = []
+    for p in parts:
+        if p.isdigit():
+            i1 = int(p)
+            if 1 <= i1 <= len(labels):
+                idx.append(i1 - 1)
+    if idx:
+        return sorted(set(idx))
+
+    # Default to all if nothing valid
+    return list(range(len(labels)))
+
+
+def crop_time(t: np.ndarray, Y: np.ndarray, tmin: Optional[float], tmax: Optional[float]) -> tuple[np.ndarray, np.ndarray]:
+    """Return time-cropped (t, Y). Y has shape (nstates, N).
+
+    Every layout guarantees an increasing t, so the window is a slice and the
+    results are views of the inputs rather than copies.
+    """
+    i0 = 0 if tmin is None else int(np.searchsorted(t, float(tmin), side="left"))
+    i1 = t.size if tmax is None else int(np.searchsorted(t, float(tmax), side="right"))
+    if i1 - i0 >= 2:
+        return t[i0:i1], Y[:, i0:i1]
+    return t, Y
+
+
+def _mapping(a):
+    """The mmap.mmap behind a memory-mapped array or a view of one, else None."""
+    while a is not None:
+        mm = getattr(a, "_mmap", None)
+        if mm is not None:
+            return mm
+        a = getattr(a, "base", None)
+    return None
+
+
+def _page_releaser(a: np.ndarray):
+    """f(block) that drops the pages under a block of the memory-mapped a from the process, or None.
+
+    POSIX only (mmap.madvise); Windows trims mapped pages from the working set itself.
+    """
+    mm = _mapping(a)
+    if mm is None or not hasattr(mm, "madvise"):
+        return None
+    base = np.frombuffer(mm, dtype=np.uint8).ctypes.data
+
+    def release(block: np.ndarray) -> None:
+        ends = [(n - 1) * st for n, st in zip(block.shape, block.strides)]
+        lo = block.ctypes.data + sum(e for e in ends if e < 0) - base
+        hi = block.ctypes.data + sum(e for e in ends if e > 0) + block.itemsize - base
+        start = lo - lo % mmap.PAGESIZE
+        mm.madvise(mmap.MADV_DONTNEED, start, hi - start)
+
+    return release
+
+
+def _copy_blocks(a: np.ndarray, dtype) -> np.ndarray:
+    """Copy of a in dtype, filled one block of samples (last axis) at a time.
+
+    When a is memory-mapped (a raw log or a cache entry), the pages of each block
+    are dropped from the process again once copied, so the source is never
+    resident next to the copy. Strided rows of an interleaved matrix would
+    otherwise fault in the whole file.
+    """
+    out = np.empty(a.shape, dtype=dtype)
+    release = _page_releaser(a)
+    per_sample = max(a.size // max(a.shape[-1], 1), 1) * a.itemsize
+    step = max(1, _CHUNK // per_sample)
+    for i in range(0, a.shape[-1], step):
+        block = a[..., i:i + step]
+        out[..., i:i + step] = block
+        if release is not None and block.size:
+            release(block)
+    return out
+
+
+def _save_blocks(path: Path, a: np.ndarray) -> None:
+    """np.save() of a 1-D or 2-D array in C order, written one block of samples at a time.
+
+    Like _copy_blocks(), a memory-mapped source has each block's pages dropped
+    again, so storing a mapped log in the cache does not fault in all of it.
+    """
+    release = _page_releaser(a)
+    step = max(1, _CHUNK // a.itemsize)
+    with open(path, "wb") as f:
+        header = {"descr": np.lib.format.dtype_to_descr(a.dtype), "fortran_order": False, "shape": a.shape}
+        np.lib.format.write_array_header_1_0(f, header)
+        for row in a if a.ndim > 1 else a[None]:
+            for i in range(0, row.size, step):
+                block = row[i:i + step]
+                f.write(np.ascontiguousarray(block).tobytes())
+                if release is not None and block.size:
+                    release(block)
+
+
+def downcast_states(Y: np.ndarray) -> np.ndarray:
+    """Y[ns, N] as float32 for --low-memory (see _copy_blocks)."""
+    return Y if Y.dtype == np.float32 else _copy_blocks(Y, np.float32)
+
+
+def _rss_windows_mb() -> Optional[tuple[float, float]]:
+    """(current, peak) working set of this process in MB, or None."""
+    import ctypes
+    from ctypes import wintypes
+
+    class _Counters(ctypes.Structure):
+        _fields_ = [("cb", wintypes.DWORD), ("PageFaultCount", wintypes.DWORD),
+                    ("PeakWorkingSetSize", ctypes.c_size_t), ("WorkingSetSize", ctypes.c_size_t),
+                    ("QuotaPeakPagedPoolUsage", ctypes.c_size_t), ("QuotaPagedPoolUsage", ctypes.c_size_t),
+                    ("QuotaPeakNonPagedPoolUsage", ctypes.c_size_t), ("QuotaNonPagedPoolUsage", ctypes.c_size_t),
+                    ("PagefileUsage", ctypes.c_size_t), ("PeakPagefileUsage", ctypes.c_size_t)]
+
+    try:
+        counters = _Counters()
+        counters.cb = ctypes.sizeof(counters)
+        handle = ctypes.windll.kernel32.GetCurrentProcess()
+        if ctypes.windll.psapi.GetProcessMemoryInfo(handle, ctypes.byref(counters), counters.cb):
+            return counters.WorkingSetSize / 2**20, counters.PeakWorkingSetSize / 2**20
+    except (AttributeError, OSError):
+        pass
+    return None
+
+
+def peak_rss_mb() -> Optional[float]:
+    """Peak resident set size of this process so far, in MB (None where unsupported)."""
+    try:
+        import resource
+    except ImportError:  # Windows
+        rss = _rss_windows_mb()
+        return None if rss is None else rss[1]
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 2**20 if sys.platform == "darwin" else peak / 2**10  # bytes on macOS, KiB elsewhere
+
+
+def current_rss_mb() -> Optional[float]:
+    """Resident set size of this process right now, in MB (Linux and Windows, else None)."""
+    if sys.platform == "win32":
+        rss = _rss_windows_mb()
+        return None if rss is None else rss[0]
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * mmap.PAGESIZE / 2**20
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+class StageProfiler:
+    """Per-file, per-stage wall time, memory and array sizes for --profile.
+
+    Stages are timed with `with PROFILER.stage("load") as info:`; anything put in
+    `info` (shapes, byte counts) is stored with the record. Each record holds the
+    stage's own change in resident memory (rss_delta_mb) and the process's peak
+    RSS so far (process_peak_rss_mb, which never goes down). RSS is per process,
+    so a prefetch thread's reads count toward whatever stage is running. Disabled,
+    it costs one attribute check per stage.
+    """
+
+    def __init__(self) -> None:
+        self.enabled = False
+        self._local = threading.local()  # the prefetch reader tags its own file
+        self.records: List[dict] = []
+
+    @property
+    def file(self) -> Optional[Path]:
+        return getattr(self._local, "file", None)
+
+    @file.setter
+    def file(self, mat_path: Path) -> None:
+        self._local.file = mat_path
+
+    @contextmanager
+    def stage(self, name: str):
+        info: dict = {}
+        if not self.enabled:
+            yield info
+            return
+        rss0, t0 = current_rss_mb(), time.perf_counter()
+        try:
+            yield info
+        finally:
+            wall, rss1 = time.perf_counter() - t0, current_rss_mb()
+            mat_path = self.file
+            self.records.append({"file": "" if mat_path is None else display_name(mat_path),
+                                 "folder": "" if mat_path is None else str(mat_path.parent),
+                                 "stage": name, "wall_s": wall,
+                                 "rss_delta_mb": None if rss0 is None or rss1 is None else rss1 - rss0,
+                                 "process_peak_rss_mb": peak_rss_mb(), **info})
+
+    def take(self, folder: Optional[Path] = None) -> List[dict]:
+        """Return and clear the records collected so far.
+
+        With folder, only the records of files in it, without their folder tag.
+        """
+        if folder is None:
+            records, self.records = self.records, []
+            return records
+        mine = [r for r in self.records if r["folder"] == str(folder)]
+        self.records = [r for r in self.records if r["folder"] != str(folder)]
+        return [{k: v for k, v in r.items() if k != "folder"} for r in mine]
+
+
+PROFILER = StageProfiler()
+
+
+def write_profile(path: Path, records: List[dict]) -> None:
+    """Append records as JSON lines, tagged with a run timestamp, and log a per-stage table."""
+    run = time.strftime("%Y-%m-%dT%H:%M:%S")
+    with open(path, "a") as f:
+        for rec in records:
+            f.write(json.dumps({"run": run, **rec}) + "\n")
+
+    stages: dict = {}
+    for rec in records:
+        stages.setdefault(rec["stage"], []).append(rec)
+    rows = []
+    for stage, recs in stages.items():
+        walls = [r["wall_s"] for r in recs]
+        delta = [r["rss_delta_mb"] for r in recs if r["rss_delta_mb"] is not None]
+        peak = [r["process_peak_rss_mb"] for r in recs if r["process_peak_rss_mb"] is not None]
+        rows.append((sum(walls), stage, len(recs), max(walls), max(delta) if delta else float("nan"),
+                     max(peak) if peak else float("nan")))
+    logging.info("Profile (%d records appended to %s):", len(records), display_name(path))
+    logging.info("  %-12s %6s %10s %10s %10s %14s %15s", "stage", "calls", "total s", "mean ms", "max ms",
+                 "max +RSS MB", "process peak MB")
+    for total, stage, n, worst, delta, peak in sorted(rows, reverse=True):
+        logging.info("  %-12s %6d %10.3f %10.1f %10.1f %14.1f %15.1f",
+                     stage, n, total, 1e3 * total / n, 1e3 * worst, delta, peak)
+    slowest = sorted(records, key=lambda r: r["wall_s"], reverse=True)[:5]
+    logging.info("Slowest file stages: %s",
+                 ", ".join(f"{r['file']}:{r['stage']} {1e3 * r['wall_s']:.0f} ms" for r in slowest))
+
+
+DECIMATE_METHODS = ("none", "minmax", "lttb", "pyramid")
+
+
+def decimate_minmax(t: np.ndarray, y: np.ndarray, n_buckets: int) -> tuple[np.ndarray, np.ndarray]:
+    """Keep the min and max sample of each of `n_buckets` equal-count buckets.
+
+    Every local extreme survives at bucket resolution, so peaks and overshoot
+    look the same as in the full trace. First and last samples are always kept.
+    """
+    n = t.size
+    if n_buckets < 1 or n <= 2 * n_buckets + 2:
+        return t, y
+    k = -(-n // n_buckets)  # samples per bucket (ceil)
+    nb = -(-n // k)
+    # Pad with the last value so the tail bucket cannot invent a new extreme
+    padded = np.concatenate([y, np.full(nb * k - n, y[-1])]).reshape(nb, k)
+    base = np.arange(nb) * k
+    imin = np.minimum(base + padded.argmin(axis=1), n - 1)
+    imax = np.minimum(base + padded.argmax(axis=1), n - 1)
+    idx = np.unique(np.concatenate([[0, n - 1], imin, imax]))
+    return t[idx], y[idx]
+
+
+def decimate_lttb(t: np.ndarray, y: np.ndarray, n_out: int) -> tuple[np.ndarray, np.ndarray]:
+    """Largest-Triangle-Three-Buckets downsampling to at most `n_out` points.
+
+    The interior samples are split into buckets of k samples, one row each of a
+    2-D view, plus a shorter tail bucket, and every row is evaluated at once.
+    The sequential algorithm anchors each triangle on the previous bucket's
+    pick; here the first pass anchors on the previous bucket's average and a
+    second pass on the first pass's picks. Where several samples of a bucket
+    have similar areas the pick can differ from the sequential scan's; a peak
+    that dominates its bucket is kept either way.
+    """
+    n = t.size
+    if n_out < 3 or n <= n_out:
+        return t, y
+    k = -(-(n - 2) // (n_out - 2))  # interior samples per bucket (ceil)
+    nb = (n - 2) // k  # full buckets; samples nb*k+1 .. n-2 form the tail bucket
+    end = 1 + nb * k
+    tb, yb = t[1:end].reshape(nb, k), y[1:end].reshape(nb, k)
+    t_avg, y_avg = tb.mean(axis=1), yb.mean(axis=1)
+    tail = end < n - 1
+    # Third corner of each bucket's triangle: the next bucket's average, or the last sample
+    tc = np.append(t_avg[1:], t[end:n - 1].mean() if tail else t[-1])
+    yc = np.append(y_avg[1:], y[end:n - 1].mean() if tail else y[-1])
+    ta, ya = np.append(t[0], t_avg[:-1]), np.append(y[0], y_avg[:-1])
+    for _ in range(2):
+        # Twice the triangle (a, sample, c) area, |p*y + q*t - r|, one row per bucket
+        p, q = ta - tc, yc - ya
+        area = yb * p[:, None]
+        area += tb * q[:, None]
+        area -= (p * ya + q * ta)[:, None]
+        sel = 1 + np.arange(nb) * k + np.abs(area, out=area).argmax(axis=1)
+        anchor = np.append(0, sel[:-1])
+        ta, ya = t[anchor], y[anchor]
+    idx = [[0], sel]
+    if tail:
+        a = sel[-1]
+        area = np.abs((t[a] - t[-1]) * (y[end:n - 1] - y[a]) - (t[a] - t[end:n - 1]) * (y[-1] - y[a]))
+        idx.append([end + int(area.argmax())])
+    idx = np.concatenate(idx + [[n - 1]])
+    return t[idx], y[idx]
+
+
+def decimate_trace(t: np.ndarray, y: np.ndarray, method: str, width_px: int) -> tuple[np.ndarray, np.ndarray]:
+    """Reduce one trace to a point budget proportional to the figure width in pixels."""
+    if method in ("minmax", "pyramid"):  # pyramid traces normally come from a PyramidWindow
+        return decimate_minmax(t, y, width_px)
+    if method == "lttb":
+        return decimate_lttb(t, y, 2 * width_px)
+    return t, y
+
+
+class StateRenderer:
+    """Figure template for plot_states, built once per process and reused for every file.
+
+    Axes, labels and grid are created once; each render only swaps the line data
+    with set_data, rescales the axes and saves. Axis labels, title and font size
+    come from the folder profile.
+    """
+
+    def __init__(self, figsize: Tuple[float, float], dpi: int, profile: dict) -> None:
+        import matplotlib
+        matplotlib.use("Agg", force=True)
+        import matplotlib.pyplot as plt
+
+        self.figsize, self.dpi = figsize, dpi
+        self.fig, self.ax = plt.subplots(figsize=figsize)
+        self.lines = []  # Line2D artists, reused in order so colours match a fresh figure
+        sp = self.fig.subplotpars
+        self.margins = dict(left=sp.left, right=sp.right, bottom=sp.bottom, top=sp.top)
+        self.fontsize = profile["fontsize"]
+        self.ax.set_xlabel("time [s]", fontsize=self.fontsize)
+        self.ax.set_ylabel(profile["ylabel"], fontsize=self.fontsize)
+        if profile.get("title"):
+            self.ax.set_title(profile["title"])
+        self.ax.grid(True, linestyle="--", alpha=0.6)
+
+    def render(self, t: np.ndarray, states: np.ndarray, indices: List[int], labels: List[str],
+               out_file: Path, y_min: Optional[float] = None, y_max: Optional[float] = None,
+               decimate: str = "none", window=None) -> None:
+        """Draw and save; window is an optional helilab.pyramid.PyramidWindow serving the traces."""
+        ax = self.ax
+        width_px = int(self.figsize[0] * self.dpi)
+        while len(self.lines) < len(indices):
+            self.lines.append(ax.plot([], [], linewidth=1.6)[0])
+        # Decimated traces are copies, so the pages of a mapped row can go once it is reduced
+        release = None
+        if window is None and decimate != "none" and states.strides[1] == states.itemsize:
+            release = _page_releaser(states)
+        with PROFILER.stage("plot") as info:
+            points = 0
+            for line, i in zip(self.lines, indices):
+                if window is not None:
+                    ti, yi = window.trace(i, width_px)
+                else:
+                    ti, yi = decimate_trace(t, states[i, :], decimate, width_px)
+                    if release is not None and states.shape[1]:
+                        release(states[i, :])
+                line.set_data(ti, yi)
+                line.set_label(labels[i] if i < len(labels) else f"State {i+1}")
+                line.set_visible(True)
+                points += ti.size
+            for line in self.lines[len(indices):]:
+                line.set_data([], [])
+                line.set_visible(False)
+            ax.set_autoscale_on(True)
+            ax.relim(visible_only=True)
+            ax.autoscale_view()
+            info["points"] = points
+        ax.legend(handles=self.lines[:len(indices)], loc="upper left", fontsize=self.fontsize, ncols=1)
+        # Apply y-limits if provided
+        if y_min is not None or y_max is not None:
+            cur_ymin, cur_ymax = ax.get_ylim()
+            ax.set_ylim(y_min if y_min is not None else cur_ymin,
+                        y_max if y_max is not None else cur_ymax)
+        # tight_layout starts from the current margins; reset them so output matches a fresh figure
+        with PROFILER.stage("savefig"):
+            self.fig.subplots_adjust(**self.margins)
+            self.fig.tight_layout()
+            self.fig.savefig(out_file, dpi=self.dpi, format="png")
+
+
+_RENDERERS: dict = {}
+
+
+def get_renderer(figsize: Tuple[float, float], dpi: int, profile: dict) -> StateRenderer:
+    """Return this process's renderer for the given figure size and style, creating it on first use."""
+    key = (tuple(figsize), dpi, profile["ylabel"], profile.get("title"), profile["fontsize"])
+    if key not in _RENDERERS:
+        _RENDERERS[key] = StateRenderer(figsize, dpi, profile)
+    return _RENDERERS[key]
+
+
+def plot_states(t: np.ndarray, states: np.ndarray, indices: Iterable[int], labels: List[str],
+                out_file: Path, figsize: Tuple[float, float], dpi: int,
+                y_min: Optional[float] = None, y_max: Optional[float] = None,
+                decimate: str = "none", profile: Optional[dict] = None, window=None) -> None:
+    indices = [i for i in indices if 0 <= i < states.shape[0]]
+    if not indices:
+        indices = list(range(states.shape[0]))
+    get_renderer(figsize, dpi, profile or DEFAULT_PROFILE).render(t, states, indices, labels, out_file,
+                                      y_min=y_min, y_max=y_max, decimate=decimate, window=window)
+
+
+CACHE_VERSION = 1
+
+
+def file_digest(path: Path) -> str:
+    """SHA-1 of the file contents, read in 1 MiB chunks."""
+    h = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def source_digest(cache_dir: Path, mat_path: Path) -> str:
+    """Content hash of mat_path, reusing the stored hash while size and mtime are unchanged."""
+    st = mat_path.stat()
+    stamp = cache_dir / "src" / (hashlib.sha1(str(mat_path.resolve()).encode()).hexdigest() + ".json")
+    try:
+        rec = json.loads(stamp.read_text())
+        if rec["size"] == st.st_size and rec["mtime_ns"] == st.st_mtime_ns:
+            os.utime(stamp)  # LRU stamp, as for cache entries
+            return rec["digest"]
+    except (OSError, ValueError, KeyError):
+        pass
+    digest = file_digest(mat_path)
+    stamp.parent.mkdir(parents=True, exist_ok=True)
+    tmp = stamp.with_suffix(f".{os.getpid()}.tmp")
+    tmp.write_text(json.dumps({"size": st.st_size, "mtime_ns": st.st_mtime_ns, "digest": digest}))
+    os.replace(tmp, stamp)
+    return digest
+
+
+def cache_load(cache_dir: Path, digest: str, ans_labels: List[str]) -> tuple[Optional[np.ndarray], Optional[np.ndarray], Optional[List[str]], Optional[str]]:
+    """Return memory-mapped (t, Y, labels, suffix) for a cached layout, or all None on a miss."""
+    entry = cache_dir / digest
+    try:
+        meta = json.loads((entry / "meta.json").read_text())
+        if meta.get("version") != CACHE_VERSION or meta.get("ans_labels") != ans_labels:
+            return None, None, None, None
+        t = np.load(entry / "t.npy", mmap_mode="r")
+        Y = np.load(entry / "Y.npy", mmap_mode="r")
+        os.utime(entry / "meta.json")  # LRU stamp
+    except (OSError, ValueError, KeyError):
+        return None, None, None, None
+    return t, Y, meta["labels"], meta["suffix"]
+
+
+def cache_store(cache_dir: Path, digest: str, t: np.ndarray, Y: np.ndarray,
+                labels: List[str], suffix: str, ans_labels: List[str]) -> None:
+    """Write a detected layout as .npy files; the entry appears atomically via a rename."""
+    entry = cache_dir / digest
+    if entry.exists():
+        return
+    tmp = cache_dir / f".tmp-{digest}-{os.getpid()}"
+    try:
+        tmp.mkdir(parents=True, exist_ok=True)
+        # Strided views (e.g. rows of a Fortran-ordered 'ans') are streamed in small blocks
+        _save_blocks(tmp / "t.npy", t)
+        _save_blocks(tmp / "Y.npy", Y)
+        meta = {"version": CACHE_VERSION, "ans_labels": list(ans_labels), "labels": list(labels), "suffix": suffix}
+        (tmp / "meta.json").write_text(json.dumps(meta))
+        os.rename(tmp, entry)
+    except OSError as e:
+        # Another worker won the race, or the disk is full: the cache is best effort
+        logging.debug("Could not cache %s: %s", digest, e)
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+def cache_evict(cache_dir: Path, max_bytes: int) -> None:
+    """Delete least recently used entries and source stamps until the cache fits in max_bytes.
+
+    The per-path stamps under src/ count toward max_bytes as well, so stamps of
+    renamed or deleted logs age out; a stamp naming an evicted entry goes with it.
+    """
+    entries, stamps = [], []
+    for entry in cache_dir.iterdir():
+        meta = entry / "meta.json"
+        if not entry.is_dir() or not meta.exists():
+            continue
+        size = sum(f.stat().st_size for f in entry.iterdir())
+        entries.append((meta.stat().st_mtime, size, entry))
+    for stamp in (cache_dir / "src").glob("*.json"):
+        try:
+            st = stamp.stat()
+        except OSError:
+            continue
+        try:
+            digest = json.loads(stamp.read_text()).get("digest")
+        except (OSError, ValueError, AttributeError):
+            digest = None
+        stamps.append((st.st_mtime, st.st_size, stamp, digest))
+    total = sum(size for _, size, _ in entries) + sum(size for _, size, _, _ in stamps)
+    evicted = set()
+    for _, size, path in sorted(entries + [s[:3] for s in stamps], key=lambda e: e[0]):
+        if total <= max_bytes:
+            break
+        total -= size
+        if path.is_dir():
+            shutil.rmtree(path, ignore_errors=True)
+            evicted.add(path.name)
+            logging.info("Evicted cache entry %s (%.1f MB)", path.name, size / 1e6)
+        else:
+            path.unlink(missing_ok=True)
+    for _, _, stamp, digest in stamps:
+        if digest in evicted:
+            stamp.unlink(missing_ok=True)
+
+
+MANIFEST_NAME = ".manifest.json"
+
+
+def load_manifest(out_dir: Path) -> dict:
+    """Return {mat name: {"digest", "options", "output"}} for figures rendered earlier."""
+    try:
+        return json.loads((out_dir / MANIFEST_NAME).read_text())
+    except (OSError, ValueError):
+        return {}
+
+
+def save_manifest(out_dir: Path, manifest: dict) -> None:
+    tmp = out_dir / (MANIFEST_NAME + ".tmp")
+    tmp.write_text(json.dumps(manifest, indent=1, sort_keys=True))
+    os.replace(tmp, out_dir / MANIFEST_NAME)
+
+
+NUMERIC_CLASSES = {"double", "single", "int8", "uint8", "int16", "uint16",
+                   "int32", "uint32", "int64", "uint64"}
+
+
+def select_variables(info: List[tuple[str, Tuple[int, ...], str]]) -> Optional[List[str]]:
+    """Choose which variables to load from whosmat-style (name, shape, class) entries.
+
+    If 'ans' is a (6|7, N) or (N, 6|7) matrix it is the only variable returned;
+    otherwise every such matrix plus any time-vector candidates. Returns None
+    when no plausible state matrix exists.
+    """
+    numeric = [(name, shape) for name, shape, cls in info if cls in NUMERIC_CLASSES]
+    mats = [name for name, shape in numeric
+            if len(shape) == 2 and (shape[0] in (6, 7) or shape[1] in (6, 7))]
+    if not mats:
+        return None
+    if "ans" in mats:
+        return ["ans"]
+    times = [name for name, shape in numeric if name in TIME_KEYS and (len(shape) == 1 or 1 in shape)]
+    return mats + times
+
+
+def probe_variables(mat_path: Path) -> Optional[List[str]]:
+    """select_variables() on the MAT header alone (like MATLAB's whos); no data is read."""
+    from scipy.io import whosmat
+
+    return select_variables(whosmat(str(mat_path)))
+
+
+# MAT v4 precision codes and v5 data types -> numpy dtype characters
+_V4_DTYPES = {0: "f8", 1: "f4", 2: "i4", 3: "i2", 4: "u2", 5: "u1"}
+_V5_DTYPES = {1: "i1", 2: "u1", 3: "i2", 4: "u2", 5: "i4", 6: "u4", 7: "f4", 9: "f8", 12: "i8", 13: "u8"}
+_V5_NUMERIC_CLASSES = range(6, 16)  # mxDOUBLE_CLASS .. mxUINT64_CLASS
+_MI_MATRIX, _MI_COMPRESSED = 14, 15
+_CHUNK = 1 << 20
+
+
+_V5_CLASSES = {6: "double", 7: "single", 8: "int8", 9: "uint8", 10: "int16", 11: "uint16",
+               12: "int32", 13: "uint32", 14: "int64", 15: "uint64"}
+_CLASS_DTYPES = {"double": "f8", "single": "f4", "int8": "i1", "uint8": "u1", "int16": "i2", "uint16": "u2",
+                 "int32": "i4", "uint32": "u4", "int64": "i8", "uint64": "u8"}
+
+
+class _Unsupported(Exception):
+    """The built-in MAT reader cannot handle this file; scipy.io has to."""
+
+
+def _iter_v4(f):
+    """Yield (name, (rows, cols), class, data offset, dtype) for every matrix in a v4 file.
+
+    Class is "double" for real full matrices and "other" for text, sparse or complex ones.
+    """
+    size = f.seek(0, os.SEEK_END)
+    pos = 0
+    while pos + 20 <= size:
+        f.seek(pos)
+        hdr = f.read(20)
+        order = "<" if int.from_bytes(hdr[:4], "little") < 1000 else ">"
+        mopt, mrows, ncols, imagf, namlen = (int(x) for x in np.frombuffer(hdr, dtype=order + "i4"))
+        p, tflag = mopt // 10 % 10, mopt % 10
+        if mopt // 1000 != (0 if order == "<" else 1) or p not in _V4_DTYPES:
+            raise _Unsupported(f"unknown v4 matrix type {mopt}")
+        dtype = np.dtype(order + _V4_DTYPES[p])
+        vname = f.read(namlen).rstrip(b"\0").decode("latin-1")
+        offset = pos + 20 + namlen
+        yield vname, (mrows, ncols), "double" if tflag == 0 and not imagf else "other", offset, dtype
+        pos = offset + mrows * ncols * dtype.itemsize * (2 if imagf else 1)
+
+
+def _find_matrix_v4(f, name: str) -> Optional[tuple[int, Tuple[int, int], np.dtype]]:
+    """Return (data offset, (rows, cols), dtype) of real full matrix `name` in a v4 file."""
+    try:
+        for vname, shape, cls, offset, dtype in _iter_v4(f):
+            if vname == name:
+                return (offset, shape, dtype) if cls == "double" else None
+    except _Unsupported:
+        pass
+    return None
+
+
+def _v5_matrix_info(head: bytes, order: str) -> Optional[tuple[str, Tuple[int, ...], str, Optional[np.dtype], int, int]]:
+    """Parse a v5 miMATRIX payload prefix into (name, dims, class, stored dtype, data offset, data nbytes).
+
+    Class is a whosmat-style name for real numeric matrices, "complex" for complex
+    ones and "other" for everything else (cell, struct, char, sparse, logical);
+    only real numeric matrices get a dtype and data location.
+    """
+    def tag(pos: int) -> tuple[int, int, int, int]:
+        # (type, nbytes, data start, next element) with support for the packed small-element form
+        typ, nbytes = struct.unpack_from(order + "II", head, pos)
+        if typ >> 16:
+            return typ & 0xFFFF, typ >> 16, pos + 4, pos + 8
+        return typ, nbytes, pos + 8, pos + 8 + ((nbytes + 7) & ~7)
+
+    try:
+        _, _, p, nxt = tag(0)
+        flags = struct.unpack_from(order + "I", head, p)[0]
+        _, nb, p, nxt = tag(nxt)
+        dims = struct.unpack_from(order + f"{nb // 4}i", head, p)
+        _, nb, p, nxt = tag(nxt)
+        name = head[p:p + nb].decode("latin-1")
+        cls = _V5_CLASSES.get(flags & 0xFF, "other") if not flags & 0x200 else "other"  # 0x200: logical
+        if cls == "other":
+            return name, dims, cls, None, 0, 0
+        if flags & 0x800:
+            return name, dims, "complex", None, 0, 0
+        dtype, nb, p, _ = tag(nxt)
+    except struct.error:
+        return None
+    if dtype not in _V5_DTYPES:
+        return None
+    return name, dims, cls, np.dtype(order + _V5_DTYPES[dtype]), p, nb
+
+
+def _iter_v5(f, order: str):
+    """Yield (element offset, element nbytes, compressed, matrix info) for each top-level v5 variable.
+
+    Matrix info is _v5_matrix_info() of the element; compressed elements are
+    only decompressed far enough to read their header.
+    """
+    pos = 128
+    while True:
+        f.seek(pos)
+        tag = f.read(8)
+        if len(tag) < 8:
+            return
+        typ, nbytes = struct.unpack(order + "II", tag)
+        if typ == _MI_MATRIX:
+            yield pos + 8, nbytes, False, _v5_matrix_info(f.read(min(nbytes, 512)), order)
+        elif typ == _MI_COMPRESSED:
+            d = zlib.decompressobj()
+            head = d.decompress(f.read(min(nbytes, 4096)), 8 + 512)
+            if len(head) >= 8 and struct.unpack_from(order + "I", head)[0] == _MI_MATRIX:
+                yield pos + 8, nbytes, True, _v5_matrix_info(head[8:], order)
+        pos += 8 + nbytes
+        if typ == _MI_MATRIX:
+            pos = (pos + 7) & ~7
+
+
+def _find_matrix_v5(f, name: str, order: str):
+    """Locate `name` in a v5 file.
+
+    Returns ("raw", data offset, dims, dtype) for an uncompressed matrix,
+    ("zlib", element offset, element nbytes, data offset in stream, dims, dtype)
+    for a compressed one, or None.
+    """
+    for pos, nbytes, compressed, info in _iter_v5(f, order):
+        if info is None or info[0] != name or info[3] is None:
+            continue
+        _, dims, _, dtype, off, _ = info
+        if compressed:
+            return "zlib", pos, nbytes, 8 + off, dims, dtype
+        return "raw", pos + off, dims, dtype
+    return None
+
+
+def _bisect_time(time, n: int, x: float, right: bool) -> int:
+    """First index whose time is >= x (> x if right), reading only O(log n) samples."""
+    lo, hi = 0, n
+    while lo < hi:
+        mid = (lo + hi) // 2
+        v = time[mid]
+        if v < x or (right and v == x):
+            lo = mid + 1
+        else:
+            hi = mid
+    return lo
+
+
+def _window_mapped(mat_path: Path, offset: int, shape: Tuple[int, int], dtype: np.dtype,
+                   tmin: Optional[float], tmax: Optional[float]) -> Optional[np.ndarray]:
+    rows, cols = shape
+    mm = np.memmap(mat_path, dtype=dtype, mode="r", offset=offset, shape=shape, order="F")
+    if rows in (6, 7):
+        time, n = mm[0, :], cols
+    elif cols in (6, 7):
+        time, n = mm[:, 0], rows
+    else:
+        return None
+    i0 = 0 if tmin is None else _bisect_time(time, n, float(tmin), right=False)
+    i1 = n if tmax is None else _bisect_time(time, n, float(tmax), right=True)
+    if i1 - i0 < 2:
+        return None
+    window = mm[:, i0:i1] if rows in (6, 7) else mm[i0:i1, :]
+    out = np.array(window, dtype=np.float64)  # touches only the pages in the window
+    del mm, time, window
+    return out
+
+
+def _window_streamed(f, offset: int, nbytes: int, skip: int, shape: Tuple[int, int], dtype: np.dtype,
+                     tmin: Optional[float], tmax: Optional[float]) -> Optional[np.ndarray]:
+    """Decompress a (6|7, N) matrix column by column, keeping only samples inside the window."""
+    rows, cols = shape
+    if rows not in (6, 7):
+        return None  # time-major storage would need a second pass per state
+    col_bytes = rows * dtype.itemsize
+    lo = -np.inf if tmin is None else float(tmin)
+    hi = np.inf if tmax is None else float(tmax)
+    d = zlib.decompressobj()
+    f.seek(offset)
+    remaining, seen = nbytes, 0
+    buf = bytearray()
+    parts: List[np.ndarray] = []
+    while remaining > 0 and seen < cols:
+        chunk = f.read(min(_CHUNK, remaining))
+        if not chunk:
+            break
+        remaining -= len(chunk)
+        buf += d.decompress(chunk)
+        if skip:
+            dropped = min(skip, len(buf))
+            del buf[:dropped]
+            skip -= dropped
+        ncol = min(len(buf) // col_bytes, cols - seen)
+        if ncol == 0:
+            continue
+        block = np.frombuffer(bytes(buf[:ncol * col_bytes]), dtype=dtype).reshape(ncol, rows)
+        del buf[:ncol * col_bytes]
+        seen += ncol
+        tcol = block[:, 0]
+        keep = (tcol >= lo) & (tcol <= hi)
+        if keep.any():
+            parts.append(block[keep].astype(np.float64))
+        if tcol[-1] > hi:
+            break
+    if not parts:
+        return None
+    out = np.concatenate(parts).T
+    return out if out.shape[1] >= 2 else None
+
+
+def read_ans_window(mat_path: Path, tmin: Optional[float], tmax: Optional[float],
+                    name: str = "ans") -> Optional[np.ndarray]:
+    """Read only the samples of `name` with tmin <= t <= tmax (Simulink "To File" layout).
+
+    The first row (or column) must be a monotonic time vector. Uncompressed v4/v5
+    matrices are memory-mapped and the window is found by bisection; compressed v5
+    matrices are decompressed in chunks and stop after tmax; v7.3 (HDF5) datasets
+    are bisected and read chunk by chunk. Peak memory follows
+    the window size. Returns the windowed matrix in the stored orientation, or
+    None if the file does not fit (the caller then falls back to loadmat).
+    """
+    with open(mat_path, "rb") as f:
+        head = f.read(128)
+        if len(head) < 20:
+            return None
+        if 0 in head[:4]:
+            found = _find_matrix_v4(f, name)
+            if found is None:
+                return None
+            offset, shape, dtype = found
+            return _window_mapped(mat_path, offset, shape, dtype, tmin, tmax)
+
+        if len(head) < 128 or head[126:128] not in (b"IM", b"MI"):
+            return None
+        order = "<" if head[126:128] == b"IM" else ">"
+        if struct.unpack_from(order + "H", head, 124)[0] == 0x0200:
+            return _window_h5(mat_path, name, tmin, tmax)
+        if struct.unpack_from(order + "H", head, 124)[0] != 0x0100:
+            return None
+        found = _find_matrix_v5(f, name, order)
+        if found is None or len(found[-2]) != 2:
+            return None
+        if found[0] == "raw":
+            _, offset, dims, dtype = found
+            return _window_mapped(mat_path, offset, tuple(dims), dtype, tmin, tmax)
+        _, offset, nbytes, skip, dims, dtype = found
+        return _window_streamed(f, offset, nbytes, skip, tuple(dims), dtype, tmin, tmax)
+
+
+def is_mat_v73(mat_path: Path) -> bool:
+    """True for MATLAB v7.3 files (HDF5 container behind a v5-style text header)."""
+    with open(mat_path, "rb") as f:
+        head = f.read(128)
+    if len(head) < 128 or head[126:128] not in (b"IM", b"MI"):
+        return False
+    order = "<" if head[126:128] == b"IM" else ">"
+    return struct.unpack_from(order + "H", head, 124)[0] == 0x0200
+
+
+def _whosmat_v73(h5) -> List[tuple[str, Tuple[int, ...], str]]:
+    """whosmat() for an open v7.3 file: (name, MATLAB shape, class) without reading data."""
+    import h5py
+
+    info = []
+    for name, obj in h5.items():
+        if name.startswith("#") or not isinstance(obj, h5py.Dataset):
+            continue
+        cls = obj.attrs.get("MATLAB_class", b"")
+        cls = cls.decode() if isinstance(cls, bytes) else str(cls)
+        info.append((name, tuple(reversed(obj.shape)), cls))  # HDF5 stores the transpose
+    return info
+
+
+def _read_h5_samples(ds, axis: int, i0: int, i1: int) -> np.ndarray:
+    """Copy samples [i0, i1) along `axis` of a 2D dataset, one chunk-aligned block at a time."""
+    other = ds.shape[1 - axis]
+    step = ds.chunks[axis] if ds.chunks else 1
+    step *= max(1, _CHUNK // (step * other * ds.dtype.itemsize))
+    shape = (i1 - i0, other) if axis == 0 else (other, i1 - i0)
+    out = np.empty(shape, dtype=ds.dtype)
+    a = i0
+    while a < i1:
+        b = min((a // step + 1) * step, i1)
+        src = np.s_[a:b, :] if axis == 0 else np.s_[:, a:b]
+        dst = np.s_[a - i0:b - i0, :] if axis == 0 else np.s_[:, a - i0:b - i0]
+        ds.read_direct(out, src, dst)
+        a = b
+    return out
+
+
+class _H5Time:
+    """Index the time row/column of a dataset one sample at a time (for _bisect_time)."""
+
+    def __init__(self, ds, axis: int) -> None:
+        self.ds, self.axis = ds, axis
+
+    def __getitem__(self, i: int) -> float:
+        return float(self.ds[i, 0] if self.axis == 0 else self.ds[0, i])
+
+
+def _window_h5(mat_path: Path, name: str, tmin: Optional[float], tmax: Optional[float]) -> Optional[np.ndarray]:
+    import h5py
+
+    with h5py.File(mat_path, "r") as h5:
+        ds = h5.get(name)
+        if not isinstance(ds, h5py.Dataset) or ds.ndim != 2 or ds.dtype.kind not in "iuf":
+            return None
+        # MATLAB (rows, N) is stored as (N, rows): samples run along HDF5 axis 0
+        if ds.shape[1] in (6, 7):
+            axis, n = 0, ds.shape[0]
+        elif ds.shape[0] in (6, 7):
+            axis, n = 1, ds.shape[1]
+        else:
+            return None
+        time = _H5Time(ds, axis)
+        i0 = 0 if tmin is None else _bisect_time(time, n, float(tmin), right=False)
+        i1 = n if tmax is None else _bisect_time(time, n, float(tmax), right=True)
+        if i1 - i0 < 2:
+            return None
+        return _read_h5_samples(ds, axis, i0, i1).T.astype(np.float64, copy=False)
+
+
+def _spill_h5(ds, spill_dir: Optional[Path]):
+    """Copy a 2D dataset block by block into an unlinked temporary file and memory-map it.
+
+    The map has the HDF5 (C-order) shape. Only one block is in memory at a time;
+    the file is deleted once the map is gone.
+    """
+    rows, cols = ds.shape
+    with tempfile.TemporaryFile(dir=spill_dir) as f:
+        if cols * ds.dtype.itemsize <= _CHUNK:  # whole rows per block: (N, 6|7) as MATLAB writes 'ans'
+            step = max(1, _CHUNK // (cols * ds.dtype.itemsize))
+            for a in range(0, rows, step):
+                f.write(_read_h5_samples(ds, 0, a, min(a + step, rows)).tobytes())
+        else:  # long rows, (6|7, N): each row in pieces
+            step = _CHUNK // ds.dtype.itemsize
+            for r in range(rows):
+                for a in range(0, cols, step):
+                    f.write(np.ascontiguousarray(ds[r, a:a + step]).tobytes())
+        f.flush()
+        return np.memmap(f, dtype=ds.dtype, mode="r", shape=(rows, cols))
+
+
+def load_mat_v73(mat_path: Path, spill_dir: Optional[Path] = None) -> Optional[dict]:
+    """Load the probe-selected variables of a v7.3 file lazily, in MATLAB orientation.
+
+    Returns a loadmat-like dict (unit dimensions squeezed) or None when the header
+    has no plausible state matrix. Requires the optional h5py package.
+
+    MATLAB writes v7.3 variables chunked and compressed, so they cannot be mapped
+    in place like raw v4/v5 matrices. Each selected matrix is instead inflated
+    block by block into a temporary file in spill_dir (default: the system temp
+    folder) and handed on memory-mapped, so memory stays flat however long the
+    log is; layout detection, the cache and --low-memory then treat it like a
+    mapped v4/v5 log.
+    """
+    import h5py
+
+    with h5py.File(mat_path, "r") as h5:
+        names = select_variables(_whosmat_v73(h5))
+        if names is None:
+            return None
+        data = {}
+        for name in names:
+            ds = h5[name]
+            arr = (_spill_h5(ds, spill_dir) if ds.ndim == 2 and ds.size else np.asarray(ds[()])).T
+            data[name] = arr.ravel() if arr.ndim == 2 and 1 in arr.shape else arr
+    return data
+
+
+def _inflate(f, pos: int, nbytes: int, skip: int, count: int, dtype: np.dtype) -> np.ndarray:
+    """Decompress `count` elements found `skip` bytes into a zlib element straight into one array.
+
+    Neither the compressed element nor the whole decompressed buffer is held in
+    memory next to the result.
+    """
+    out = np.empty(count, dtype=dtype)
+    raw = out.view(np.uint8)
+    d = zlib.decompressobj()
+    f.seek(pos)
+    remaining, filled = nbytes, 0
+    while remaining > 0 and filled < raw.size:
+        data = f.read(min(_CHUNK, remaining))
+        if not data:
+            break
+        remaining -= len(data)
+        while data and filled < raw.size:
+            piece = d.decompress(data, _CHUNK)
+            data = d.unconsumed_tail
+            if skip:
+                dropped = min(skip, len(piece))
+                piece = piece[dropped:]
+                skip -= dropped
+            n = min(len(piece), raw.size - filled)
+            raw[filled:filled + n] = np.frombuffer(piece, dtype=np.uint8, count=n)
+            filled += n
+    if filled < raw.size:
+        raise zlib.error("compressed variable is truncated")
+    return out
+
+
+def _read_v5_matrix(f, pos: int, nbytes: int, compressed: bool, info: tuple, mmap: bool = False) -> np.ndarray:
+    _, dims, cls, dtype, off, nb = info
+    if compressed:
+        arr = _inflate(f, pos, nbytes, 8 + off, nb // dtype.itemsize, dtype)
+    elif mmap and dtype == np.dtype(_CLASS_DTYPES[cls]):
+        return np.memmap(f, dtype=dtype, mode="r", offset=pos + off, shape=tuple(dims), order="F")
+    else:
+        f.seek(pos + off)
+        arr = np.fromfile(f, dtype=dtype, count=nb // dtype.itemsize)
+    # MATLAB may store e.g. integer-valued doubles as uint8; loadmat returns the class type
+    return arr.astype(_CLASS_DTYPES[cls], copy=False).reshape(dims, order="F")
+
+
+def load_mat_builtin(mat_path: Path, mmap: bool = False) -> Optional[dict]:
+    """load_candidates() for plain numeric v4/v5 files without importing SciPy.
+
+    Walks the variable headers, picks variables with select_variables() and reads
+    only those (real numeric matrices, raw or zlib-compressed). Returns a
+    loadmat(squeeze_me=True)-like dict, None when there is no plausible state
+    matrix, and raises _Unsupported for anything else (scipy.io then reads it).
+    With mmap=True, uncompressed matrices stored in their class type are
+    memory-mapped read-only instead of read.
+    """
+    with open(mat_path, "rb") as f:
+        head = f.read(128)
+        if len(head) < 20:
+            raise _Unsupported("file too short")
+        if 0 in head[:4]:
+            entries = list(_iter_v4(f))
+            names = select_variables([(name, shape, cls) for name, shape, cls, _, _ in entries])
+            if names is None:
+                return None
+            data = {}
+            for name, shape, _, offset, dtype in entries:
+                if name in names:
+                    if mmap:
+                        arr = np.memmap(f, dtype=dtype, mode="r", offset=offset, shape=shape, order="F")
+                    else:
+                        f.seek(offset)
+                        arr = np.fromfile(f, dtype=dtype, count=shape[0] * shape[1]).reshape(shape, order="F")
+                    data[name] = arr.squeeze() if 1 in shape else arr
+            return data
+
+        if len(head) < 128 or head[126:128] not in (b"IM", b"MI"):
+            raise _Unsupported("no MAT header")
+        order = "<" if head[126:128] == b"IM" else ">"
+        if struct.unpack_from(order + "H", head, 124)[0] != 0x0100:
+            raise _Unsupported("not a v5 file")
+        entries = list(_iter_v5(f, order))
+        if any(info is None or info[2] == "complex" for *_, info in entries):
+            raise _Unsupported("unparsed or complex variable")
+        names = select_variables([(info[0], tuple(info[1]), info[2]) for *_, info in entries])
+        if names is None:
+            return None
+        data = {}
+        for pos, nbytes, compressed, info in entries:
+            if info[0] in names:
+                arr = _read_v5_matrix(f, pos, nbytes, compressed, info, mmap)
+                data[info[0]] = arr.squeeze() if 1 in arr.shape else arr
+        return data
+
+
+def load_candidates(mat_path: Path, mmap: bool = False, spill_dir: Optional[Path] = None) -> Optional[dict]:
+    """Load just the variables picked by the header probe, or None if there are none.
+
+    Plain numeric v4/v5 logs (everything Simulink writes) go through the built-in
+    reader, which memory-maps raw matrices when mmap is set; v7.3 needs h5py and
+    is always mapped through a temporary file in spill_dir (see load_mat_v73());
+    anything unusual falls back to scipy.io.
+    """
+    if is_mat_v73(mat_path):
+        return load_mat_v73(mat_path, spill_dir)
+    try:
+        return load_mat_builtin(mat_path, mmap)
+    except _Unsupported as e:
+        logging.debug("Reading %s with scipy.io (%s)", mat_path.name, e)
+    names = probe_variables(mat_path)
+    if names is None:
+        return None
+    from scipy.io import loadmat
+
+    return loadmat(str(mat_path), squeeze_me=True, variable_names=names)
+
+
+def detect_layout(data: dict, name: str, ans_labels: List[str]) -> tuple[Optional[np.ndarray], Optional[np.ndarray], Optional[List[str]], Optional[str]]:
+    """Return (t, Y[ns,N], labels, suffix) for a loaded .mat dict, or all None if no layout fits."""
+    # Try the lab 'ans' layout first (now supports 5 or 6 states)
+    t, Y, labels = load_ans_layout(data, ans_labels)
+    if t is not None:
+        return t, Y, labels, "states"
+
+    # Fallback 1: separate time vector + a 2D matrix
+    t, t_key = find_time_vector(data)
+    if t is not None:
+        best_key = None
+        best_arr = None
+        for k, v in data.items():
+            if k == t_key or not is_numeric_array(v):
+                continue
+            a = np.asarray(v)
+            if a.ndim != 2:
+                continue
+            if a.shape[0] == t.size and a.shape[1] >= 1:
+                best_key, best_arr = k, a.T  # rows=states
+                break
+            if a.shape[1] == t.size and a.shape[0] >= 1 and best_arr is None:
+                best_key, best_arr = k, a
+        if best_arr is not None and best_arr.shape[1] == t.size:
+            return t, best_arr, state_labels(ans_labels, best_arr.shape[0]), best_key
+
+    # Fallback 2: embedded time in first row/col of a 2D array
+    t, Y, labels, key = detect_embedded_time_matrix(data, ans_labels)
+    if t is not None:
+        return t, Y, labels, key
+
+    logging.info("Skipping %s (no time vector found).", name)
+    return None, None, None, None
+
+
+def load_run(mat_path: Path, ans_labels: List[str], cache_dir: Optional[Path] = None,
+             mmap: bool = False) -> tuple[Optional[np.ndarray], Optional[np.ndarray], Optional[List[str]]]:
+    """Return (t, Y[ns,N], labels) for one whole log, or all None, for the analysis commands.
+
+    Goes through the parsed-log cache in cache_dir when given; a fresh parse is
+    stored and handed back memory-mapped, so many runs can be held at once.
+    mmap is passed on to load_candidates().
+    """
+    digest = None
+    if cache_dir is not None:
+        digest = source_digest(cache_dir, mat_path)
+        t, Y, labels, _ = cache_load(cache_dir, digest, ans_labels)
+        if t is not None:
+            return t, Y, labels
+    data = load_candidates(mat_path, mmap, spill_dir=cache_dir)
+    if data is None:
+        return None, None, None
+    t, Y, labels, suffix = detect_layout(data, mat_path.name, ans_labels)
+    if t is None or digest is None:
+        return t, Y, labels
+    cache_store(cache_dir, digest, t, Y, labels, suffix, ans_labels)
+    t_mm, Y_mm, labels_mm, _ = cache_load(cache_dir, digest, ans_labels)
+    return (t_mm, Y_mm, labels_mm) if t_mm is not None else (t, Y, labels)
+
+
+def resolve_ylim(args: argparse.Namespace) -> tuple[Optional[float], Optional[float]]:
+    """Return (y_min, y_max) from --yabs or --ymin/--ymax."""
+    if args.yabs is not None:
+        return -abs(args.yabs), abs(args.yabs)
+    return args.ymin, args.ymax
+
+
+def render_options(args: argparse.Namespace, figsize: Tuple[float, float]) -> dict:
+    """Effective options that change a rendered figure, as recorded in the manifest."""
+    y_min, y_max = resolve_ylim(args)
+    options = {"states": args.states, "tmin": args.tmin, "tmax": args.tmax, "figsize": list(figsize),
+               "dpi": args.dpi, "ymin": y_min, "ymax": y_max, "decimate": args.decimate,
+               "profile": args.lab}
+    if args.low_memory:  # float32 moves a few anti-aliased pixels; absent keeps older manifests valid
+        options["low_memory"] = True
+    return options
+
+
+def load_file(mat_path: Path, args: argparse.Namespace) -> tuple[str, str, Optional[tuple]]:
+    """Cache/window lookup, load, detect and crop for one .mat file.
+
+    Returns ("loaded", "", (t, Y, labels, suffix, window)) ready for render_file(), or
+    (status, detail, None) with status "skipped" or "failed" and the reason.
+    window is a helilab.pyramid.PyramidWindow for --decimate pyramid, else None.
+    """
+    logging.info("Processing %s", mat_path.name)
+    PROFILER.enabled, PROFILER.file = args.profile, mat_path
+    t = Y = labels = suffix = digest = None
+    windowed = False
+    if args.cache_dir is not None:
+        with PROFILER.stage("cache") as info:
+            digest = source_digest(args.cache_dir, mat_path)
+            t, Y, labels, suffix = cache_load(args.cache_dir, digest, args.lab["labels"])
+            info["hit"] = t is not None
+        if t is not None:
+            logging.info("Using cached layout for %s", mat_path.name)
+
+    if t is None and (args.tmin is not None or args.tmax is not None):
+        try:
+            with PROFILER.stage("window") as info:
+                window = read_ans_window(mat_path, args.tmin, args.tmax)
+                info["bytes"] = 0 if window is None else window.nbytes
+        except (ImportError, OSError, ValueError, zlib.error) as e:
+            logging.debug("Windowed read of %s failed: %s", mat_path.name, e)
+            window = None
+        if window is not None:
+            t, Y, labels = load_ans_layout({"ans": window}, args.lab["labels"])
+            if t is not None:
+                suffix, windowed = "states", True
+                logging.info("Read %d-sample window from %s", t.size, mat_path.name)
+
+    if t is None:
+        try:
+            with PROFILER.stage("load") as info:
+                data = load_candidates(mat_path, mmap=args.low_memory, spill_dir=args.cache_dir)
+                info["bytes"] = sum(v.nbytes for v in (data or {}).values() if is_numeric_array(v))
+            if data is None:
+                logging.info("Skipping %s (no (6|7, N) matrix in header).", mat_path.name)
+                return "skipped", "no state matrix in header", None
+        except Exception as e:
+            logging.warning("Failed to load %s: %s", mat_path.name, e)
+            return "failed", f"load error: {e}", None
+
+        with PROFILER.stage("detect") as info:
+            t, Y, labels, suffix = detect_layout(data, mat_path.name, args.lab["labels"])
+            info["shape"] = None if Y is None else list(Y.shape)
+        if t is None:
+            return "skipped", "no time vector found", None
+        if digest is not None:
+            with PROFILER.stage("cache_store"):
+                cache_store(args.cache_dir, digest, t, Y, labels, suffix, args.lab["labels"])
+            if args.low_memory:
+                # Continue from the stored entry, as a cache hit would, so the parsed
+                # float64 'ans' is released before the downcast below
+                t_mm, Y_mm, _, _ = cache_load(args.cache_dir, digest, args.lab["labels"])
+                if t_mm is not None:
+                    t, Y = t_mm, Y_mm
+        del data
+
+    # Cache hits, fresh parses and windowed reads alike; the cache keeps full precision.
+    # Mapped rows that are decimated need no copy: the renderer pages in one row at a time.
+    mapped_rows = _mapping(Y) is not None and Y.strides[1] == Y.itemsize
+    if args.low_memory and not (mapped_rows and args.decimate in ("minmax", "lttb")):
+        with PROFILER.stage("downcast"):
+            Y = downcast_states(Y)
+
+    window = None
+    if args.decimate == "pyramid":
+        from helilab.pyramid import cached_pyramid
+
+        with PROFILER.stage("pyramid") as info:
+            # Only a whole run's index is kept in its cache entry; a windowed read gets a throwaway one
+            entry = args.cache_dir / digest if digest is not None and not windowed else None
+            window = cached_pyramid(entry, Y).window(t, Y, args.tmin, args.tmax)
+            info["samples"] = window.i1 - window.i0
+
+    with PROFILER.stage("crop") as info:
+        t, Y = crop_time(t, Y, args.tmin, args.tmax)
+        info["samples"] = int(t.size)
+    return "loaded", "", (t, Y, labels, suffix, window)
+
+
+def render_file(mat_path: Path, out_dir: Path, args: argparse.Namespace, figsize: Tuple[float, float],
+                layout: tuple) -> tuple[str, str]:
+    """Plot the (t, Y, labels, suffix, window) from load_file() and save it; returns ("saved", file name)."""
+    t, Y, labels, suffix, window = layout
+    indices = pick_state_indices(args.states, labels)
+    out_file = out_dir / f"{mat_path.stem}__{suffix}.png"
+    y_min, y_max = resolve_ylim(args)
+    plot_states(t, Y, indices, labels, out_file, figsize, args.dpi, y_min=y_min, y_max=y_max,
+                decimate=args.decimate, profile=args.lab, window=window)
+    logging.info("Saved %s", out_file.name)
+    return "saved", out_file.name
+
+
+def process_file(mat_path: Path, out_dir: Path, args: argparse.Namespace,
+                 figsize: Tuple[float, float]) -> tuple[str, str]:
+    """Load, detect, crop and render one .mat file.
+
+    Returns (status, detail) where status is "saved", "skipped" or "failed" and
+    detail is the output file name or the reason nothing was written.
+    """
+    status, detail, layout = load_file(mat_path, args)
+    if layout is None:
+        return status, detail
+    return render_file(mat_path, out_dir, args, figsize, layout)
+
+
+def safe_process_file(mat_path: Path, out_dir: Path, args: argparse.Namespace,
+                      figsize: Tuple[float, float]) -> tuple[str, str]:
+    """process_file() that turns unexpected errors into a "failed" result."""
+    try:
+        return process_file(mat_path, out_dir, args, figsize)
+    except Exception as e:
+        logging.warning("Failed to process %s: %s", mat_path.name, e)
+        return "failed", str(e)
+
+
+class _RecordBuffer(logging.Handler):
+    """Collects log records in a worker so the parent can replay them in file order."""
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.records: List[logging.LogRecord] = []
+
+    def emit(self, record: logging.LogRecord) -> None:
+        # Pre-format so the record pickles cleanly back to the parent
+        record.msg = record.getMessage()
+        record.args = None
+        record.exc_info = None
+        self.records.append(record)
+
+
+def _process_file_worker(mat_path: Path, out_dir: Path, args: argparse.Namespace,
+                         figsize: Tuple[float, float]) -> tuple[str, str, List[logging.LogRecord], List[dict]]:
+    root = logging.getLogger()
+    old_handlers, old_level = root.handlers[:], root.level
+    buf = _RecordBuffer()
+    root.handlers = [buf]
+    root.setLevel(logging.INFO)
+    try:
+        status, detail = safe_process_file(mat_path, out_dir, args, figsize)
+    finally:
+        root.handlers = old_handlers
+        root.setLevel(old_level)
+    return status, detail, buf.records, PROFILER.take()
+
+
+# One unit of work: (mat_path, out_dir, folder options, figsize)
+WorkItem = Tuple[Path, Path, argparse.Namespace, Tuple[float, float]]
+
+
+def display_name(mat_path: Path) -> str:
+    """"lab2/run.mat": file names alone are ambiguous once several folders share a queue."""
+    return f"{mat_path.parent.name}/{mat_path.name}"
+
+
+def run_parallel(items: List[WorkItem], jobs: int) -> List[tuple[str, str]]:
+    """Process files on a pool of `jobs` processes; logs and results come back in input order."""
+    from concurrent.futures import ProcessPoolExecutor
+
+    root = logging.getLogger()
+    results: List[tuple[str, str]] = []
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        futures = [pool.submit(_process_file_worker, *item) for item in items]
+        for (mat_path, *_), fut in zip(items, futures):
+            try:
+                status, detail, records, profile = fut.result()
+            except Exception as e:  # worker died (e.g. out of memory)
+                status, detail, records, profile = "failed", f"worker error: {e}", [], []
+                logging.warning("Failed to process %s: %s", mat_path.name, e)
+            for rec in records:
+                root.handle(rec)
+            PROFILER.records.extend(profile)
+            results.append((status, detail))
+    return results
+
+
+class _ThreadCapture(logging.Filter):
+    """Holds back one thread's log records so they can be replayed in file order."""
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.ident: Optional[int] = None
+        self.records: List[logging.LogRecord] = []
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.thread != self.ident:
+            return True
+        self.records.append(record)
+        return False
+
+    def take(self) -> List[logging.LogRecord]:
+        records, self.records = self.records, []
+        return records
+
+
+def run_prefetched(items: List[WorkItem], depth: int) -> List[tuple[str, str]]:
+    """Render files in order while a reader thread loads up to `depth` files ahead.
+
+    The reader does the disk and decompression work (cache, window, load, detect,
+    crop); this thread only plots and saves. The bounded queue is the backpressure:
+    at most `depth` loaded files wait, plus the one being read and the one being drawn.
+    """
+    import queue
+
+    root = logging.getLogger()
+    capture = _ThreadCapture()
+    loaded: queue.Queue = queue.Queue(maxsize=depth)
+    stop = threading.Event()
+
+    def reader() -> None:
+        capture.ident = threading.get_ident()
+        for mat_path, _, args, _ in items:
+            if stop.is_set():
+                break
+            try:
+                status, detail, layout = load_file(mat_path, args)
+            except Exception as e:
+                logging.warning("Failed to process %s: %s", mat_path.name, e)
+                status, detail, layout = "failed", str(e), None
+            loaded.put((status, detail, layout, capture.take()))
+
+    root.addFilter(capture)
+    thread = threading.Thread(target=reader, name="plot-prefetch", daemon=True)
+    thread.start()
+    results: List[tuple[str, str]] = []
+    try:
+        for mat_path, out_dir, args, figsize in items:
+            status, detail, layout, records = loaded.get()
+            for rec in records:
+                root.callHandlers(rec)
+            if layout is not None:
+                PROFILER.file = mat_path
+                try:
+                    status, detail = render_file(mat_path, out_dir, args, figsize, layout)
+                except Exception as e:
+                    logging.warning("Failed to process %s: %s", mat_path.name, e)
+                    status, detail = "failed", str(e)
+            results.append((status, detail))
+    finally:
+        stop.set()
+        while thread.is_alive():  # unblock a reader waiting on a full queue
+            try:
+                loaded.get(timeout=0.1)
+            except queue.Empty:
+                pass
+        root.removeFilter(capture)
+    return results
+
+
+def log_summary(items: List[WorkItem], results: List[tuple[str, str]]) -> None:
+    out_dirs = sorted({out_dir for _, out_dir, _, _ in items})
+    name = (lambda p: p.name) if len(out_dirs) == 1 else display_name
+    width = max(len(name(p)) for p, *_ in items)
+    logging.info("Summary:")
+    for (mat_path, *_), (status, detail) in zip(items, results):
+        logging.info("  %-*s  %-9s  %s", width, name(mat_path), status, detail)
+    counts = {s: sum(1 for r in results if r[0] == s) for s in ("saved", "unchanged", "skipped", "failed")}
+    logging.info("Done. Saved %d, unchanged %d, skipped %d, failed %d file(s) to %s",
+                 counts["saved"], counts["unchanged"], counts["skipped"], counts["failed"],
+                 ", ".join(str(d) for d in out_dirs))
+
+
+def run_batch(items: List[WorkItem]) -> List[tuple[str, str]]:
+    """Render every file whose input or options changed since the last run (all with --force).
+
+    Files from all folders share one queue, so a single worker pool (or prefetch
+    thread) serves every lab; each output folder keeps its own manifest.
+    """
+    manifests = {out_dir: load_manifest(out_dir) for _, out_dir, _, _ in items}
+    digests = {}
+    results = {}
+    todo: List[WorkItem] = []
+    for item in items:
+        mat_path, out_dir, args, figsize = item
+        digest = source_digest(args.cache_dir, mat_path) if args.cache_dir is not None else file_digest(mat_path)
+        digests[mat_path] = digest
+        rec = manifests[out_dir].get(mat_path.name)
+        if (not args.force and rec is not None and rec.get("digest") == digest
+                and rec.get("options") == render_options(args, figsize) and (out_dir / rec["output"]).exists()):
+            logging.info("Up to date: %s", rec["output"])
+            results[mat_path] = ("unchanged", rec["output"])
+        else:
+            todo.append(item)
+
+    if todo:
+        args = todo[0][2]  # --jobs/--prefetch are global options
+        jobs = args.jobs if args.jobs > 0 else (os.cpu_count() or 1)
+        jobs = min(jobs, len(todo))
+        if jobs > 1:
+            done = run_parallel(todo, jobs)
+        elif args.prefetch > 0 and len(todo) > 1:
+            done = run_prefetched(todo, args.prefetch)
+        else:
+            done = [safe_process_file(*item) for item in todo]
+        for (mat_path, out_dir, args, figsize), (status, detail) in zip(todo, done):
+            results[mat_path] = (status, detail)
+            if status == "saved":
+                manifests[out_dir][mat_path.name] = {"digest": digests[mat_path],
+                                                     "options": render_options(args, figsize), "output": detail}
+            else:
+                manifests[out_dir].pop(mat_path.name, None)
+        for out_dir in {out_dir for _, out_dir, _, _ in todo}:
+            save_manifest(out_dir, manifests[out_dir])
+
+    ordered = [results[p] for p, *_ in items]
+    log_summary(items, ordered)
+    return ordered
+
+
+# inotify(7) event bits
+_IN_MODIFY, _IN_CLOSE_WRITE, _IN_MOVED_TO, _IN_CREATE = 0x2, 0x8, 0x80, 0x100
+_IN_EVENT = struct.Struct("iIII")
+
+
+def _inotify_open(directories: List[Path]) -> Optional[tuple[int, dict]]:
+    """Non-blocking inotify fd watching every directory plus its {wd: directory} map, or None
+    where inotify is unavailable."""
+    if not sys.platform.startswith("linux"):
+        return None
+    try:
+        import ctypes
+        import ctypes.util
+
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if fd < 0:
+            return None
+        mask = _IN_MODIFY | _IN_CLOSE_WRITE | _IN_MOVED_TO | _IN_CREATE
+        watches = {}
+        for directory in directories:
+            wd = libc.inotify_add_watch(fd, os.fsencode(str(directory)), mask)
+            if wd < 0:
+                os.close(fd)
+                return None
+            watches[wd] = directory
+        return fd, watches
+    except (OSError, AttributeError):
+        return None
+
+
+def _stat_sig(path: Path) -> Optional[Tuple[int, int]]:
+    try:
+        st = path.stat()
+    except OSError:
+        return None
+    return st.st_size, st.st_mtime_ns
+
+
+class DirWatcher:
+    """Reports .mat files in a set of directories once they are completely written.
+
+    With inotify a file is ready as soon as the writer closes it (or renames it
+    into place); otherwise the directories are polled and a file is ready once its
+    size and mtime have not changed for `settle` seconds.
+    """
+
+    def __init__(self, directories: List[Path], settle: float, poll_interval: float = 1.0):
+        self.directories = directories
+        self.settle = settle
+        self.poll_interval = poll_interval
+        opened = _inotify_open(directories)
+        self.fd, self.watches = opened if opened is not None else (None, {})
+        self.mode = "inotify" if self.fd is not None else f"polling every {poll_interval:g} s"
+        # Files already present were handled by the initial batch
+        self.known = {p: _stat_sig(p) for d in directories for p in d.glob("*.mat")}
+        self.pending: dict = {}  # path -> (signature, since, closed)
+
+    def _note(self, path: Path, closed: bool, now: float) -> None:
+        if path.name.lower().endswith(".mat"):
+            self.pending[path] = (_stat_sig(path), now, closed or self.pending.get(path, (None, 0, False))[2])
+
+    def _collect(self, timeout: Optional[float]) -> None:
+        if self.fd is None:
+            time.sleep(timeout)
+            now = time.monotonic()
+            for path in (p for d in self.directories for p in d.glob("*.mat")):
+                sig = _stat_sig(path)
+                if sig != self.known.get(path) and path not in self.pending:
+                    self.pending[path] = (sig, now, False)
+            return
+        import select
+
+        if not select.select([self.fd], [], [], timeout)[0]:
+            return
+        try:
+            buf = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return
+        now = time.monotonic()
+        pos = 0
+        while pos + _IN_EVENT.size <= len(buf):
+            wd, mask, _, length = _IN_EVENT.unpack_from(buf, pos)
+            name = buf[pos + _IN_EVENT.size:pos + _IN_EVENT.size + length].rstrip(b"\0")
+            pos += _IN_EVENT.size + length
+            if name and wd in self.watches:
+                self._note(self.watches[wd] / os.fsdecode(name), bool(mask & (_IN_CLOSE_WRITE | _IN_MOVED_TO)), now)
+
+    def wait(self) -> List[Path]:
+        """Block until at least one new or changed .mat is complete; return those files."""
+        while True:
+            if self.fd is None:
+                timeout = self.poll_interval
+            else:
+                timeout = min(self.settle, 0.5) if self.pending else None
+            self._collect(timeout)
+            now = time.monotonic()
+            ready = []
+            for path, (sig, since, closed) in list(self.pending.items()):
+                cur = _stat_sig(path)
+                if cur is None:
+                    del self.pending[path]  # deleted or renamed away
+                elif cur != sig:
+                    self.pending[path] = (cur, now, False)  # still being written
+                elif closed or now - since >= self.settle:
+                    del self.pending[path]
+                    if cur != self.known.get(path):
+                        self.known[path] = cur
+                        ready.append(path)
+            if ready:
+                return sorted(ready)
+
+
+def finish_batch(folders: dict, args: argparse.Namespace) -> None:
+    """After a batch: write --profile records and trim each folder's parsed-log cache."""
+    for directory, (out_dir, _, _) in folders.items():
+        records = PROFILER.take(directory) if args.profile else []
+        if records:
+            # Next to figs/, so folders processed from one working directory keep separate profiles
+            write_profile(out_dir.parent / "plot_profile.jsonl", records)
+    for _, fargs, _ in folders.values():
+        if fargs.cache_dir is not None and fargs.cache_dir.exists():
+            cache_evict(fargs.cache_dir, int(args.cache_size * 1024 * 1024))
+
+
+def watch(folders: dict, watcher: DirWatcher, args: argparse.Namespace) -> None:
+    """Re-render each .mat that appears or changes in the folders until Ctrl+C."""
+    logging.info("Watching %s for new or changed .mat files (%s; Ctrl+C to stop)",
+                 ", ".join(str(d) for d in folders), watcher.mode)
+    try:
+        while True:
+            ready = watcher.wait()
+            logging.info("Changed: %s", ", ".join(display_name(p) for p in ready))
+            run_batch([(p, *folders[p.parent]) for p in ready])
+            finish_batch(folders, args)
+    except KeyboardInterrupt:
+        logging.info("Stopped watching.")
+    finally:
+        if watcher.fd is not None:
+            os.close(watcher.fd)
+
+
+def parse_figsize(spec: Optional[str], default: List[float]) -> Tuple[float, float]:
+    if spec is not None:
+        try:
+            w, h = (float(x) for x in spec.split(","))
+            return w, h
+        except ValueError:
+            logging.warning("Ignoring --figsize %r (expected W,H)", spec)
+    return float(default[0]), float(default[1])
+
+
+def folder_args(args: argparse.Namespace, directory: Path) -> tuple[Path, argparse.Namespace, Tuple[float, float]]:
+    """(out_dir, options, figsize) for one folder: its profile, figs/ and .plotcache/ live in it."""
+    fargs = argparse.Namespace(**vars(args))
+    fargs.lab = load_profile(directory)
+    fargs.cache_dir = None if args.no_cache else directory / ".plotcache"
+    out_dir = directory / "figs"
+    out_dir.mkdir(parents=True, exist_ok=True)
+    return out_dir, fargs, parse_figsize(args.figsize, fargs.lab["figsize"])
+
+
+def resolve_dirs(specs: List[str]) -> List[Path]:
+    """Folders from the command line; patterns like lab* are expanded here (PowerShell does not)."""
+    dirs: List[Path] = []
+    for spec in specs or ["."]:
+        matches = sorted(Path(m) for m in glob.glob(spec)) if any(c in spec for c in "*?[") else [Path(spec)]
+        for d in matches:
+            d = d.resolve()
+            if d.is_dir() and d not in dirs:
+                dirs.append(d)
+            elif not d.is_dir():
+                logging.warning("Not a folder: %s", d)
+    return dirs
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Plot selected states from the .mat files in one or more lab folders.")
+    parser.add_argument("dirs", nargs="*",
+                        help="Folders with .mat logs; patterns like lab* are expanded (default: current folder)")
+    parser.add_argument("--states", default="all",
+                        help='Which states to plot: "all", names (e.g. "pitch,elevation"), or 1-based indices "3,5".')
+    parser.add_argument("--tmin", type=float, default=None,
+                        help="Min time (seconds) to include; To File and v7.3 logs then read only the "
+                             "--tmin/--tmax window")
+    parser.add_argument("--tmax", type=float, default=None, help="Max time (seconds) to include")
+    parser.add_argument("--figsize", default=None, help="Figure size W,H in inches (default from the folder's helilab.json)")
+    parser.add_argument("--dpi", type=int, default=150, help="PNG DPI (default 150)")
+    parser.add_argument("--ymax", type=float, default=None, help="Max y-value (upper axis limit)")
+    parser.add_argument("--ymin", type=float, default=None, help="Min y-value (lower axis limit)")
+    parser.add_argument("--yabs", type=float, default=None, help="Symmetric y-limits [-yabs, +yabs] (overrides --ymin/--ymax)")
+    parser.add_argument("--decimate", choices=DECIMATE_METHODS, default="none",
+                        help="Reduce each trace to ~2 points per pixel before drawing; pyramid reads them "
+                             "from an index cached with the run. Prefer minmax: it keeps every peak and is "
+                             "several times faster than lttb on long logs (default none)")
+    parser.add_argument("--force", action="store_true",
+                        help="Re-render every figure even if its input and options are unchanged")
+    parser.add_argument("--no-cache", action="store_true", help="Do not read or write the parsed-log cache")
+    parser.add_argument("--low-memory", action="store_true",
+                        help="Memory-map raw logs and plot states as float32 (time stays float64)")
+    parser.add_argument("--cache-size", type=float, default=1024,
+                        help="Parsed-log cache size limit in MB, source hash stamps included; least recently "
+                             "used entries are evicted (default 1024)")
+    parser.add_argument("--profile", action="store_true",
+                        help="Record per-stage wall time, RSS growth, process peak RSS and array sizes to "
+                             "<folder>/plot_profile.jsonl")
+    parser.add_argument("--jobs", type=int, default=1, help="Worker processes (default 1, 0 = one per CPU)")
+    parser.add_argument("--prefetch", type=int, default=2,
+                        help="With one process: files loaded ahead on a reader thread while rendering (default 2, 0 = off)")
+    parser.add_argument("--watch", action="store_true",
+                        help="After the first pass keep running and re-render .mat files as they are written")
+    parser.add_argument("--settle", type=float, default=2.0,
+                        help="--watch without inotify: seconds a file must stay unchanged before it is read (default 2)")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(levelname)s: %(message)s")
+
+    folders = {}  # directory -> (out_dir, folder options, figsize)
+    items: List[WorkItem] = []
+    for directory in resolve_dirs(args.dirs):
+        folders[directory] = folder_args(args, directory)
+        items += [(p, *folders[directory]) for p in sorted(directory.glob("*.mat"))]
+    if not folders:
+        return
+    # Start watching before the first pass so files landing during it are not missed
+    watcher = DirWatcher(list(folders), args.settle) if args.watch else None
+
+    if items:
+        run_batch(items)
+        finish_batch(folders, args)
+    elif not args.watch:
+        logging.warning("No .mat files found in %s", ", ".join(str(d) for d in folders))
+        return
+
+    if watcher is not None:
+        watch(folders, watcher, args)
+
+
+if __name__ == "__main__":
+    main()
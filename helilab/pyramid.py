@@ -0,0 +1,163 @@
+"""Min/max pyramid index of a run, for pixel-resolution traces of any time window.
+
+- Level 0 holds, per state, the sample index of the minimum and of the maximum of
+  every BASE-sample block; each higher level merges FACTOR blocks of the level
+  below. Only indices are kept, so the traces show real samples, as with
+  helilab.plot.decimate_minmax.
+- select() finds the window with a binary search on t. It picks the coarsest level
+  that still gives every pixel column at least one block and reduces only those
+  blocks, plus the partial blocks at the window edges. The work grows with the
+  pixel width, not with the window or the run length.
+- cached_pyramid() keeps the index as two memory-mappable .npy files inside the
+  run's parsed-log cache entry. It is built on first use and shares the entry's
+  lifetime and eviction.
+"""
+from __future__ import annotations
+
+from pathlib import Path
+import logging
+import os
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+BASE = 16             # samples per level-0 block
+FACTOR = 4            # blocks merged per level
+BUILD_CHUNK = 1 << 20  # samples reduced at a time while building level 0 (multiple of BASE)
+FILES = ("pyramid_min.npy", "pyramid_max.npy")
+
+
+def level_sizes(n: int) -> List[int]:
+    """Blocks per level for a run of n samples, finest first, down to a single block."""
+    sizes = [max(-(-n // BASE), 1)]
+    while sizes[-1] > 1:
+        sizes.append(-(-sizes[-1] // FACTOR))
+    return sizes
+
+
+def _reduce(values: np.ndarray, idx: np.ndarray, group: int, fill: float, pick) -> Tuple[np.ndarray, np.ndarray]:
+    """(values, idx) of the extreme of every `group` consecutive columns; the tail is padded with fill."""
+    ns, n = values.shape
+    m = -(-n // group)
+    if m * group != n:
+        values = np.concatenate([values, np.full((ns, m * group - n), fill, dtype=values.dtype)], axis=1)
+        idx = np.concatenate([idx, np.zeros((ns, m * group - n), dtype=idx.dtype)], axis=1)
+    values, idx = values.reshape(ns, m, group), idx.reshape(ns, m, group)
+    a = pick(values, axis=2)[:, :, None]
+    return np.take_along_axis(values, a, axis=2)[:, :, 0], np.take_along_axis(idx, a, axis=2)[:, :, 0]
+
+
+class MinMaxPyramid:
+    """Per-state min/max sample indices of every level, concatenated along the last axis."""
+
+    def __init__(self, imin: np.ndarray, imax: np.ndarray, n: int) -> None:
+        self.imin, self.imax, self.n = imin, imax, n
+        self.sizes = level_sizes(n)
+        self.offsets = np.concatenate([[0], np.cumsum(self.sizes)]).tolist()
+
+    @classmethod
+    def build(cls, Y: np.ndarray) -> "MinMaxPyramid":
+        """Index Y[ns, N]; one pass over the samples, BUILD_CHUNK at a time (Y may be memory-mapped)."""
+        ns, n = Y.shape
+        itype = np.int32 if n < 2**31 else np.int64
+        vmin, vmax, imin, imax = [], [], [], []
+        for c0 in range(0, n, BUILD_CHUNK):
+            seg = np.asarray(Y[:, c0:c0 + BUILD_CHUNK])
+            base = np.broadcast_to(np.arange(c0, c0 + seg.shape[1], dtype=itype), seg.shape)
+            for vals, idx, fill, pick in ((vmin, imin, np.inf, np.argmin), (vmax, imax, -np.inf, np.argmax)):
+                v, i = _reduce(seg, base, BASE, fill, pick)
+                vals.append(v)
+                idx.append(i)
+        levels_min = [(np.concatenate(vmin, axis=1), np.concatenate(imin, axis=1))]
+        levels_max = [(np.concatenate(vmax, axis=1), np.concatenate(imax, axis=1))]
+        for _ in level_sizes(n)[1:]:
+            levels_min.append(_reduce(*levels_min[-1], FACTOR, np.inf, np.argmin))
+            levels_max.append(_reduce(*levels_max[-1], FACTOR, -np.inf, np.argmax))
+        return cls(np.concatenate([i for _, i in levels_min], axis=1),
+                   np.concatenate([i for _, i in levels_max], axis=1), n)
+
+    def select(self, Y: np.ndarray, s: int, i0: int, i1: int, n_buckets: int) -> np.ndarray:
+        """Sorted sample indices of the min and max of state s in ~n_buckets buckets of [i0, i1).
+
+        The first and last sample of the window are always included.
+        """
+        n = i1 - i0
+        if n_buckets < 1 or n <= 2 * n_buckets + 2:
+            return np.arange(i0, i1)
+        level = int(np.floor(np.log(n / n_buckets / BASE) / np.log(FACTOR))) if n >= BASE * n_buckets else -1
+        level = min(level, len(self.sizes) - 1)
+        b = BASE * FACTOR**level if level >= 0 else 1
+        j0, j1 = -(-i0 // b), i1 // b
+        if level < 0 or j1 - j0 < 1:
+            return _raw_extremes(Y[s, i0:i1], i0, n_buckets)
+        off = self.offsets[level]
+        picks = [np.array([i0, i1 - 1])]
+        for index, fill, pick in ((self.imin, np.inf, np.argmin), (self.imax, -np.inf, np.argmax)):
+            cand = np.asarray(index[s, off + j0:off + j1])
+            vals = np.asarray(Y[s, cand], dtype=np.float64)
+            per = -(-cand.size // n_buckets)
+            picks.append(_reduce(vals[None], cand[None], per, fill, pick)[1][0])
+        for a, z in ((i0, j0 * b), (j1 * b, i1)):  # partial blocks at the edges, < b samples each
+            if z > a:
+                y = np.asarray(Y[s, a:z])
+                picks.append(np.array([a + y.argmin(), a + y.argmax()]))
+        return np.unique(np.concatenate(picks))
+
+    def window(self, t: np.ndarray, Y: np.ndarray, tmin: Optional[float], tmax: Optional[float]) -> "PyramidWindow":
+        """The samples with tmin <= t <= tmax, found by binary search like helilab.plot.crop_time."""
+        i0 = 0 if tmin is None else int(np.searchsorted(t, float(tmin), side="left"))
+        i1 = t.size if tmax is None else int(np.searchsorted(t, float(tmax), side="right"))
+        if i1 - i0 < 2:
+            i0, i1 = 0, t.size
+        return PyramidWindow(self, t, Y, i0, i1)
+
+
+class PyramidWindow:
+    """A sample window [i0, i1) of one run whose traces are served from its pyramid."""
+
+    def __init__(self, pyramid: MinMaxPyramid, t: np.ndarray, Y: np.ndarray, i0: int, i1: int) -> None:
+        self.pyramid, self.t, self.Y, self.i0, self.i1 = pyramid, t, Y, i0, i1
+
+    def trace(self, s: int, n_buckets: int) -> Tuple[np.ndarray, np.ndarray]:
+        """(t, y) of state s reduced to the min and max of ~n_buckets buckets."""
+        idx = self.pyramid.select(self.Y, s, self.i0, self.i1, n_buckets)
+        return self.t[idx], np.asarray(self.Y[s, idx])
+
+
+def _raw_extremes(y: np.ndarray, i0: int, n_buckets: int) -> np.ndarray:
+    """select() for windows too short for level 0: equal-count buckets of the samples themselves."""
+    n = y.size
+    k = -(-n // n_buckets)
+    idx = np.arange(i0, i0 + n)[None]
+    y = np.asarray(y, dtype=np.float64)[None]
+    lo = _reduce(y, idx, k, np.inf, np.argmin)[1][0]
+    hi = _reduce(y, idx, k, -np.inf, np.argmax)[1][0]
+    return np.unique(np.concatenate([[i0, i0 + n - 1], lo, hi]))
+
+
+def cached_pyramid(entry: Optional[Path], Y: np.ndarray) -> MinMaxPyramid:
+    """The pyramid stored in cache entry directory `entry`, built and stored on first use.
+
+    With entry None, or when the entry cannot be written, the pyramid lives in memory only.
+    """
+    ns, n = Y.shape
+    width = sum(level_sizes(n))
+    if entry is not None:
+        try:
+            imin, imax = (np.load(entry / name, mmap_mode="r") for name in FILES)
+            if imin.shape == imax.shape == (ns, width):
+                return MinMaxPyramid(imin, imax, n)
+        except (OSError, ValueError):
+            pass
+    pyramid = MinMaxPyramid.build(Y)
+    if entry is not None and entry.is_dir():
+        try:
+            for name, arr in zip(FILES, (pyramid.imin, pyramid.imax)):
+                tmp = entry / f".{name}.{os.getpid()}.tmp"
+                with open(tmp, "wb") as f:
+                    np.save(f, arr)
+                os.replace(tmp, entry / name)
+        except OSError as e:
+            # The cache is best effort, like cache_store()
+            logging.debug("Could not store pyramid in %s: %s", entry, e)
+    return pyramid
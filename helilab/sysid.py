@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+"""Least-squares estimates of the model gains K_1, K_2, K_3 from recorded runs.
+
+- The three rows of the model in init_heli_3_10.m, each a one-gain regression:
+    K_1   pitch_ddot     = K_1 * Vd
+    K_2   elevation_ddot = K_2 * Vs
+    K_3   lambda_ddot    = K_3 * pitch
+  with an extra constant per run and equation under --offsets (trim, the Vs_0
+  operating point). A gain is estimated from every run that logs its regressor
+  and the angle or its rate. Input channels are found by their profile label
+  (--vs / --vd). The lab logs so far hold states only, so they give K_3 and
+  K_1, K_2 need runs that also record the voltages.
+- Derivatives come from one Savitzky-Golay filter (--window seconds, cubic)
+  over all channels of a run at once: the rate channel's first derivative, or the
+  angle's second derivative where no rate is logged. The regressors get the same
+  smoothing so both sides see the same delay.
+- Per run, all equations are solved together from their sums of products. The
+  confidence intervals (--level) use Student's t with the sample count shrunk by
+  the residuals' lag-1 autocorrelation, since neighbouring 500 Hz samples are
+  far from independent.
+- Pooled estimates weight every run by the inverse variance of its own estimate,
+  so noisy IMU runs do not drown the clean encoder runs (each run keeps its own
+  offset under --offsets).
+- Writes one CSV row per run and gain plus the pooled rows (run "pooled").
+
+Examples (PowerShell):
+  helilab-sysid lab1 lab2 lab3                        # -> sysid.csv
+  helilab-sysid lab* --offsets --window 0.1 --level 0.99 --out gains.csv
+"""
+from __future__ import annotations
+
+from pathlib import Path
+import argparse
+import csv
+import logging
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from helilab import model
+from helilab.plot import load_profile, load_run, resolve_dirs
+
+GAINS = ("K_1", "K_2", "K_3")
+NOMINAL = {"K_1": model.K_1, "K_2": model.K_2, "K_3": model.K_3}
+COLUMNS = ("lab", "run", "gain", "estimate", "ci_low", "ci_high", "offset", "r2",
+           "samples", "effective_samples", "nominal")
+
+
+def equations(labels: List[str], vs: str, vd: str) -> List[Tuple[str, int, int, int]]:
+    """[(gain, regressor row, measured row, derivative order)] the labels of a run support.
+
+    The measured channel is the angle's rate (differentiated once) or else the angle (twice).
+    """
+    rows = {lbl.lower(): i for i, lbl in enumerate(labels)}
+    found = []
+    for gain, regressor, angle in zip(GAINS, (vd, vs, "pitch"), ("pitch", "elevation", "lambda")):
+        if regressor.lower() not in rows:
+            continue
+        if f"{angle}_dot" in rows:
+            found.append((gain, rows[regressor.lower()], rows[f"{angle}_dot"], 1))
+        elif angle in rows:
+            found.append((gain, rows[regressor.lower()], rows[angle], 2))
+    return found
+
+
+def regressions(Y: np.ndarray, eqs: List[tuple], dt: float, window: int) -> Tuple[np.ndarray, np.ndarray]:
+    """(X[eqs, N], Z[eqs, N]): smoothed regressors and accelerations for each equation."""
+    from scipy.signal import savgol_filter
+
+    smooth = savgol_filter(Y, window, 3, axis=1)
+    d1 = savgol_filter(Y, window, 3, deriv=1, delta=dt, axis=1)
+    d2 = savgol_filter(Y, window, 3, deriv=2, delta=dt, axis=1)
+    X = smooth[[reg for _, reg, _, _ in eqs]]
+    Z = np.stack([(d1 if order == 1 else d2)[meas] for _, _, meas, order in eqs])
+    half = window // 2  # drop the edges the filter extrapolates
+    return X[:, half:-half], Z[:, half:-half]
+
+
+def fit(X: np.ndarray, Z: np.ndarray, offsets: bool) -> Dict[str, np.ndarray]:
+    """Z = k X (+ c) per row, all rows at once; also the sums the pooled fit needs."""
+    n = X.shape[1]
+    xm = X.mean(axis=1) if offsets else np.zeros(len(X))
+    zm = Z.mean(axis=1) if offsets else np.zeros(len(Z))
+    Xc, Zc = X - xm[:, None], Z - zm[:, None]
+    sxx, sxy, szz = (Xc * Xc).sum(axis=1), (Xc * Zc).sum(axis=1), (Zc * Zc).sum(axis=1)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        k = sxy / sxx
+        e = Zc - k[:, None] * Xc
+        rho = (e[:, 1:] * e[:, :-1]).sum(axis=1) / (e * e).sum(axis=1)
+    rho = np.clip(np.nan_to_num(rho), 0.0, 0.999)
+    p = 2 if offsets else 1
+    n_eff = np.clip(n * (1 - rho) / (1 + rho), p + 1, n)
+    zvar = ((Z - Z.mean(axis=1)[:, None]) ** 2).sum(axis=1)
+    return {"k": k, "c": zm - k * xm if offsets else np.full(len(X), np.nan), "n": np.full(len(X), n),
+            "n_eff": n_eff, "sxx": sxx, "sxy": sxy, "szz": szz, "zvar": zvar, "p": p}
+
+
+def standard_errors(rss: np.ndarray, sxx: np.ndarray, n: np.ndarray, n_eff: np.ndarray, p: int) -> np.ndarray:
+    """Standard error of k, with the variance inflated by n / n_eff."""
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.sqrt(rss / (n - p) / sxx * (n / n_eff))
+
+
+def intervals(k: np.ndarray, se: np.ndarray, dof: np.ndarray, level: float) -> Tuple[np.ndarray, np.ndarray]:
+    """(low, high) Student-t interval of k."""
+    from scipy.stats import t as student_t
+
+    half = student_t.ppf(0.5 + level / 2, np.maximum(dof, 1)) * se
+    return k - half, k + half
+
+
+def _fmt(v) -> str:
+    return "" if isinstance(v, float) and not np.isfinite(v) else f"{v:.6g}" if isinstance(v, float) else str(v)
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Least-squares estimates of K_1, K_2, K_3 from recorded runs.")
+    parser.add_argument("dirs", nargs="*",
+                        help="Folders with .mat logs; patterns like lab* are expanded (default: current folder)")
+    parser.add_argument("--vs", default="Vs", help="Profile label of the collective voltage channel (default Vs)")
+    parser.add_argument("--vd", default="Vd", help="Profile label of the differential voltage channel (default Vd)")
+    parser.add_argument("--offsets", action="store_true", help="Fit a constant per run and equation as well")
+    parser.add_argument("--window", type=float, default=0.05,
+                        help="Savitzky-Golay window for the derivatives, in seconds (default 0.05)")
+    parser.add_argument("--level", type=float, default=0.95, help="Confidence level of the intervals (default 0.95)")
+    parser.add_argument("--no-cache", action="store_true", help="Do not read or write the parsed-log cache")
+    parser.add_argument("--out", type=Path, default=Path("sysid.csv"), help="CSV output (default sysid.csv)")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(levelname)s: %(message)s")
+    rows: List[list] = []
+    pooled: Dict[str, List[tuple]] = {g: [] for g in GAINS}  # (k, se, n, n_eff, rss, zvar) per run
+    for folder in resolve_dirs(args.dirs):
+        ans_labels = load_profile(folder)["labels"]
+        cache_dir = None if args.no_cache else folder / ".plotcache"
+        for mat_path in sorted(folder.glob("*.mat")):
+            try:
+                t, Y, labels = load_run(mat_path, ans_labels, cache_dir)
+            except Exception as e:
+                logging.warning("Failed to load %s: %s", mat_path.name, e)
+                continue
+            if t is None:
+                logging.info("Skipping %s (no state layout found).", mat_path.name)
+                continue
+            eqs = equations(labels, args.vs, args.vd)
+            dt = float(np.median(np.diff(t)))
+            window = max(5, int(round(args.window / dt)) | 1)
+            if not eqs or t.size < 4 * window:
+                logging.info("Skipping %s (no identifiable gain in %s)", mat_path.name, ", ".join(labels))
+                continue
+            X, Z = regressions(np.asarray(Y, dtype=np.float64), eqs, dt, window)
+            f = fit(X, Z, args.offsets)
+            rss = f["szz"] - f["k"] * f["sxy"]
+            se = standard_errors(rss, f["sxx"], f["n"], f["n_eff"], f["p"])
+            low, high = intervals(f["k"], se, f["n_eff"] - f["p"], args.level)
+            for j, (gain, *_) in enumerate(eqs):
+                r2 = 1.0 - rss[j] / f["zvar"][j] if f["zvar"][j] > 0 else float("nan")
+                rows.append([folder.name, mat_path.stem, gain, f["k"][j], low[j], high[j], f["c"][j], r2,
+                             int(f["n"][j]), f["n_eff"][j], NOMINAL[gain]])
+                if np.isfinite(se[j]) and se[j] > 0:
+                    pooled[gain].append((f["k"][j], se[j], f["n"][j], f["n_eff"][j], rss[j], f["zvar"][j]))
+            logging.info("%s/%s: %s", folder.name, mat_path.stem,
+                         ", ".join(f"{g} {f['k'][j]:.4g}" for j, (g, *_) in enumerate(eqs)))
+    if not rows:
+        raise SystemExit("No run logs the channels of any gain.")
+
+    p = 2 if args.offsets else 1
+    for gain, runs in pooled.items():
+        if not runs:
+            logging.info("%s: no run logs its channels (nominal %.4g)", gain, NOMINAL[gain])
+            continue
+        k_r, se_r, n_r, n_eff_r, rss_r, zvar_r = np.array(runs).T
+        w = 1.0 / se_r**2
+        k = float((w * k_r).sum() / w.sum())
+        se = float(1.0 / np.sqrt(w.sum()))
+        low, high = intervals(np.array(k), np.array(se), np.array(n_eff_r.sum() - (p - 1) * len(runs) - 1), args.level)
+        rv = rss_r / (n_r - p)  # each run's residual variance weighs its sums
+        rows.append(["all", "pooled", gain, k, float(low), float(high), float("nan"),
+                     1.0 - (rss_r / rv).sum() / (zvar_r / rv).sum(), int(n_r.sum()), n_eff_r.sum(), NOMINAL[gain]])
+        logging.info("%s pooled over %d run(s): %.4g  [%.4g, %.4g] (%g %%)  nominal %.4g",
+                     gain, len(runs), k, float(low), float(high), 100 * args.level, NOMINAL[gain])
+
+    with open(args.out, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(COLUMNS)
+        for row in rows:
+            writer.writerow([_fmt(float(v)) if isinstance(v, (float, np.floating)) else v for v in row])
+    logging.info("Done. Wrote %s", args.out)
+
+
+if __name__ == "__main__":
+    main()
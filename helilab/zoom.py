@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""Interactive pan and zoom through one long log, served from its min/max pyramid.
+
+- Loads the run through the folder's parsed-log cache like the other commands and
+  builds its min/max pyramid (helilab.pyramid) on first use, next to the cached layout.
+- Every change of the visible time range redraws each state from the pyramid level
+  that matches the axes' pixel width, so zooming into a one-hour log costs about
+  as much as viewing ten seconds of it, and every peak stays visible.
+- Without a display, or with --snapshot, the [--tmin, --tmax] window is drawn the
+  same way and written to a PNG.
+
+Examples (PowerShell):
+  helilab-zoom "lab2\\Test1_i.mat"
+  helilab-zoom "lab3\\IMU_test_1.mat" --states pitch,elevation --tmin 10 --tmax 20
+  helilab-zoom "lab2\\Test1_i.mat" --tmin 100 --tmax 160 --snapshot zoom.png
+"""
+from __future__ import annotations
+
+from pathlib import Path
+import argparse
+import logging
+import os
+import sys
+from typing import List, Optional
+
+import numpy as np
+
+from helilab.plot import load_profile, load_run, parse_figsize, pick_state_indices, source_digest
+from helilab.pyramid import MinMaxPyramid, cached_pyramid
+
+
+class ZoomView:
+    """One axes whose lines are re-served from the pyramid whenever its x-limits change."""
+
+    def __init__(self, ax, t: np.ndarray, Y: np.ndarray, pyramid: MinMaxPyramid, indices: List[int],
+                 labels: List[str]) -> None:
+        self.ax, self.t, self.Y, self.pyramid, self.indices = ax, t, Y, pyramid, indices
+        self.lines = [ax.plot([], [], linewidth=1.6, label=labels[i])[0] for i in indices]
+        ax.callbacks.connect("xlim_changed", self.redraw)
+
+    def redraw(self, ax=None) -> None:
+        x0, x1 = self.ax.get_xlim()
+        # One sample beyond each edge so the traces run to the border of the axes
+        i0 = max(int(np.searchsorted(self.t, x0, side="left")) - 1, 0)
+        i1 = min(int(np.searchsorted(self.t, x1, side="right")) + 1, self.t.size)
+        width_px = max(int(self.ax.get_window_extent().width), 1)
+        window = self.pyramid.window(self.t, self.Y, self.t[i0], self.t[i1 - 1])
+        for line, i in zip(self.lines, self.indices):
+            line.set_data(*window.trace(i, width_px))
+        self.ax.figure.canvas.draw_idle()
+
+
+def have_display() -> bool:
+    """False on Linux without DISPLAY/WAYLAND_DISPLAY, where an interactive window cannot open."""
+    if sys.platform.startswith("linux"):
+        return bool(os.environ.get("DISPLAY") or os.environ.get("WAYLAND_DISPLAY"))
+    return True
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Interactive pan and zoom through one long log.")
+    parser.add_argument("mat", type=Path, help="The .mat log; its folder's helilab.json gives the state labels")
+    parser.add_argument("--states", default="all", help="Comma-separated names or 1-based indices (default all)")
+    parser.add_argument("--tmin", type=float, default=None, help="Start of the initial view in seconds")
+    parser.add_argument("--tmax", type=float, default=None, help="End of the initial view in seconds")
+    parser.add_argument("--figsize", default=None, help="Figure size W,H in inches (default from the folder's helilab.json)")
+    parser.add_argument("--dpi", type=int, default=100, help="Figure DPI (default 100)")
+    parser.add_argument("--no-cache", action="store_true", help="Do not read or write the parsed-log cache or pyramid")
+    parser.add_argument("--snapshot", type=Path, default=None, help="Write the initial view to this PNG instead of opening a window")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(levelname)s: %(message)s")
+    mat_path = args.mat.resolve()
+    profile = load_profile(mat_path.parent)
+    cache_dir = None if args.no_cache else mat_path.parent / ".plotcache"
+    t, Y, labels = load_run(mat_path, profile["labels"], cache_dir)
+    if t is None:
+        raise SystemExit(f"No state layout found in {mat_path.name}")
+    entry = None if cache_dir is None else cache_dir / source_digest(cache_dir, mat_path)
+    pyramid = cached_pyramid(entry, Y)
+    logging.info("%s: %d samples, %d pyramid levels", mat_path.name, t.size, len(pyramid.sizes))
+
+    snapshot = args.snapshot
+    if snapshot is None and not have_display():
+        snapshot = Path(f"{mat_path.stem}__zoom.png")
+        logging.info("No display; writing %s instead", snapshot)
+    import matplotlib
+    if snapshot is not None:
+        matplotlib.use("Agg", force=True)
+    import matplotlib.pyplot as plt
+
+    fig, ax = plt.subplots(figsize=parse_figsize(args.figsize, profile["figsize"]), dpi=args.dpi)
+    ax.set_xlabel("time [s]", fontsize=profile["fontsize"])
+    ax.set_ylabel(profile["ylabel"], fontsize=profile["fontsize"])
+    ax.set_title(profile.get("title") or mat_path.name)
+    ax.grid(True, linestyle="--", alpha=0.6)
+    # Matplotlib keeps only a weak reference to the callback, so the view must stay referenced here
+    view = ZoomView(ax, t, Y, pyramid, pick_state_indices(args.states, labels), labels)
+    ax.legend(loc="upper left", fontsize=profile["fontsize"])
+    fig.tight_layout()
+    ax.set_xlim(t[0] if args.tmin is None else args.tmin, t[-1] if args.tmax is None else args.tmax)
+    view.redraw()
+    # The y-range of the whole initial window; zooming keeps it until the toolbar rescales
+    ax.relim()
+    ax.autoscale_view(scalex=False)
+    if snapshot is not None:
+        fig.savefig(snapshot)
+        logging.info("Done. Wrote %s", snapshot)
+        return
+    plt.show()
+
+
+if __name__ == "__main__":
+    main()
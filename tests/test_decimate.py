@@ -0,0 +1,40 @@
+"""Point budgets and peak preservation of the --decimate methods."""
+from __future__ import annotations
+
+import numpy as np
+import pytest
+
+from helilab.plot import decimate_lttb, decimate_minmax
+
+DT = 0.002
+
+
+def step_response(n: int) -> tuple[np.ndarray, np.ndarray]:
+    """(t, y) of a damped step response with measurement noise and one spike."""
+    t = np.arange(n) * DT
+    y = 1 - np.exp(-0.5 * t) * np.cos(3 * t) + 0.01 * np.random.default_rng(n).standard_normal(n)
+    y[n // 3] += 2.0
+    return t, y
+
+
+@pytest.mark.parametrize("n, n_out", [(12, 10), (1000, 37), (1002, 102), (300_000, 2400)])
+def test_lttb_budget_and_order(n, n_out):
+    t, y = step_response(n)
+    t_, y_ = decimate_lttb(t, y, n_out)
+    assert t_.size <= n_out
+    assert t_[0] == t[0] and t_[-1] == t[-1]
+    assert np.all(np.diff(t_) > 0)  # one pick per bucket, buckets in order
+    idx = np.round(t_ / DT).astype(int)
+    np.testing.assert_array_equal(y_, y[idx])
+
+
+@pytest.mark.parametrize("decimate", [decimate_lttb, decimate_minmax])
+def test_peaks_survive(decimate):
+    t, y = step_response(300_000)
+    _, y_ = decimate(t, y, 2400)
+    assert y_.max() == y.max()
+
+
+def test_lttb_short_trace_unchanged():
+    t = np.arange(5.0)
+    assert decimate_lttb(t, t, 10)[0] is t
@@ -0,0 +1,41 @@
+"""The blocked fixed-gain filter against the plain per-sample recursion."""
+from __future__ import annotations
+
+import numpy as np
+import pytest
+
+pytest.importorskip("scipy")
+
+from helilab import kalman, model  # noqa: E402
+
+STATES = ["pitch", "pitch_dot", "elevation", "elevation_dot", "lambda_dot"]
+
+
+def recursion(Ad, Bu, C, Y, K, Sinv, x0):
+    """filter_ss one sample at a time."""
+    x = np.tile(x0, (K.shape[0], 1))
+    sq, nis = 0.0, 0.0
+    for k in range(Y.shape[0]):
+        if k:
+            x = x @ Ad.T + Bu[k - 1]
+        e = Y[k] - x @ C.T
+        sq = sq + e * e
+        nis = nis + np.einsum("cm,cmj,cj->c", e, Sinv, e)
+        x = x + np.einsum("cnm,cm->cn", K, e)
+    return np.sqrt(sq / Y.shape[0]), nis / Y.shape[0]
+
+
+@pytest.mark.parametrize("n_samples, floats", [(7, 1 << 21), (1001, 1 << 21), (1001, 600), (2500, 90)])
+def test_filter_ss_matches_recursion(n_samples, floats, monkeypatch):
+    monkeypatch.setattr(kalman, "SS_BLOCK_FLOATS", floats)  # several segments, partial last block
+    rng = np.random.default_rng(n_samples)
+    Ad, Bd = kalman.discrete_model(STATES, model.parse_gains(None))
+    C = np.eye(len(STATES))
+    Qd = np.geomspace(1e-6, 1e2, 4)[:, None, None] * np.eye(len(STATES))
+    K, Sinv, solved = kalman.steady_gains(Ad, C, Qd, np.eye(len(STATES)) * 1e-3)
+    assert solved.all()
+    Y = np.cumsum(rng.standard_normal((n_samples, len(STATES))), axis=0) * 0.01
+    Bu = rng.standard_normal((n_samples, 2)) @ Bd.T
+    x0 = C.T @ Y[0]
+    for got, want in zip(kalman.filter_ss(Ad, Bu, C, Y, K, Sinv, x0), recursion(Ad, Bu, C, Y, K, Sinv, x0)):
+        np.testing.assert_allclose(got, want, rtol=1e-10)
@@ -0,0 +1,139 @@
+"""MATLAB v7.3 (HDF5) logs through the same probe and layout detection as v4/v5.
+
+The fixtures are written with h5py the way MATLAB stores them: every variable
+transposed, chunked and gzip-compressed, behind a 512-byte MAT header with
+version 0x0200.
+"""
+from __future__ import annotations
+
+from pathlib import Path
+import struct
+
+import numpy as np
+import pytest
+
+h5py = pytest.importorskip("h5py")
+
+from helilab.plot import DEFAULT_PROFILE, detect_layout, is_mat_v73, load_candidates, read_ans_window  # noqa: E402
+
+N = 5000
+DT = 0.002
+LABELS = DEFAULT_PROFILE["labels"]
+
+
+def write_v73(path: Path, variables: dict) -> Path:
+    """Write {name: array in MATLAB orientation} as a v7.3 file; vectors are stored as (N, 1)."""
+    with h5py.File(path, "w", userblock_size=512) as h5:
+        for name, arr in variables.items():
+            arr = np.atleast_2d(arr).T if arr.ndim == 1 else arr
+            data = np.ascontiguousarray(arr.T)  # HDF5 holds the transpose of the MATLAB matrix
+            chunks = tuple(min(n, 1024) for n in data.shape)
+            ds = h5.create_dataset(name, data=data, chunks=chunks, compression="gzip")
+            ds.attrs["MATLAB_class"] = np.bytes_("double")
+    head = b"MATLAB 7.3 MAT-file, Platform: test, Created by test_mat_v73.py HDF5 schema 1.00 .".ljust(116)
+    head += b"\0" * 8 + struct.pack("<H", 0x0200) + b"IM"
+    with open(path, "r+b") as f:
+        f.write(head.ljust(512, b"\0"))
+    return path
+
+
+def states(n: int = N) -> tuple[np.ndarray, np.ndarray]:
+    """(t, Y[6, n]) of a smooth synthetic run."""
+    t = np.arange(n) * DT
+    Y = np.stack([np.sin((k + 1) * t) + 0.1 * k for k in range(6)])
+    return t, Y
+
+
+@pytest.fixture
+def ans_rows(tmp_path):
+    t, Y = states()
+    return write_v73(tmp_path / "ans_rows.mat", {"ans": np.vstack([t, Y])}), t, Y
+
+
+@pytest.fixture
+def ans_cols(tmp_path):
+    t, Y = states()
+    return write_v73(tmp_path / "ans_cols.mat", {"ans": np.vstack([t, Y]).T}), t, Y
+
+
+@pytest.mark.parametrize("fixture, shape", [("ans_rows", (7, N)), ("ans_cols", (N, 7))])
+def test_ans_layout(fixture, shape, request):
+    path, t, Y = request.getfixturevalue(fixture)
+    assert is_mat_v73(path)
+    data = load_candidates(path)
+    assert list(data) == ["ans"]
+    assert data["ans"].shape == shape
+    t_, Y_, labels, suffix = detect_layout(data, path.name, LABELS)
+    np.testing.assert_array_equal(t_, t)
+    np.testing.assert_array_equal(Y_, Y)
+    assert labels == LABELS and suffix == "states"
+
+
+def test_time_vector_and_matrix(tmp_path):
+    t, Y = states()
+    path = write_v73(tmp_path / "t_X.mat", {"t": t, "X": Y.T, "K": np.ones((2, 5))})
+    data = load_candidates(path)
+    assert sorted(data) == ["X", "t"]  # the probe leaves out K
+    t_, Y_, labels, suffix = detect_layout(data, path.name, LABELS)
+    np.testing.assert_array_equal(t_, t)
+    np.testing.assert_array_equal(Y_, Y)
+    assert labels == LABELS and suffix == "X"
+
+
+def test_no_state_matrix(tmp_path):
+    path = write_v73(tmp_path / "gains.mat", {"K": np.ones((2, 5)), "t": np.arange(10.0)})
+    assert is_mat_v73(path)
+    assert load_candidates(path) is None
+
+
+@pytest.mark.parametrize("fixture", ["ans_rows", "ans_cols"])
+@pytest.mark.parametrize("tmin, tmax", [(1.0, 2.5), (1.0005, 2.4995), (None, 3.0), (7.0, None)])
+def test_window_matches_full_load(fixture, tmin, tmax, request):
+    path, t, _ = request.getfixturevalue(fixture)
+    full = load_candidates(path)["ans"]
+    keep = np.ones(t.size, dtype=bool)
+    if tmin is not None:
+        keep &= t >= tmin
+    if tmax is not None:
+        keep &= t <= tmax
+    expected = full[:, keep] if full.shape[0] == 7 else full[keep, :]
+    window = read_ans_window(path, tmin, tmax)
+    np.testing.assert_array_equal(window, expected)
+
+
+def test_window_outside_run(ans_rows):
+    path, t, _ = ans_rows
+    assert read_ans_window(path, t[-1] + 1.0, None) is None
+
+
+def _peak_bytes(fn):
+    import tracemalloc
+    tracemalloc.start()
+    try:
+        fn()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+@pytest.mark.parametrize("layout", ["rows", "cols"])
+def test_whole_run_memory_is_flat(layout, tmp_path):
+    """A whole-run read spills to a mapped file, so the peak does not grow with the log."""
+    peaks = []
+    for n in (50_000, 400_000):
+        t, Y = states(n)
+        ans = np.vstack([t, Y]) if layout == "rows" else np.vstack([t, Y]).T
+        path = write_v73(tmp_path / f"ans_{layout}_{n}.mat", {"ans": ans})
+        del t, Y, ans
+        peaks.append(_peak_bytes(lambda: load_candidates(path, spill_dir=tmp_path)))
+    assert peaks[1] < peaks[0] + (1 << 20)
+    assert peaks[1] < 7 * 400_000 * 8 / 10
+
+
+def test_spilled_run_matches(ans_cols, tmp_path):
+    path, t, Y = ans_cols
+    data = load_candidates(path, spill_dir=tmp_path)
+    assert isinstance(data["ans"].base, np.memmap)
+    t_, Y_, _, _ = detect_layout(data, path.name, LABELS)
+    np.testing.assert_array_equal(t_, t)
+    np.testing.assert_array_equal(Y_, Y)